@@ -0,0 +1,173 @@
+"""Summaries of an attribute over a set of pages, whatever the units of its values.
+
+For example, the total mass of the planets:
+
+>>> kb = KB({'planet': {},
+...          'Earth': {'isa': ['planet'], 'mass': [parse.unit_perhaps('1 earth_mass')]},
+...          'Mars': {'isa': ['planet'], 'mass': [parse.unit_perhaps('6.4E23 kg')]},
+...          'Pluto': {'isa': ['planet'], 'mass': ['unknown']}})
+>>> mass = collect(kb, instances(kb, 'planet'), 'mass', 'earth_mass')
+>>> round(mass.sum().magnitude, 3)
+1.107
+>>> mass.rejected
+[Rejected(page='Pluto', value='unknown', reason='not a number')]
+
+The values are converted to one unit, into a NumPy array: that's one
+conversion for each unit in use, instead of Pint arithmetic on each value.
+Plain numbers (and text that is one, like '12') are dimensionless. Values
+that can't be converted are left out, and listed in rejected.
+"""
+
+import numpy
+import graph
+import parse
+from collections import namedtuple
+from kb import KB
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# A value we left out, and why.
+Rejected = namedtuple('Rejected', ['page', 'value', 'reason'])
+
+
+def instances(kb, category, edge='isa'):
+  # type: (KB, str, str) -> FrozenSet[str]
+  """The pages that are a category, directly or not.
+
+  If earth isa planet and planet isa body, earth is an instance of body.
+  (In graph.py's terms, these are the category's ancestors along isa.)
+  """
+  return graph.ancestors(kb, edge, category)
+
+
+def collect(kb, pages, attribute, unit=None):
+  # type: (KB, Iterable[str], str, Any) -> Column
+  """The values of attribute on pages, as a Column in unit.
+
+  unit is a unit name like 'kg' (or a Pint Unit). By default, it's the
+  unit of the first quantity (in page order), or none if there are only
+  plain numbers. A page counts once for each of its values.
+  """
+  # unit (None for plain numbers) -> (magnitudes, pages, values), in the order we met them
+  by_unit = {}  # type: Dict[Any, Tuple[List[float], List[str], List[Any]]]
+  order = []  # type: List[Any]
+  rejected = []  # type: List[Rejected]
+  for page in sorted(set(kb.normalize_page(p) for p in pages)):
+    for x in (kb.get(page) or {}).get(attribute, ()):
+      found = _unit_and_magnitude(x)
+      if found is None:
+        rejected.append(Rejected(page, x, 'not a number'))
+        continue
+      if found[0] not in by_unit:
+        by_unit[found[0]] = ([], [], [])
+        order.append(found[0])
+      magnitudes, where, values = by_unit[found[0]]
+      magnitudes.append(found[1])
+      where.append(page)
+      values.append(x)
+  if unit is None:
+    unit = next((u for u in order if u is not None), None)
+  elif isinstance(unit, basestring):
+    unit = parse.units.parse_units(unit)
+  arrays = []  # type: List[Any]
+  in_order = []  # type: List[str]
+  for u in order:
+    magnitudes, where, values = by_unit[u]
+    converted = _convert(numpy.array(magnitudes, dtype=float), u, unit)
+    if converted is None:
+      reason = "can't convert to %s" % (unit if unit is not None else 'a plain number')
+      rejected.extend(Rejected(p, x, reason) for p, x in zip(where, values))
+      continue
+    arrays.append(converted)
+    in_order.extend(where)
+  magnitudes = numpy.concatenate(arrays) if arrays else numpy.zeros(0)
+  return Column(attribute, unit, magnitudes, in_order, rejected)
+
+
+def by_category(kb, attribute, categories, unit=None, edge='isa'):
+  # type: (KB, str, Iterable[str], Any, str) -> Dict[str, Column]
+  """category -> the Column of attribute over its instances.
+
+  Pass unit to have them all in the same unit.
+  """
+  return dict((c, collect(kb, instances(kb, c, edge), attribute, unit)) for c in categories)
+
+
+class Column(object):
+  """The numeric values of an attribute over some pages, in one unit.
+
+  magnitudes is a NumPy array, and pages[i] is the page magnitudes[i]
+  comes from. The statistics are quantities in unit (plain floats if
+  unit is None), or None when there are no values.
+  """
+
+  def __init__(self, attribute, unit, magnitudes, pages, rejected):
+    # type: (str, Any, Any, List[str], List[Rejected]) -> None
+    self.attribute = attribute
+    self.unit = unit
+    self.magnitudes = magnitudes
+    self.pages = pages
+    self.rejected = rejected
+
+  def __len__(self):
+    # type: () -> int
+    return len(self.magnitudes)
+
+  def sum(self):
+    # type: () -> Any
+    return _quantity(self.magnitudes.sum(), self.unit)
+
+  def mean(self):
+    # type: () -> Any
+    return self._stat(numpy.mean)
+
+  def min(self):
+    # type: () -> Any
+    return self._stat(numpy.min)
+
+  def max(self):
+    # type: () -> Any
+    return self._stat(numpy.max)
+
+  def percentile(self, q):
+    # type: (Any) -> Any
+    """The q-th percentile (0 to 100; or a list of them, for a list of answers)."""
+    if not len(self):
+      return None
+    return _quantity(numpy.percentile(self.magnitudes, q), self.unit)
+
+  def _stat(self, f):
+    # type: (Any) -> Any
+    if not len(self):
+      return None
+    return _quantity(f(self.magnitudes), self.unit)
+
+
+def _unit_and_magnitude(x):
+  # type: (Any) -> Optional[Tuple[Any, float]]
+  """parse.unit_and_magnitude, but text that is a number counts too."""
+  if isinstance(x, (str, unicode)):
+    try:
+      value = float(x)
+    except ValueError:
+      return None
+    # not words like 'nan' or 'infinity'
+    return (None, value) if numpy.isfinite(value) else None
+  return parse.unit_and_magnitude(x)
+
+def _convert(magnitudes, source, target):
+  # type: (Any, Any, Any) -> Any
+  """magnitudes, from unit source to unit target (None: plain numbers); None if we can't."""
+  if source is None and target is None:
+    return magnitudes
+  try:
+    return parse.units.Quantity(magnitudes, source or parse.units.dimensionless).to(
+      target or parse.units.dimensionless).magnitude
+  except Exception:
+    return None
+
+def _quantity(magnitude, unit):
+  # type: (Any, Any) -> Any
+  magnitude = magnitude.tolist()
+  if unit is None:
+    return magnitude
+  return parse.units.Quantity(magnitude, unit)
@@ -0,0 +1,562 @@
+"""Benchmarks, to see how the code scales.
+
+Run them like this:
+
+python bench.py load
+
+or without argument to see the list.
+"""
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+def timed(f, *args):
+  """Returns (seconds it took, f's result)."""
+  start = time.time()
+  ret = f(*args)
+  return time.time() - start, ret
+
+
+def _write_notes(dirname, sections, name='notes.txt'):
+  """Writes a synthetic notes file with that many [title] sections."""
+  fname = os.path.join(dirname, name)
+  with open(fname, 'w') as f:
+    for i in range(sections):
+      f.write('[page %d]\n' % i)
+      f.write('`isa(thing %d)\n' % (i % 50))
+      f.write('Page %d is about `b(something) and `i(something else).\n' % i)
+      f.write('`size(%d m)\n\n' % i)
+  return fname
+
+
+def bench_load():
+  """interpret.files: load time should grow linearly with the section count."""
+  import interpret
+  tmp = tempfile.mkdtemp()
+  try:
+    for sections in [1000, 2000, 4000, 8000]:
+      fname = _write_notes(tmp, sections)
+      t, _ = timed(interpret.files, [fname])
+      print('%6d sections: %6.2fs (%.1f us/section)' % (sections, t, 1e6 * t / sections))
+  finally:
+    shutil.rmtree(tmp)
+
+
+def bench_parallel():
+  """interpret.files on 16 files, serially and with worker processes."""
+  import interpret
+  import multiprocessing
+  tmp = tempfile.mkdtemp()
+  try:
+    names = [_write_notes(tmp, 1000, 'notes%d.txt' % i) for i in range(16)]
+    for processes in sorted(set([1, 2, 4, multiprocessing.cpu_count()])):
+      t, _ = timed(interpret.files, names, processes)
+      print('%2d processes: %6.2fs' % (processes, t))
+  finally:
+    shutil.rmtree(tmp)
+
+
+def bench_units():
+  """parse.unit_perhaps: prose vs quantities, cold and memoized."""
+  import parse
+  prose = ['Page %d is about something and something else.\n' % i for i in range(3000)]
+  quantities = ['%d km' % i for i in range(3000)]
+  for name, texts in [('prose', prose), ('quantities', quantities)]:
+    parse.unit_memo.clear()
+    t, _ = timed(lambda: [parse.unit_perhaps(x) for x in texts])
+    t2, _ = timed(lambda: [parse.unit_perhaps(x) for x in texts])
+    print('%-10s cold: %5.1f us/text   memoized: %5.2f us/text' % (
+      name, 1e6 * t / len(texts), 1e6 * t2 / len(texts)))
+  print(parse.unit_memo.info())
+
+
+def bench_parse():
+  """parse.string on one long line: time should grow linearly with its length."""
+  import parse
+  for tags in [5000, 10000, 20000, 40000]:
+    line = 'cell, `b(bold (really) bold), ' * tags
+    t, _ = timed(parse.string, line)
+    print('%6d tags on one line: %6.3fs (%.1f us/tag)' % (tags, t, 1e6 * t / tags))
+
+
+def _isa_tree(nodes, fanout=4):
+  """A KB where page i isa page (i-1)/fanout: a tree of that many nodes."""
+  from kb import KB
+  pages = {'n0': {}}
+  for i in range(1, nodes):
+    pages['n%d' % i] = {'isa': ['n%d' % ((i - 1) // fanout)]}
+  return KB(pages)
+
+
+def bench_graph():
+  """graph queries on a 100k-node isa hierarchy (first call builds the index)."""
+  import graph
+  kb = _isa_tree(100000)
+  leaf = 'n%d' % (len(kb) - 1)
+  for name, f in [
+      ('all_sources', lambda: graph.all_sources(kb, 'isa')),
+      ('predecessors(n1)', lambda: graph.predecessors(kb, 'isa', 'n1')),
+      ('references_to(n1)', lambda: graph.references_to(kb, 'n1')),
+      ('ancestors(n1)', lambda: graph.ancestors(kb, 'isa', 'n1')),
+      ('descendants(%s)' % leaf, lambda: graph.descendants(kb, 'isa', leaf)),
+      ]:
+    first, _ = timed(f)
+    again, _ = timed(f)
+    print('%-22s first: %8.4fs   again: %8.4fs' % (name, first, again))
+
+
+def bench_closure():
+  """graph closures on a 100k-node isa hierarchy: walking, memoized, precomputed."""
+  import graph
+  kb = _isa_tree(100000)
+  graph.adjacency(kb, 'isa')
+  # the categories: nodes with subclasses
+  nodes = ['n%d' % i for i in range(0, 20000, 10)]
+  def subclasses():
+    return [graph.ancestors(kb, 'isa', n) for n in nodes]
+  t, _ = timed(subclasses)
+  t2, _ = timed(subclasses)
+  print('ancestors of 2000 nodes: %6.3fs   asked again: %6.4fs' % (t, t2))
+  kb.changed()
+  graph.adjacency(kb, 'isa')
+  t, _ = timed(graph.precompute_closure, kb, 'isa')
+  t2, _ = timed(subclasses)
+  t3, _ = timed(subclasses)
+  print('precompute_closure: %6.3fs   then ancestors of 2000 nodes: %6.3fs   again: %6.4fs' % (t, t2, t3))
+  for name, f in [('ancestors(n1)', lambda: graph.ancestors(kb, 'isa', 'n1')),
+                  ('roots(n99999)', lambda: graph.roots(kb, 'isa', 'n99999'))]:
+    first, _ = timed(f)
+    again, _ = timed(f)
+    print('%-22s first: %8.4fs   again: %8.6fs' % (name, first, again))
+
+
+def _family(people):
+  """A KB of that many people in couples; each couple has a son and a daughter."""
+  from kb import KB
+  pages = {}
+  for i in range(0, people, 2):
+    pages['p%d' % i] = {'isa': ['man'], 'wife': ['p%d' % (i + 1)]}
+    pages['p%d' % (i + 1)] = {}
+    for kid, tag in [(2 * i + 2, 'son'), (2 * i + 5, 'daughter')]:
+      if kid < people:
+        pages['p%d' % i][tag] = ['p%d' % kid]
+  return KB(pages)
+
+
+def _fixup_rules():
+  """The rules people.fixup applies."""
+  import people
+  rules = []
+  real = people.apply_rules
+  people.apply_rules = lambda kb, r, **kw: rules.extend(r)
+  try:
+    people.fixup({})
+  finally:
+    people.apply_rules = real
+  return rules
+
+
+def bench_rules():
+  """people.fixup rules: single pass, passes until nothing changes, and fixpoint mode."""
+  import transform
+  rules = _fixup_rules()
+  facts = lambda kb: sum(len(v) for page in kb.values() for v in page.values())
+  for n in [2000, 8000]:
+    kb = _family(n)
+    t, _ = timed(transform.apply_rules, kb, rules)
+    print('%6d people: one pass         %6.2fs' % (n, t))
+    kb = _family(n)
+    passes = 0
+    start = time.time()
+    while True:
+      before = facts(kb)
+      transform.apply_rules(kb, rules)
+      passes += 1
+      if facts(kb) == before: break
+    print('%6d people: %2d passes         %6.2fs  (%d facts)' % (n, passes, time.time() - start, facts(kb)))
+    kb = _family(n)
+    t, stats = timed(transform.apply_rules, kb, rules, True)
+    print('%6d people: fixpoint          %6.2fs  (%d facts) %s' % (n, t, facts(kb), stats[:2]))
+  print('derived per rule: %s' % stats.derived)
+  # notes about many things, a few of which are people
+  for pages in [100000, 400000]:
+    kb = _family(1000)
+    for i in range(pages - len(kb)):
+      dict.__setitem__(kb, 'thing %d' % i, {'isa': ['thing'], 'size': [i]})
+    t, _ = timed(transform.apply_rules, kb, rules)
+    print('%6d pages, 1000 people: one pass %6.2fs' % (pages, t))
+
+
+def bench_values():
+  """kb.Values vs plain lists: adding distinct values, and memory."""
+  from kb import Values
+  def add_all(make, n):
+    values = make()
+    for i in range(n):
+      x = 'child %d' % i
+      if not x in values:
+        values.append(x)
+    return values
+  for n in [100, 1000, 10000]:
+    reps = 100000 // n
+    t_list, _ = timed(lambda: [add_all(list, n) for _ in range(reps)])
+    t_values, _ = timed(lambda: [add_all(Values, n) for _ in range(reps)])
+    print('add %5d values: list %7.2f us/value   Values %5.2f us/value' % (
+      n, 1e6 * t_list / (n * reps), 1e6 * t_values / (n * reps)))
+  for n in [1, 4, 20, 100]:
+    items = ['value %d' % i for i in range(n)]
+    a, b = list(items), Values(items)
+    size_list = sys.getsizeof(a)
+    size_values = sys.getsizeof(b) + (sys.getsizeof(b._index) if b._index is not None else 0)
+    print('%3d values: list %5d bytes   Values %5d bytes' % (n, size_list, size_values))
+  import people
+  import transform
+  kb = _family(2000)
+  # big families: the first couples have lots of kids
+  for i in range(0, 200, 2):
+    kb['p%d' % i]['son'] = ['p%d' % k for k in range(i + 2, i + 1000)]
+  t, _ = timed(transform.apply_rules, kb, _fixup_rules(), True)
+  print('people.fixup rules, 2000 people with 100 big families: %.2fs' % t)
+
+
+def bench_find():
+  """kb.find vs scanning the pages, and the cost of keeping the index up to date."""
+  import transform
+  kb = _family(200000)
+  wives = ['p%d' % i for i in range(1, 200000, 2000)]
+  def scan(wife):
+    return [k for k, v in kb.items() if wife in v.get('wife', ())]
+  t_scan, _ = timed(lambda: [scan(w) for w in wives])
+  t_build, _ = timed(kb.find, 'wife', 'p1')
+  t_find, _ = timed(lambda: [kb.find('wife', w) for w in wives])
+  print('200000 people, who has wife=X: scan %.1f ms   find %.2f us   (index built in %.2fs)' % (
+    1e3 * t_scan / len(wives), 1e6 * t_find / len(wives), t_build))
+  # adding a fact, then asking again: the index is updated, not rebuilt
+  def add_and_find(n):
+    for i in range(n):
+      transform.addvalue(kb, 'p%d' % (2 * i), 'friend', 'p%d' % i)
+      kb.find('friend', 'p%d' % i)
+  t, _ = timed(add_and_find, 10000)
+  print('addvalue then find: %.2f us' % (1e6 * t / 10000))
+
+
+def bench_ranges():
+  """ranges.index vs converting every value, for 'diameter > X' queries."""
+  import parse
+  import random
+  import ranges
+  from kb import KB
+  random.seed(1)
+  units = ['km', 'mile', 'm']
+  pages = {}
+  for i in range(20000):
+    pages['planet %d' % i] = {'diameter': [parse.units.Quantity(random.uniform(1, 1e5), random.choice(units))]}
+  kb = KB(pages)
+  bounds = [parse.units.Quantity(x, 'km') for x in range(1000, 100000, 5000)]
+  def scan(low):
+    return [k for k, v in kb.items() for d in v['diameter'] if d > low]
+  t_scan, _ = timed(lambda: [scan(b) for b in bounds])
+  t_build, _ = timed(ranges.index, kb, 'diameter')
+  t_index, _ = timed(lambda: [ranges.index(kb, 'diameter').between(b) for b in bounds])
+  t_top, _ = timed(lambda: [ranges.index(kb, 'diameter').top(10) for _ in bounds])
+  print('20000 diameters, diameter > X: scan %.0f ms   index %.2f ms   (built in %.2fs)' % (
+    1e3 * t_scan / len(bounds), 1e3 * t_index / len(bounds), t_build))
+  print('top 10: %.1f us' % (1e6 * t_top / len(bounds)))
+
+
+def bench_search():
+  """search.Index on 200k pages: indexing, and queries with rare and common words."""
+  import random
+  import search
+  random.seed(1)
+  vocabulary = ['word%d' % i for i in range(20000)]
+  # a few words are in many pages, most are in few (roughly Zipf)
+  weights = [1.0 / (i + 1) for i in range(len(vocabulary))]
+  total = sum(weights)
+  cumulative = []
+  acc = 0.0
+  for w in weights:
+    acc += w / total
+    cumulative.append(acc)
+  import bisect
+  def text():
+    return ' '.join(vocabulary[min(bisect.bisect(cumulative, random.random()), len(vocabulary) - 1)]
+                    for _ in range(30))
+  index = search.Index()
+  texts = [text() for _ in range(200000)]
+  start = time.time()
+  for i, t in enumerate(texts):
+    index.add('page %d' % i, t, {'isa': ['thing %d' % (i % 100)]})
+  print('indexing 200000 pages: %.1fs' % (time.time() - start))
+  # the first search for a word sorts its pages by score, the others reuse that
+  for query in ['word15000', 'word500', 'word50 word5000', 'isa:thing', 'word0', 'word1 word2']:
+    first, _ = timed(index.search, query)
+    t, _ = timed(lambda: [index.search(query) for _ in range(10)])
+    print('%-18s first: %7.2f ms   again: %6.2f ms   (%d pages have the first word)' % (
+      query, 1e3 * first, 1e3 * t / 10, len(index._postings.get(search._terms(query)[0], ()))))
+
+
+def _deep_size(obj):
+  """Bytes used by obj and everything it refers to (each object counted once)."""
+  from array import array
+  seen = set()
+  todo = [obj]
+  total = 0
+  while todo:
+    x = todo.pop()
+    if id(x) in seen: continue
+    seen.add(id(x))
+    total += sys.getsizeof(x)
+    if isinstance(x, dict):
+      todo.extend(x.keys())
+      todo.extend(x.values())
+    elif isinstance(x, (list, tuple, set, frozenset)):
+      todo.extend(x)
+    elif isinstance(x, array) or isinstance(x, basestring):
+      pass
+    elif hasattr(x, '__dict__'):
+      todo.append(x.__dict__)
+    for slot in getattr(type(x), '__slots__', ()):
+      if hasattr(x, slot): todo.append(getattr(x, slot))
+  return total
+
+
+def bench_columnar():
+  """columnar.ColumnarKB vs KB: memory and lookup time, on families after fixup."""
+  import columnar
+  import transform
+  rules = _fixup_rules()
+  for n in [20000, 100000]:
+    kb = _family(n)
+    transform.apply_rules(kb, rules)
+    t, ckb = timed(columnar.ColumnarKB, kb)
+    # the names are the same objects in both, count them once
+    names = _deep_size(list(kb.keys()))
+    size_kb = _deep_size(kb) - _deep_size(kb.aka)
+    size_ckb = _deep_size(ckb) - _deep_size(ckb.aka)
+    print('%6d people: KB %6.1f MB   ColumnarKB %6.1f MB   (page names %.1f MB, build %.2fs)' % (
+      n, size_kb / 1e6, size_ckb / 1e6, names / 1e6, t))
+    pages = ['p%d' % i for i in range(0, n, 7)]
+    # ColumnarKB lookups allocate a list each, which makes the gc walk the
+    # (big) heap now and then; time the lookups themselves.
+    gc.disable()
+    for name, k in [('KB', kb), ('ColumnarKB', ckb)]:
+      t, _ = timed(lambda: [k[p].get('parent') for p in pages])
+      print('  %-10s kb[page].get(attribute): %.2f us' % (name, 1e6 * t / len(pages)))
+    gc.enable()
+
+
+def _startup_time(statement, runs=5):
+  """Best wall time of running 'statement' in a fresh interpreter."""
+  import subprocess
+  best = None
+  for _ in range(runs):
+    t, _ = timed(subprocess.check_call, [sys.executable, '-c', statement])
+    best = t if best is None else min(best, t)
+  return best
+
+
+def bench_startup():
+  """Start-up time of a fresh interpreter importing our modules."""
+  for statement in ['pass', 'import pint', 'import parse', 'import interpret',
+                    'import parse; parse.units.km']:
+    print('%-30s %6.3fs' % (statement, _startup_time(statement)))
+
+
+def bench_snapshot():
+  """web.load with a snapshot: first (cold) start vs. the next ones."""
+  import web
+  tmp = tempfile.mkdtemp()
+  try:
+    for sections in [2000, 8000]:
+      fname = _write_notes(tmp, sections)
+      snap = os.path.join(tmp, 'notes.snapshot')
+      if os.path.exists(snap): os.remove(snap)
+      cold, _ = timed(web.load, [fname], 1, snap)
+      warm, _ = timed(web.load, [fname], 1, snap)
+      print('%6d sections: cold %6.2fs   warm %6.2fs' % (sections, cold, warm))
+  finally:
+    shutil.rmtree(tmp)
+
+
+def bench_reload():
+  """watch.Notes: full load vs. reload after editing one section."""
+  import people
+  import watch
+  tmp = tempfile.mkdtemp()
+  try:
+    for sections in [2000, 8000]:
+      fname = _write_notes(tmp, sections)
+      t, notes = timed(watch.Notes, [fname], people.fixup)
+      with open(fname, 'a') as f:
+        f.write('One more line for the last page.\n')
+      st = os.stat(fname)
+      os.utime(fname, (st.st_atime, st.st_mtime + 1))
+      t2, stats = timed(notes.reload)
+      print('%6d sections: load %6.2fs   reload %6.2fs (parsed %d)' % (sections, t, t2, stats.parsed))
+  finally:
+    shutil.rmtree(tmp)
+
+
+def bench_nesting():
+  """interpret: html of a page with nested tags, first time and again."""
+  import interpret
+  import parse
+  from kb import KB
+  for depth in [4, 8, 12]:
+    text = ''.join('`b(' if i % 2 else '`i(' for i in range(depth)) + 'Mars and Venus' + ')' * depth
+    context = interpret.Context(KB({'Mars': {}, 'Venus': {}}))
+    page = interpret.info(parse.string(text * 5), page='p', context=context)
+    first, _ = timed(page.html)
+    again, _ = timed(page.html)
+    print('%2d levels: first %8.4fs   again %8.6fs' % (depth, first, again))
+
+
+def bench_table():
+  """interpret: html of tables with many rows, plain and with attribute columns."""
+  import interpret
+  import parse
+  from kb import KB
+  facts = dict(('star %d' % i, {'color': ['red'], 'size': ['%d km' % i]}) for i in range(0, 20000, 2))
+  for header in ['name, color, size', 'name, `attribute(color), `attribute(size)']:
+    for rows in [5000, 20000]:
+      text = '`table stars\n%s\n%s\n' % (header, '\n'.join('star %d, red, %d km' % (i, i) for i in range(rows)))
+      page = interpret.info(parse.string(text), page='p', context=interpret.Context(KB(facts)))
+      t, html = timed(page.html)
+      print('%-42s %5d rows: %6.2fs, %d chars' % (header, rows, t, len(html)))
+
+
+def bench_aggregate():
+  """aggregate: total and mean mass of 100k stars in mixed units, vs summing with Pint."""
+  import aggregate
+  import graph
+  import parse
+  from kb import KB
+  kg, earth_mass, g = parse.units.kg, parse.units.earth_mass, parse.units.g
+  pages = {'star': {}}
+  for i in range(100000):
+    mass = [i * kg, i * earth_mass, i * 1000 * g, 'unknown'][i % 4]
+    pages['star %d' % i] = {'isa': ['star'], 'mass': [mass]}
+  kb = KB(pages)
+  stars = graph.ancestors(kb, 'isa', 'star')
+  def with_pint():
+    total = 0 * kg
+    for page in stars:
+      for x in kb[page]['mass']:
+        if hasattr(x, 'units'):
+          total += x
+    return total
+  t, total = timed(with_pint)
+  print('Pint, one value at a time: %6.2fs  sum %s' % (t, total))
+  t, mass = timed(aggregate.collect, kb, stars, 'mass', 'kg')
+  print('aggregate.collect:         %6.2fs  (%d values, %d rejected)' % (t, len(mass), len(mass.rejected)))
+  t, stats = timed(lambda: (mass.sum(), mass.mean(), mass.percentile([50, 90])))
+  print('sum, mean, percentiles:    %6.4fs  sum %s' % (t, stats[0]))
+
+
+def bench_ingest():
+  """interpret.files on an instance-table: rows per second, and its KB alone."""
+  import interpret
+  tmp = tempfile.mkdtemp()
+  try:
+    for rows in [10000, 100000]:
+      fname = os.path.join(tmp, 'stars.txt')
+      with open(fname, 'w') as f:
+        f.write('[star]\n`instance-table stars\nname, color, mass, distance, notes\n')
+        for i in range(rows):
+          f.write('star %d, red, %d.5 kg, %d light_year, seen in %d\n' % (i, i, i % 1000, 1900 + i % 100))
+      t, (pages, kb) = timed(interpret.files, [fname])
+      print('%6d rows: load %6.2fs (%7d rows/s)' % (rows, t, rows / t))
+      table = interpret.info(interpret.parse.string(open(fname).read().split('\n', 1)[1]).contents[0], page='star')
+      t, _ = timed(table.kb)
+      print('%6d rows: kb() %6.2fs (%7d rows/s)' % (rows, t, rows / t))
+  finally:
+    shutil.rmtree(tmp)
+
+
+def bench_render():
+  """web.py /get/ pages: rendering, cached, and conditional GETs."""
+  import web
+  import webapp2
+  tmp = tempfile.mkdtemp()
+  try:
+    web.load([_write_notes(tmp, 2000)])
+  finally:
+    shutil.rmtree(tmp)
+  app = webapp2.WSGIApplication([('/get/(.*)', web.Get)])
+  paths = ['/get/page %d' % i for i in range(0, 2000, 10)]
+  def get_all(**headers):
+    return [webapp2.Request.blank(p, headers=headers).get_response(app) for p in paths]
+  for name in ['first', 'cached']:
+    t, responses = timed(get_all)
+    print('%-12s %6.2f ms/page' % (name, 1e3 * t / len(paths)))
+  t, _ = timed(lambda: [webapp2.Request.blank(p, headers={'If-None-Match': r.headers['ETag']}).get_response(app)
+                        for p, r in zip(paths, responses)])
+  print('%-12s %6.2f ms/page' % ('304', 1e3 * t / len(paths)))
+  t, _ = timed(lambda: [web.render(p[len('/get/'):], web.pages, web.kb) for p in paths])
+  print('render only  %6.2f ms/page' % (1e3 * t / len(paths)))
+  t, _ = timed(lambda: web.render('', web.pages, web.kb))
+  print('index page   %6.2f ms' % (1e3 * t))
+
+
+def bench_export():
+  """export.py: all pages, with worker processes, and again after changing one page."""
+  import export
+  import multiprocessing
+  import web
+  tmp = tempfile.mkdtemp()
+  try:
+    pages, kb = web.build([_write_notes(tmp, 4000)])
+    for processes in sorted(set([1, multiprocessing.cpu_count()])):
+      out = tempfile.mkdtemp(dir=tmp)
+      t, stats = timed(export.export, pages, kb, out, processes)
+      print('%d pages, %d processes: %.2fs' % (stats.pages, processes, t))
+    t, stats = timed(export.export, pages, kb, out)
+    print('nothing changed: %.2fs (rendered %d)' % (t, stats.rendered))
+    kb['page 7']['isa'].append('special thing')
+    t, stats = timed(export.export, pages, kb, out)
+    print('one page changed: %.2fs (rendered %d)' % (t, stats.rendered))
+  finally:
+    shutil.rmtree(tmp)
+
+
+BENCHMARKS = {
+  'aggregate': bench_aggregate,
+  'closure': bench_closure,
+  'columnar': bench_columnar,
+  'export': bench_export,
+  'find': bench_find,
+  'graph': bench_graph,
+  'ingest': bench_ingest,
+  'load': bench_load,
+  'nesting': bench_nesting,
+  'parallel': bench_parallel,
+  'parse': bench_parse,
+  'ranges': bench_ranges,
+  'reload': bench_reload,
+  'render': bench_render,
+  'rules': bench_rules,
+  'search': bench_search,
+  'snapshot': bench_snapshot,
+  'startup': bench_startup,
+  'table': bench_table,
+  'units': bench_units,
+  'values': bench_values,
+}
+
+
+def main():
+  if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+    print('Usage: python bench.py <benchmark>')
+    for name in sorted(BENCHMARKS):
+      print('  %-10s %s' % (name, BENCHMARKS[name].__doc__.split('\n')[0]))
+    return
+  BENCHMARKS[sys.argv[1]]()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,302 @@
+"""A compact, read-only KB: page and attribute names become integers.
+
+A KB is a dict of dicts of lists, keyed by strings. That's convenient, but
+at a million pages the dicts and lists take a lot of memory. ColumnarKB
+keeps the same facts in a few arrays instead:
+
+ - every string (page name, or a value that's a string) is stored once and
+   gets a number; the pages come first, so page i is called names[i].
+ - for each attribute, a column lists the values of all the pages that
+   have it, one after the other: the values of slot s are
+   targets[offsets[s]:offsets[s+1]] (CSR style). Attributes whose values
+   are all strings keep the string numbers in an array, the others keep
+   the values themselves in a list.
+ - for each page, which attributes it has and its slot in their column.
+
+It answers the same questions as a KB (kb[page][attribute], get,
+normalize_page, get_attribute, ...), through thin views that decode the
+values when asked. It can't be modified: build a new one instead.
+
+Example:
+
+>>> k = ColumnarKB(KB({'Mars': {'isa': ['planet'], 'moons': [2]}}))
+>>> k['mars']['isa']
+['planet']
+>>> k.get_attribute('Mars', 'moons')
+[2]
+>>> sorted(k['Mars'].keys())
+['isa', 'moons']
+"""
+
+from array import array
+from collections import Mapping
+from kb import KB
+from kb import KB_or_Dict
+from kb import pages_by_value
+from kb import unique
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple, Union
+
+
+class _Column(object):
+  """The values of one attribute, for all the pages that have it."""
+  __slots__ = ('offsets', 'targets', 'objects')
+
+  def __init__(self):
+    # type: () -> None
+    self.offsets = array('l', [0])
+    # string numbers, if the values are all strings; otherwise empty
+    self.targets = array('l')
+    # the values themselves, if they aren't all strings; otherwise None
+    self.objects = None  # type: Optional[List[Any]]
+
+
+class ColumnarKB(object):
+  """The facts of a KB, stored in arrays indexed by page number.
+
+  See the module documentation.
+  """
+
+  def __init__(self, kb):
+    # type: (KB_or_Dict) -> None
+    if not isinstance(kb, KB):
+      kb = KB(kb)
+    self.version = 0
+    self._cached = {}  # type: Dict[Any, Any]
+    self.names = []  # type: List[Any]
+    self._numbers = {}  # type: Dict[Any, int]
+    for page in dict.keys(kb):
+      self._intern(page)
+    self.page_count = len(self.names)
+    self.attributes = []  # type: List[str]
+    self._attribute_numbers = {}  # type: Dict[str, int]
+    self._columns = []  # type: List[_Column]
+    # the attributes of page p are page_attributes[page_offsets[p]:page_offsets[p+1]],
+    # and page_slots says where to find their values in each column.
+    self.page_offsets = array('l', [0])
+    self.page_attributes = array('l')
+    self.page_slots = array('l')
+    for p in range(self.page_count):
+      for attribute, values in dict.__getitem__(kb, self.names[p]).items():
+        a = self._attribute_numbers.get(attribute)
+        if a is None:
+          a = self._attribute_numbers[attribute] = len(self.attributes)
+          self.attributes.append(attribute)
+          self._columns.append(_Column())
+        column = self._columns[a]
+        self.page_attributes.append(a)
+        self.page_slots.append(len(column.offsets) - 1)
+        self._add_values(column, values)
+      self.page_offsets.append(len(self.page_attributes))
+    # aliases point to the same name objects as self.names
+    self.aka = dict((k, self.names[self._numbers[v]]) for k, v in kb.aka.items())
+
+  def _intern(self, s):
+    # type: (Any) -> int
+    n = self._numbers.get(s)
+    if n is None:
+      n = self._numbers[s] = len(self.names)
+      self.names.append(s)
+    return n
+
+  def _add_values(self, column, values):
+    # type: (_Column, List[Any]) -> None
+    objects = column.objects
+    if objects is None and all(isinstance(x, basestring) for x in values):
+      column.targets.extend(self._intern(x) for x in values)
+    else:
+      if objects is None:
+        # the first value that isn't a string: switch to a list
+        objects = column.objects = [self.names[n] for n in column.targets]
+        column.targets = array('l')
+      objects.extend(values)
+    column.offsets.append(column.offsets[-1] + len(values))
+
+  def _values(self, column, slot):
+    # type: (_Column, int) -> List[Any]
+    start, end = column.offsets[slot], column.offsets[slot + 1]
+    objects = column.objects
+    if objects is not None:
+      return objects[start:end]
+    names = self.names
+    return [names[n] for n in column.targets[start:end]]
+
+  # Numbers, for code that wants to work with them directly.
+
+  def page_number(self, page):
+    # type: (str) -> Optional[int]
+    """The number of the page (or alias), None if there's no such page."""
+    n = self._numbers.get(self.normalize_page(page))
+    if n is None or n >= self.page_count: return None
+    return n
+
+  def edges(self, attribute):
+    # type: (str) -> Iterator[Tuple[int, array]]
+    """(page number, its values' string numbers) for the pages that have attribute.
+
+    Only for attributes whose values are all strings; the numbers of the
+    strings that are page names are below page_count.
+    """
+    a = self._attribute_numbers.get(attribute)
+    if a is None: return
+    column = self._columns[a]
+    if column.objects is not None:
+      raise ValueError('%s has values that are not strings' % attribute)
+    for p in range(self.page_count):
+      for i in range(self.page_offsets[p], self.page_offsets[p + 1]):
+        if self.page_attributes[i] == a:
+          slot = self.page_slots[i]
+          yield p, column.targets[column.offsets[slot]:column.offsets[slot + 1]]
+
+  # The KB interface.
+
+  def normalize_page(self, key):
+    # type: (Any) -> str
+    """page name or alias -> page name"""
+    if key in self.aka:
+      return self.aka[key]
+    if self._is_page(key):
+      return key
+    return self.aka.get(key.lower(), key)
+
+  def _is_page(self, name):
+    # type: (str) -> bool
+    n = self._numbers.get(name)
+    return n is not None and n < self.page_count
+
+  def is_same_page(self, a, b):
+    # type: (str, str) -> bool
+    """true if a,b are names of the same page, even if aliases."""
+    return self.normalize_page(a) == self.normalize_page(b)
+
+  def __getitem__(self, key):
+    # type: (str) -> PageView
+    n = self.page_number(key)
+    if n is None: raise KeyError(key)
+    return PageView(self, n)
+
+  def get(self, key, default=None):
+    # type: (str, Any) -> Any
+    n = self.page_number(key)
+    if n is None: return default
+    return PageView(self, n)
+
+  def has_key(self, page):
+    # type: (str) -> bool
+    return self._is_page(self.normalize_page(page))
+
+  def __contains__(self, page):
+    # type: (str) -> bool
+    # like a dict, 'in' doesn't look at aliases
+    return self._is_page(page)
+
+  def __len__(self):
+    # type: () -> int
+    return self.page_count
+
+  def __iter__(self):
+    # type: () -> Iterator[str]
+    return iter(self.names[:self.page_count])
+
+  def keys(self):
+    # type: () -> List[str]
+    return self.names[:self.page_count]
+
+  def values(self):
+    # type: () -> List[PageView]
+    return [PageView(self, n) for n in range(self.page_count)]
+
+  def items(self):
+    # type: () -> List[Tuple[str, PageView]]
+    return [(self.names[n], PageView(self, n)) for n in range(self.page_count)]
+
+  def get_attribute(self, key, attribute, default=None):
+    # type: (str, str, Optional[List[Any]]) -> Optional[List[Any]]
+    """kb[key][attribute], or None if either's missing."""
+    page = self.get(key, None)
+    if not page: return default
+    return page.get(attribute, default)
+
+  def get_unique_attribute(self, key, attribute, default=None):
+    # type: (str, str, List[Any]) -> Any
+    """kb[key][attribute][0], or None if either's missing."""
+    return unique(self.get_attribute(key, attribute, default))
+
+  def cached(self, name, build):
+    # type: (Any, Callable[[ColumnarKB], Any]) -> Any
+    """build(self), remembered under 'name' (we never change)."""
+    if name not in self._cached:
+      self._cached[name] = build(self)
+    return self._cached[name]
+
+  def find(self, attribute, value):
+    # type: (str, Any) -> FrozenSet[str]
+    """The pages whose attribute has value (or another name of that page)."""
+    if isinstance(value, basestring):
+      value = self.normalize_page(value)
+    try:
+      pages = self.cached('find', pages_by_value).get((attribute, value))
+    except TypeError:
+      return frozenset()  # not hashable, so not in the index either
+    return frozenset(pages) if pages else frozenset()
+
+  def __setitem__(self, key, value):
+    raise TypeError('ColumnarKB is read-only; build a new one from a KB')
+
+  __delitem__ = __setitem__
+
+  def to_kb(self):
+    # type: () -> KB
+    """A regular KB with the same facts, e.g. to modify it."""
+    return KB(dict((self.names[n], dict(PageView(self, n).items())) for n in range(self.page_count)))
+
+
+class PageView(Mapping):
+  """One page of a ColumnarKB: attribute -> list of values."""
+  __slots__ = ('_kb', '_page')
+
+  def __init__(self, kb, page):
+    # type: (ColumnarKB, int) -> None
+    self._kb = kb
+    self._page = page
+
+  def _slot(self, attribute):
+    # type: (str) -> Tuple[Optional[_Column], int]
+    kb = self._kb
+    a = kb._attribute_numbers.get(attribute)
+    if a is not None:
+      for i in range(kb.page_offsets[self._page], kb.page_offsets[self._page + 1]):
+        if kb.page_attributes[i] == a:
+          return kb._columns[a], kb.page_slots[i]
+    return None, -1
+
+  def __getitem__(self, attribute):
+    # type: (str) -> List[Any]
+    column, slot = self._slot(attribute)
+    if column is None: raise KeyError(attribute)
+    return self._kb._values(column, slot)
+
+  def get(self, attribute, default=None):
+    # type: (str, Any) -> Any
+    column, slot = self._slot(attribute)
+    if column is None: return default
+    return self._kb._values(column, slot)
+
+  def __contains__(self, attribute):
+    # type: (Any) -> bool
+    return self._slot(attribute)[0] is not None
+
+  has_key = __contains__
+
+  def __iter__(self):
+    # type: () -> Iterator[str]
+    kb = self._kb
+    for i in range(kb.page_offsets[self._page], kb.page_offsets[self._page + 1]):
+      yield kb.attributes[kb.page_attributes[i]]
+
+  def __len__(self):
+    # type: () -> int
+    return self._kb.page_offsets[self._page + 1] - self._kb.page_offsets[self._page]
+
+  def __repr__(self):
+    # type: () -> str
+    return repr(dict(self.items()))
@@ -0,0 +1,224 @@
+"""Writes the pages web.py serves to a directory of static files.
+
+Example:
+
+  python export.py -o site/ -j 4 notes.txt
+
+site/index.html is the list of pages (/get/ on the server), and each page
+goes to site/get/<name>.html, with the links between pages changed to
+point to those files. The static/ directory is copied along, for images.
+
+Exporting again to the same directory only renders the pages whose inputs
+changed: their text and facts, the list of page names (any of which may be
+linked from anywhere), and the code. site/.export.json remembers them.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import urllib
+from collections import namedtuple
+from markupsafe import Markup
+from typing import Any, Dict, List, Optional, Tuple
+
+import interpret
+import snapshot
+import web
+from kb import KB
+
+MANIFEST = '.export.json'
+
+# Bump this when the layout of the exported files changes.
+FORMAT = 1
+
+# The code that decides how a page looks, on top of snapshot.RULE_FILES.
+RENDER_FILES = snapshot.RULE_FILES + ['web.py', 'export.py']
+
+ExportStats = namedtuple('ExportStats', ['pages', 'rendered', 'removed'])
+
+_HREF = re.compile(r'href="([^"]*)"')
+
+
+def filename(page):
+  # type: (str) -> str
+  """The file (in get/) for page.
+
+  >>> filename(u'The Earth/Moon')
+  'The Earth%2FMoon.html'
+  """
+  if isinstance(page, unicode):
+    page = page.encode('utf-8')
+  return urllib.quote(page, safe=" -_.,()'") + '.html'
+
+
+def export(pages, kb, outdir, processes=1):
+  # type: (Dict[str, Any], KB, str, int) -> ExportStats
+  """Writes pages and kb (as loaded by web.build) to outdir.
+
+  Pages whose inputs didn't change since the last export to outdir are
+  skipped, and the files of pages that are gone are removed.
+  """
+  getdir = os.path.join(outdir, 'get')
+  if not os.path.isdir(getdir):
+    os.makedirs(getdir)
+  old = _read_manifest(outdir)
+  names = sorted(set(pages.keys()) | set(kb.keys()))
+  code = snapshot.code_hash(RENDER_FILES)
+  everything = hashlib.sha1(repr((FORMAT, code, names)).encode('utf-8')).hexdigest()
+  previous = old.get('pages', {})
+  # otherwise, all the pages have to be rendered again
+  same = old.get('everything') == everything
+  facts = dict((page, _facts_digest(page, kb)) for page in names)
+  all_facts = hashlib.sha1(repr(sorted(facts.items()))).hexdigest()
+  digests = {}  # type: Dict[str, str]
+  todo = []  # type: List[str]
+  for page in names:
+    digests[page] = _digest(page, pages, facts[page], all_facts)
+    if not same or previous.get(page) != digests[page]:
+      todo.append(page)
+    elif not os.path.exists(os.path.join(getdir, filename(page))):
+      todo.append(page)
+  removed = 0
+  for page in previous:
+    if page not in digests:
+      _remove(os.path.join(getdir, filename(page)))
+      removed += 1
+  if not same or not os.path.exists(os.path.join(outdir, 'index.html')):
+    _write(os.path.join(outdir, 'index.html'), _relink(web.render('', pages, kb), pages, kb, 'get/'))
+  _render_all(todo, pages, kb, getdir, processes)
+  if os.path.isdir('static'):
+    _copy_tree('static', os.path.join(outdir, 'static'))
+  _write(os.path.join(outdir, MANIFEST), json.dumps({'everything': everything, 'pages': digests}))
+  return ExportStats(len(names), len(todo), removed)
+
+
+# What the workers render from: (pages, kb, directory), set before they start.
+_job = None  # type: Optional[Tuple[Dict[str, Any], KB, str]]
+
+def _render_all(todo, pages, kb, getdir, processes):
+  # type: (List[str], Dict[str, Any], KB, str, int) -> None
+  global _job
+  _job = (pages, kb, getdir)
+  try:
+    if processes > 1 and len(todo) > 1:
+      # the workers are forked from us, so they have _job already
+      pool = multiprocessing.Pool(processes)
+      try:
+        for _ in pool.imap_unordered(_render_page, todo, chunksize=max(1, len(todo) // (4 * processes))):
+          pass
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      for page in todo:
+        _render_page(page)
+  finally:
+    _job = None
+
+def _render_page(page):
+  # type: (str) -> None
+  """Runs in a worker: renders page to its file."""
+  job = _job
+  if job is None:
+    raise RuntimeError('_render_page runs in export')
+  pages, kb, getdir = job
+  _write(os.path.join(getdir, filename(page)), _relink(web.render(page, pages, kb), pages, kb, ''))
+
+
+def _relink(html, pages, kb, prefix):
+  # type: (unicode, Dict[str, Any], KB, str) -> unicode
+  """html with the links to pages changed to link to their files, in prefix."""
+  def link(m):
+    target = kb.normalize_page(Markup(m.group(1)).unescape())
+    if target not in pages and target not in kb:
+      return m.group(0)
+    return 'href="%s%s"' % (prefix, urllib.quote(filename(target)))
+  return _HREF.sub(link, html)
+
+
+def _digest(page, pages, facts, all_facts):
+  # type: (str, Dict[str, Any], str, str) -> str
+  """Hash of what the page's html comes from (besides the page names and the code).
+
+  facts is the _facts_digest of the page, all_facts a hash of every page's.
+  The latter counts only for pages that show other pages' facts (in tables
+  with `attribute columns): we don't know which pages they are before
+  rendering, so any change may change them.
+  """
+  info = pages.get(page)
+  text = info.text() if info is not None else None
+  others = all_facts if info is not None and interpret.shows_attributes(info) else None
+  return hashlib.sha1(repr((text, facts, others)).encode('utf-8')).hexdigest()
+
+
+def _facts_digest(page, kb):
+  # type: (str, KB) -> str
+  """Hash of the page's facts in kb."""
+  facts = sorted((a, [repr(x) for x in values]) for a, values in (kb.get(page) or {}).items())
+  return hashlib.sha1(repr(facts).encode('utf-8')).hexdigest()
+
+
+def _read_manifest(outdir):
+  # type: (str) -> Dict[str, Any]
+  try:
+    with open(os.path.join(outdir, MANIFEST)) as f:
+      return json.load(f)
+  except (IOError, ValueError):
+    return {}
+
+
+def _write(fname, text):
+  # type: (str, Any) -> None
+  """Writes text to fname (atomically, so a server never sees half of it)."""
+  tmp = '%s.%d.tmp' % (fname, os.getpid())
+  with open(tmp, 'wb') as f:
+    f.write(text.encode('utf-8') if isinstance(text, unicode) else text)
+  os.rename(tmp, fname)
+
+
+def _remove(fname):
+  # type: (str) -> None
+  try:
+    os.remove(fname)
+  except OSError:
+    pass
+
+
+def _copy_tree(src, dst):
+  # type: (str, str) -> None
+  """Copies the files of src to dst, unless they're already there and as recent."""
+  for root, dirs, files in os.walk(src):
+    target = os.path.join(dst, os.path.relpath(root, src))
+    if not os.path.isdir(target):
+      os.makedirs(target)
+    for f in files:
+      s, d = os.path.join(root, f), os.path.join(target, f)
+      if not os.path.exists(d) or os.path.getmtime(d) < os.path.getmtime(s):
+        shutil.copy2(s, d)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Write the pages described in the files as static html.')
+  parser.add_argument('files', nargs='+', metavar='file')
+  parser.add_argument('-o', '--output', required=True, metavar='DIR',
+                      help='directory to write to (pages that are up to date there are skipped)')
+  parser.add_argument('-j', '--jobs', type=int, default=1,
+                      help='number of processes to load the files and render the pages with')
+  parser.add_argument('--snapshot', metavar='FILE',
+                      help='reuse (or save) the loaded pages in this file')
+  args = parser.parse_args()
+  build = lambda: web.build(args.files, args.jobs)
+  if args.snapshot:
+    pages, kb = snapshot.load_or_build(args.snapshot, args.files, build)
+  else:
+    pages, kb = build()
+  stats = export(pages, kb, args.output, args.jobs)
+  print('%d pages: rendered %d, removed %d' % stats)
+
+
+if __name__ == '__main__':
+  main()
@@ -1,6 +1,8 @@
+from array import array
 from collections import defaultdict
+from collections import namedtuple
 from kb import KB
-from typing import List, Iterable, Dict, Set, Union, Any
+from typing import AbstractSet, List, Iterable, Dict, Set, FrozenSet, Union, Any, Tuple, Callable, Optional
 
 # The graph functions take a KB and interpret the "page" as being
 # a node in a graph and each "attribute" as being an edge with a name
@@ -16,6 +18,68 @@ from typing import List, Iterable, Dict, Set, Union, Any
 
 # Check the type annotations like this:
 # mypy --py2 graph.py
+#
+# The queries below don't scan the whole KB: they look things up in an
+# index of each edge type (see adjacency), which the KB keeps until it
+# changes.
+# The closures (ancestors, descendants, roots, neighbors) of a single node
+# are also remembered until the KB changes, so asking again is one lookup.
+# They're returned as frozensets because they're shared.
+# precompute_closure computes what's reachable from every node at once.
+
+# The index for one edge type:
+#   forward: page -> the (normalized) pages it points to
+#   reverse: normalized page -> the normalized pages that point to it
+#   by_value: value as written -> the normalized pages that have it, in KB order
+Adjacency = namedtuple('Adjacency', ['forward', 'reverse', 'by_value'])
+
+def adjacency(kb, edge):
+  # type: (KB, str) -> Adjacency
+  """The index of the edges of type 'edge', built once per KB version.
+
+  >>> kb = KB({'apple': {'isa': ['Fruit']}, 'fruit': {'isa': ['food']}})
+  >>> sorted(adjacency(kb, 'isa').reverse['fruit'])
+  ['apple']
+  """
+  return kb.cached(('adjacency', edge), lambda k: _build_adjacency(k, edge))
+
+def _build_adjacency(kb, edge):
+  # type: (KB, str) -> Adjacency
+  forward = {}  # type: Dict[str, List[str]]
+  reverse = defaultdict(set)  # type: Dict[str, Set[str]]
+  by_value = defaultdict(list)  # type: Dict[Any, List[str]]
+  for k, v in kb.items():
+    values = v.get(edge)
+    if values is None: continue
+    src = kb.normalize_page(k)
+    # only page names can be normalized (and followed)
+    forward[k] = [kb.normalize_page(x) for x in values if isinstance(x, basestring)]
+    for dst in forward[k]:
+      reverse[dst].add(src)
+    seen = set()  # type: Set[Any]
+    for x in values:
+      try:
+        if x in seen: continue
+        seen.add(x)
+      except TypeError:
+        continue  # not hashable, so it can't be a page name
+      by_value[x].append(src)
+  return Adjacency(forward, dict(reverse), dict(by_value))
+
+def _references(kb):
+  # type: (KB) -> Dict[Any, List[Tuple[str, str]]]
+  """value -> the (edge, normalized page) that have it, in KB order."""
+  def build(kb):
+    ret = defaultdict(list)  # type: Dict[Any, List[Tuple[str, str]]]
+    for page, links in kb.items():
+      for e, w in links.items():
+        for x in (w if hasattr(w, '__iter__') else [w]):
+          try:
+            ret[x].append((e, kb.normalize_page(page)))
+          except TypeError:
+            pass  # not hashable, so it can't be a page name
+    return dict(ret)
+  return kb.cached('references', build)
 
 def ensure_list(value_or_list):
   # type: (Union[str, Iterable[Any]]) -> Iterable[Any]
@@ -27,25 +91,21 @@ def ensure_list(value_or_list):
   >>> ensure_list(set([1,2,3]))
   set([1, 2, 3])
   """
-  if isinstance(value_or_list,list) or isinstance(value_or_list,set):
+  if isinstance(value_or_list, (list, set, frozenset)):
     return value_or_list
   return [value_or_list]
 
 def predecessors(kb, edge, node):
   # type: (KB, str, str) -> List
   """all predecessors of 'node' via edge type 'edge'"""
-  return [kb.normalize_page(k) for (k,v) in kb.items() if kb.normalize_page(node) in v.get(edge,[])]
+  return list(adjacency(kb, edge).by_value.get(kb.normalize_page(node), []))
 
 def references_to(kb, node):
   # type: (KB, str) -> Dict[str, List[str]]
   """all links to 'node'. Returned as a dict with edge type -> list of nodes"""
   ret=defaultdict(lambda:[])  # type: Dict[str, List[str]]
-  for page,links in kb.items():
-    for e,w in links.items():
-      if w==node: ret[e].append(kb.normalize_page(page))
-      if hasattr(w,'__iter__'):
-        for x in w:
-          if x==node: ret[e].append(kb.normalize_page(page))
+  for e, page in _references(kb).get(node, []):
+    ret[e].append(page)
   return ret
 
 def field_count(kb, nodes):
@@ -58,30 +118,33 @@ def field_count(kb, nodes):
   return ret
 
 def ancestors(kb, edge, node_or_list):
-  # type: (KB, str, Union[str, Iterable[str]]) -> Set[str]
+  # type: (KB, str, Union[str, Iterable[str]]) -> FrozenSet[str]
   """the set of all node names that have an edge <edge> that points to
     either <node> or someone who points to it."""
-  return ancestors_orequal(kb, edge, node_or_list).difference(_normalize_set(kb, ensure_list(node_or_list)))
+  return _memoized(kb, 'ancestors', edge, node_or_list, lambda:
+    ancestors_orequal(kb, edge, node_or_list).difference(_normalize_set(kb, ensure_list(node_or_list))))
 
 def ancestors_orequal(kb, edge, node_or_list):
-  # type: (KB, str, Union[str, Iterable[str]]) -> Set[str]
+  # type: (KB, str, Union[str, Iterable[str]]) -> FrozenSet[str]
   """ancestors(kb, edge, node) + node itself"""
-  target = set([kb.normalize_page(k) for k in ensure_list(node_or_list)])  # type: Set[str]
-  olen = 0
-  while olen!=len(target):
-    olen = len(target)
-    target = target.union(
-      [kb.normalize_page(k) for (k,v) in kb.items()
-       if not _normalize_set(kb, v.get(edge, [])).isdisjoint(target)])
-  return target
+  def compute():
+    target = set()  # type: Set[str]
+    for k in ensure_list(node_or_list):
+      k = kb.normalize_page(k)
+      target.add(k)
+      target.update(_reachable(kb, edge, k, True))
+    return frozenset(target)
+  return _memoized(kb, 'ancestors_orequal', edge, node_or_list, compute)
 
 def roots_among(kb, edge, candidates):
-  # type: (KB, str, Set[str]) -> Set[str]
+  # type: (KB, str, AbstractSet[str]) -> AbstractSet[str]
   """given a set of names, returns only those that do not have a predecessor in the set."""
+  forward = adjacency(kb, edge).forward
   children = set()  # type: Set[str]
-  for kids in [ _normalize_set(kb, kb.get_attribute(k,edge,[])) for k in candidates if k in kb]:
-    children = children.union(kids)
-  return candidates.difference(children)
+  for k in candidates:
+    if k in kb:
+      children.update(forward.get(kb.normalize_page(k), []))
+  return candidates - children
 
 def leaves_among(kb, edge, candidates):
   # type: (KB, str, Iterable[str]) -> List[str]
@@ -90,42 +153,58 @@ def leaves_among(kb, edge, candidates):
   return [kb.normalize_page(k) for k in cands_without_succ]
 
 def roots(kb, edge, node):
-  # type: (KB, str, str) -> Set[str]
+  # type: (KB, str, str) -> FrozenSet[str]
   """the set of all node names that have an edge <edge> that points to
     either <node> or someone who points to it, and that have no <edge> pointing to them.
     Edge is assumed to be single-valued."""
-  return roots_among(kb, edge, ancestors(kb, edge, node))
+  return _memoized(kb, 'roots', edge, node, lambda:
+    frozenset(roots_among(kb, edge, ancestors(kb, edge, node))))
 
 def descendants(kb, edge, node_or_list):
-  # type: (KB, str, Union[str, Iterable[str]]) -> Set[str]
-  accepted=set([])  # type: Set[str]
-  toadd=set(ensure_list(node_or_list))  # type: Set[str]
-  def grow(seed):
-    ret=set([])  # type: Set[str]
-    for k in seed:
-      nxt = [kb.normalize_page(k) for k in kb.get_attribute(k,edge, [])]
-      if not nxt: continue
-      ret=ret.union(nxt)
-    return ret.difference(seed)
-  while len(toadd)>0:
-    accepted = accepted.union(toadd)
-    toadd = grow(accepted)
-  return accepted
+  # type: (KB, str, Union[str, Iterable[str]]) -> FrozenSet[str]
+  def compute():
+    accepted = set(ensure_list(node_or_list))  # type: Set[str]
+    for k in ensure_list(node_or_list):
+      accepted.update(_reachable(kb, edge, k, False))
+    return frozenset(accepted)
+  return _memoized(kb, 'descendants', edge, node_or_list, compute)
 
 def descendants_orequal(kb,edge,node_or_list):
-  # type: (KB, str, Union[str, Iterable[str]]) -> Set[str]
-  nodes = ensure_list(node_or_list)
-  return descendants(kb,edge,nodes).union(set(nodes))
+  # type: (KB, str, Union[str, Iterable[str]]) -> FrozenSet[str]
+  # descendants already includes the nodes themselves
+  return descendants(kb, edge, node_or_list)
 
 def neighbors(kb, edge, node_or_list):
-  # type: (KB, str, Union[str, Iterable[str]]) -> Set[str]
+  # type: (KB, str, Union[str, Iterable[str]]) -> FrozenSet[str]
   """ignore edge direction, return the initial set and any node reachable
   by following "edge" links."""
-  return descendants_orequal(kb, edge, ancestors_orequal(kb, edge, node_or_list))
+  return _memoized(kb, 'neighbors', edge, node_or_list, lambda:
+    descendants_orequal(kb, edge, ancestors_orequal(kb, edge, node_or_list)))
+
+def precompute_closure(kb, edge):
+  # type: (KB, str) -> None
+  """Work out the ancestors and descendants of every node along edge, at once.
+
+  Afterwards the closure queries on that edge don't walk the graph any more;
+  until the KB changes, that is.
+
+  >>> kb = KB({'apple': {'isa': ['fruit']}, 'fruit': {'isa': ['food']}})
+  >>> precompute_closure(kb, 'isa')
+  >>> sorted(ancestors(kb, 'isa', 'food'))
+  ['apple', 'fruit']
+  """
+  index = adjacency(kb, edge)
+  nodes = set(index.forward)
+  nodes.update(kb.normalize_page(k) for k in index.forward)
+  for dsts in index.forward.values():
+    nodes.update(dsts)
+  down = Closure(dict((n, index.forward.get(kb.normalize_page(n), [])) for n in nodes))
+  up = Closure(index.reverse)
+  _closures(kb)[edge] = (down, up)
 
 def all_sources(kb, edge):
   # type: (KB, str) -> Set[str]
-  return set([kb.normalize_page(k) for (k,v) in kb.items() if v.get(edge)!=None])
+  return set([kb.normalize_page(k) for k in adjacency(kb, edge).forward])
 
 def all_destinations(kb, edge):
   # type: (KB, str) -> Set[str]
@@ -145,3 +224,149 @@ def _get_one(kb, key):
 def _normalize_set(kb, lst):
   return set([kb.normalize_page(k) for k in lst])
 
+def _memoized(kb, name, edge, node_or_list, compute):
+  # type: (KB, str, str, Union[str, Iterable[str]], Callable[[], FrozenSet[str]]) -> FrozenSet[str]
+  """compute(), remembered for single nodes until the KB changes."""
+  if isinstance(node_or_list, (list, set, frozenset)):
+    return compute()
+  memo = kb.cached((name, edge), lambda k: {})
+  ret = memo.get(node_or_list)
+  if ret is None:
+    ret = memo[node_or_list] = compute()
+  return ret
+
+def _closures(kb):
+  # type: (KB) -> Dict[str, Tuple[Closure, Closure]]
+  """edge -> the (descendants, ancestors) closures from precompute_closure."""
+  return kb.cached('closures', lambda k: {})
+
+def _reachable(kb, edge, node, up):
+  # type: (KB, str, str, bool) -> FrozenSet[str]
+  """The (normalized) nodes reachable from node in one or more steps.
+
+  up: follow the edges backwards (to the ancestors); node must be normalized then.
+  """
+  memo = kb.cached(('reachable', edge, up), lambda k: {})
+  ret = memo.get(node)
+  if ret is not None:
+    return ret
+  closures = _closures(kb).get(edge)
+  if closures:
+    ret = closures[up].reachable(node)
+  if ret is None:
+    index = adjacency(kb, edge)
+    if up:
+      successors = lambda n: index.reverse.get(n, ())
+    else:
+      successors = lambda n: index.forward.get(kb.normalize_page(n), ())
+    seen = set()  # type: Set[str]
+    todo = [node]
+    while todo:
+      for k in successors(todo.pop()):
+        if k not in seen:
+          seen.add(k)
+          todo.append(k)
+    ret = frozenset(seen)
+  memo[node] = ret
+  return ret
+
+
+class Closure(object):
+  """What's reachable from each node of a graph, computed for all nodes at once.
+
+  Nodes in the same strongly connected component have the same answer, which
+  is kept once, as a sorted array of node numbers. So this takes space in
+  proportion to the number of (node, reachable node) pairs between components.
+
+  >>> c = Closure({'a': ['b'], 'b': ['c'], 'c': ['b']})
+  >>> sorted(c.reachable('a'))
+  ['b', 'c']
+  >>> sorted(c.reachable('b'))
+  ['b', 'c']
+  >>> c.reachable('d') is None
+  True
+  """
+
+  def __init__(self, successors):
+    # type: (Dict[str, Iterable[str]]) -> None
+    names = set(successors)
+    for dsts in successors.values():
+      names.update(dsts)
+    self._names = list(names)
+    self._ids = dict((n, i) for i, n in enumerate(self._names))
+    succ = [[] for _ in self._names]  # type: List[List[int]]
+    for n, dsts in successors.items():
+      succ[self._ids[n]] = [self._ids[d] for d in dsts]
+    self._comp, comps = _components(succ)
+    # components come out successors first, so theirs are ready when we need them.
+    self._reach = []  # type: List[array]
+    for c, members in enumerate(comps):
+      found = set()  # type: Set[int]
+      if len(members) > 1 or members[0] in succ[members[0]]:
+        found.update(members)
+      for m in members:
+        for d in set(self._comp[v] for v in succ[m]):
+          if d == c: continue
+          found.update(comps[d])
+          found.update(self._reach[d])
+      self._reach.append(array('i', sorted(found)))
+
+  def reachable(self, node):
+    # type: (str) -> Optional[FrozenSet[str]]
+    """The nodes reachable from node in one or more steps, or None if we don't know node."""
+    i = self._ids.get(node)
+    if i is None: return None
+    names = self._names
+    return frozenset(names[j] for j in self._reach[self._comp[i]])
+
+
+def _components(succ):
+  # type: (List[List[int]]) -> Tuple[List[int], List[List[int]]]
+  """Tarjan's strongly connected components, without recursion.
+
+  Returns the component of each node, and the members of each component.
+  Components are numbered so that the ones a component points to come first.
+  """
+  index = [-1] * len(succ)
+  low = [0] * len(succ)
+  on_stack = [False] * len(succ)
+  comp = [-1] * len(succ)
+  comps = []  # type: List[List[int]]
+  stack = []  # type: List[int]
+  counter = 0
+  for root in range(len(succ)):
+    if index[root] >= 0: continue
+    index[root] = low[root] = counter
+    counter += 1
+    stack.append(root)
+    on_stack[root] = True
+    work = [(root, 0)]
+    while work:
+      v, i = work[-1]
+      if i < len(succ[v]):
+        work[-1] = (v, i + 1)
+        w = succ[v][i]
+        if index[w] < 0:
+          index[w] = low[w] = counter
+          counter += 1
+          stack.append(w)
+          on_stack[w] = True
+          work.append((w, 0))
+        elif on_stack[w]:
+          low[v] = min(low[v], index[w])
+        continue
+      work.pop()
+      if work:
+        u = work[-1][0]
+        low[u] = min(low[u], low[v])
+      if low[v] == index[v]:
+        members = []
+        while True:
+          w = stack.pop()
+          on_stack[w] = False
+          comp[w] = len(comps)
+          members.append(w)
+          if w == v: break
+        comps.append(members)
+  return comp, comps
+
@@ -12,13 +12,17 @@ u'Neptune is great, blablabla'
 from abc import abstractmethod
 from abc import ABCMeta
 import codecs
+import functools
+import multiprocessing
 from parse import Tagged
 import split
 import parse
 from kb import KB
 from kb import KBDict
 import kb
+import matcher
 from markupsafe import Markup
+from markupsafe import escape
 from markupsafe import soft_unicode
 from typing import List, Iterable, Dict, Set, Union, Tuple, Any
 from collections import defaultdict
@@ -27,52 +31,149 @@ def file(filename):
   """interpret.file(fname) -> parses it into pages and a KB."""
   return files([filename])
 
-def files(list_of_filenames):
-  # type: (str) -> Tuple[Dict[str,InfoToken], KB]
-  """interpret.files(["foo.txt", "bar.txt") -> parses them into pages and a KB."""
+def files(list_of_filenames, processes=1):
+  # type: (List[str], int) -> Tuple[Dict[str,InfoToken], KB]
+  """interpret.files(["foo.txt", "bar.txt") -> parses them into pages and a KB.
+
+  With processes>1, the files are parsed in that many worker processes.
+  The result is the same as when loading them one after the other.
+  """
   pages = {}
   big_kb = {}  # type: kb.KBDict
-  context = Context(big_kb)
-  for filename in list_of_filenames:
-    print("Loading %s" % filename)
-    with codecs.open(filename, encoding='utf-8') as f:
-      # disabling mypy for this line because it thinks f isn't iterable (but it is)
-      for (title, lines) in split.strings(f):  # type: ignore
-        nfo = info(parse.strings(lines), page=title, context=context)
-        pages[title] = nfo
-        nkb = nfo.kb()
-        if '' in nkb:
-          nkb[title] = nkb['']
-          del nkb['']
-          if '' in nkb[title]:
-            del nkb[title]['']
-        big_kb = kb.merge([big_kb, nkb])
+  # The pages only get to see the KB once it's complete.
+  context = Context({})
+  if processes > 1 and len(list_of_filenames) > 1:
+    # the workers start with the units already loaded
+    parse.load_units()
+    pool = multiprocessing.Pool(processes)
+    try:
+      for sections, file_kb in pool.imap(_load_file, list_of_filenames):
+        for title, tree in sections:
+          pages[title] = info(tree, page=title, context=context)
+        kb.merge_into(big_kb, file_kb)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    for filename in list_of_filenames:
+      print("Loading %s" % filename)
+      with codecs.open(filename, encoding='utf-8') as f:
+        # disabling mypy for this line because it thinks f isn't iterable (but it is)
+        for (title, lines) in split.strings(f):  # type: ignore
+          nfo = info(parse.strings(lines), page=title, context=context)
+          pages[title] = nfo
+          kb.merge_into(big_kb, section_kb(title, nfo))
   final = KB(big_kb)
   context.big_kb = final
   # context.debug = True
   return (pages, final)
 
+def _load_file(filename):
+  # type: (str) -> Tuple[List[Tuple[str, Tagged]], KBDict]
+  """Runs in a worker: filename -> its parsed sections, and the facts they contribute."""
+  print("Loading %s" % filename)
+  sections = []
+  file_kb = {}  # type: KBDict
+  with codecs.open(filename, encoding='utf-8') as f:
+    for (title, lines) in split.strings(f):  # type: ignore
+      tree = parse.strings(lines)
+      sections.append((title, tree))
+      kb.merge_into(file_kb, section_kb(title, info(tree, page=title)))
+  return sections, file_kb
+
+def section_kb(title, nfo):
+  # type: (str, InfoToken) -> KBDict
+  """The facts of the section called title, with '' replaced by the title.
+
+  This is what each [title] section contributes to the KB; loaders can
+  kb.merge_into() these one at a time.
+  """
+  nkb = nfo.kb()
+  if '' in nkb:
+    nkb[title] = nkb['']
+    del nkb['']
+    if '' in nkb[title]:
+      del nkb[title]['']
+  return nkb
+
 class Context(object):
-  "Context holds a reference to the KB, and optionally the page the info's about."
+  """Context holds a reference to the KB, and optionally the page the info's about.
+
+  The tokens remember what they render until the context's version changes:
+  that's when big_kb (or a flag) is set, or when big_kb, if it's a KB,
+  changes. If you modify a plain dict big_kb in place, call changed().
+  """
   def __init__(self, kb):
+    self._changes = 0
     self.big_kb = kb
     self.debug = False
+    # only link page names that appear as whole words
+    self.whole_words = False
+
+  def __setattr__(self, name, value):
+    object.__setattr__(self, name, value)
+    if name != '_changes':
+      self.changed()
+
+  def changed(self):
+    # type: () -> None
+    """Bumps the version."""
+    object.__setattr__(self, '_changes', self._changes + 1)
+
+  @property
+  def version(self):
+    # type: () -> Tuple[int, Any]
+    return (self._changes, getattr(self.big_kb, 'version', None))
 
 no_context = Context({})
 
 
-def linkify(word, kb):
+def linkify(word, kb, whole_words=False):
+    """Turns the page names found in word into links.
+
+    Longer page names win over the shorter ones they overlap with.
+    If whole_words is set, only names that start and end at word
+    boundaries are linked.
+    """
     # exact match?
     if word in kb:
       return Markup('<a href="{0}">{0}</a>').format(word)
+    if not kb or not word:
+      return word
     # substring match?
-    for k in sorted(kb.keys(), key=len, reverse=True):
-      i = word.find(k)
-      if i<0: continue
-      prefix = word[:i]
-      suffix = word[i+len(k):]
-      return linkify(prefix, kb) + Markup('<a href="{0}">{0}</a>').format(k) + linkify(suffix, kb)
-    return word
+    found = _matcher(kb).longest(word, whole_words)
+    if not found:
+      return word
+    parts = []
+    done = 0
+    for start, end in found:
+      parts.append(word[done:start])
+      parts.append(Markup('<a href="{0}">{0}</a>').format(word[start:end]))
+      done = end
+    parts.append(word[done:])
+    return Markup('').join(parts)
+
+
+def _matcher(kb):
+  # type: (Dict[str, Any]) -> matcher.Matcher
+  """The page-name matcher for kb, built once per KB version."""
+  if isinstance(kb, KB):
+    return kb.cached('linkify', lambda k: matcher.Matcher(k.keys()))
+  return matcher.Matcher(kb.keys())
+
+
+def _per_version(method):
+  """Remembers what method returns until the token's context changes."""
+  memo = '_memo_' + method.__name__
+  @functools.wraps(method)
+  def wrapper(self):
+    version = self._ctx.version
+    found = self.__dict__.get(memo)
+    if found is None or found[0] != version:
+      found = (version, method(self))
+      self.__dict__[memo] = found
+    return found[1]
+  return wrapper
 
 
 class InfoToken(object):
@@ -86,6 +187,9 @@ class InfoToken(object):
     def html(self):
         """html representation, eg. for putting on a web page."""
         raise NotImplemented()
+    def html_parts(self):
+        """html(), in pieces that add up to it, for sending a big page as it's made."""
+        yield self.html()
     @abstractmethod
     def value(self):
         """Python value, eg. for using in a program."""
@@ -167,18 +271,23 @@ class StringToken(InfoToken):
   def __init__(self, txt, context):
     self._text = str(txt)
     self._tag = ''
-    self._value = parse.unit_perhaps(txt)
+    self._txt = txt
+    # parsed when asked for: a table's cells are often only shown
+    self._value = None
     self._root = {}
     self._ctx = context
   def text(self):
     return self._text
+  @_per_version
   def html(self):
     root_kb = self._ctx.big_kb
-    ret = linkify(self._text, root_kb)
+    ret = linkify(self._text, root_kb, self._ctx.whole_words)
     # if ret != self._text: print "linkify: " + self._text + " -> " + ret
     if self._ctx.debug: ret = 'StringToken[' + ret + ']'
     return ret
   def value(self):
+    if self._value is None:
+      self._value = parse.unit_perhaps(self._txt)
     return self._value
   def kb(self):
     return {}
@@ -196,16 +305,44 @@ class Attribute(InfoToken):
     return {}
   def value(self):
     return None
+  @_per_version
   def text(self):
-    if len(self._page)<1:
-      # no page specified, perhaps this is a header: output the tag
-      return str(self._tagged)
-    d = self._ctx.big_kb.get(self._page, {})
-    if len(d)<1: return "?"
-    return kb.unlist(d.get(self._attribute, "?"))
+    d = self._ctx.big_kb.get(self._page, {}) if self._page else None
+    return _attribute_text(self._tagged, self._page, d)
   def html(self):
     return Markup('{0}').format(self.text())
 
+# (Markup.format is slow enough to matter, with one cell after another)
+_TD = Markup('<td>')
+_END_TD = Markup('</td>')
+
+def _attribute_text(thetagged, page, d):
+  # type: (Tagged, str, Dict[str, Any]) -> Any
+  """What `attribute(name) shows on page, whose attributes (in the KB) are d."""
+  if len(page)<1:
+    # no page specified, perhaps this is a header: output the tag
+    return str(thetagged)
+  if len(d)<1: return "?"
+  # the attribute's name; if the notes nest a tag there instead, it's just not found
+  name = thetagged.contents[0]  # type: Any
+  return kb.unlist(d.get(name, "?"))
+
+def shows_attributes(token):
+  # type: (InfoToken) -> bool
+  """Whether token's html shows facts from the KB, with `attribute.
+
+  Such html can change when any page's facts do, not just its own.
+  """
+  tagged = getattr(token, '_page_contents', None) or getattr(token, '_tagged', None)
+  todo = [tagged]
+  while todo:
+    x = todo.pop()
+    if isinstance(x, Tagged):
+      if x.tag.lower() == 'attribute':
+        return True
+      todo.extend(x.contents)
+  return False
+
 class Table(InfoToken):
   """The info, represented as a table.
 
@@ -222,61 +359,85 @@ class Table(InfoToken):
     self._tag = ''
     self._value = None
     self._ctx = context
+    self._tagged = thetagged
     title, rest = split_contents(thetagged.contents)
     self._title_contents = title
     header, rest = split_contents(rest)
     self._header_contents = header
-    self._rows_contents = []
-    while rest:
-      row, rest = split_contents(rest)
-      self._rows_contents.append(row)
+    # (the same rows as taking split_contents until nothing's left, in one pass)
+    self._rows_contents = split_all(rest) if rest else []
   def value(self):
     return None
+  @_per_version
   def text(self):
-    title_line = ''.join([info(x).text() for x in self._title_contents])
-    header_line = ''.join([info(x).text() for x in self._header_contents])
-    ret = title_line + '\n' + header_line
+    lines = [''.join([info(x).text() for x in self._title_contents]),
+             ''.join([info(x).text() for x in self._header_contents])]
     for row_contents in self._rows_contents:
-      ret = ret + '\n' + ''.join([info(x).text() for x in row_contents])
-    return ret
+      lines.append(''.join([info(x).text() for x in row_contents]))
+    return '\n'.join(lines)
+  @_per_version
   def html(self):
-    title_line = ''
-    for x in [info(x, context=self._ctx).html() for x in self._title_contents]:
-      title_line += x
-    ret = title_line
-    ret += Markup('\n<table border="1" style="border-collapse: collapse;">')
-    ret += Markup('\n  <tr>')
+    return Markup(u'').join(self.html_parts())
+  def html_parts(self):
+    """html(), as a series of pieces (Markup), so it can be sent as it's made.
+
+    The cells of the attribute columns are looked up in one go: each page
+    named in the first column is fetched from the KB once, for all of them.
+    """
+    ctx = self._ctx
+    if ctx.debug: yield Markup('Table[')
+    for x in self._title_contents:
+      yield escape(info(x, context=ctx).html())
+    yield Markup('\n<table border="1" style="border-collapse: collapse;">')
+    yield Markup('\n  <tr>')
     header = split_all(self._header_contents, ',')
     is_special = [ any(isinstance(x, Tagged) and x.tag=='attribute' for x in h) for h in header ]
     for h in header:
       # h is a content list
-      h_html = ''
-      for x in h:
-        h_html += info(x, context=self._ctx).html()
-      ret += Markup('<th>{0}</th>').format(h_html)
-    ret += Markup('</tr>')
-    for row_contents in self._rows_contents:
-      row = split_all(row_contents, ',')
-      # skip empty row, don't even add attributes,
-      # because that's probably the final empty line.
-      if len(row)==0: continue
-      ret += Markup('\n  <tr>')
+      yield Markup('<th>{0}</th>').format(Markup(u'').join(info(x, context=ctx).html() for x in h))
+    yield Markup('</tr>')
+    rows = [split_all(row_contents, ',') for row_contents in self._rows_contents]
+    # skip empty rows, don't even add attributes,
+    # because that's probably the final empty line.
+    rows = [row for row in rows if row]
+    # the pages the rows are about, and what the KB has on them
+    names = [self._row_page(row) for row in rows] if any(is_special) else [''] * len(rows)
+    found = self._lookup(names)
+    for row, page in zip(rows, names):
+      yield Markup('\n  <tr>')
       extras = len(header) - len(row)
-      padded_row = row + [''] * extras 
+      padded_row = row + [''] * extras
       for i, r in enumerate(padded_row):
-        r_html = ''
         if is_special[i]:
+          yield _TD
           for h in header[i]:
-            if isinstance(h, Tagged):
-              page=''.join(info(r).html() for r in row[0])
-              r_html += info(h, page=page, context=self._ctx).html()
+            if not isinstance(h, Tagged):
+              continue
+            if h.tag == 'attribute':
+              yield Markup('{0}').format(_attribute_text(h, page, found.get(page)))
+            else:
+              yield escape(info(h, page=page, context=ctx).html())
+          yield _END_TD
         else:
+          yield _TD
           for x in r:
-            r_html += info(x, context=self._ctx).html()
-        ret += Markup('<td>{0}</td>').format(r_html)
-      ret += Markup('</tr>')
-    ret += Markup('\n</table>')
-    if self._ctx.debug: ret = 'Table[' + ret + ']'
+            yield escape(info(x, context=ctx).html())
+          yield _END_TD
+      yield Markup('</tr>')
+    yield Markup('\n</table>')
+    if ctx.debug: yield Markup(']')
+  def _row_page(self, row):
+    # type: (List[List[Any]]) -> str
+    """The page a row is about: what its first cell says."""
+    return ''.join(info(r).html() for r in row[0])
+  def _lookup(self, pages):
+    # type: (List[str]) -> Dict[str, Dict[str, Any]]
+    """page -> its attributes in the KB, for each of pages."""
+    big_kb = self._ctx.big_kb
+    ret = {}  # type: Dict[str, Dict[str, Any]]
+    for page in pages:
+      if page and page not in ret:
+        ret[page] = big_kb.get(page, {})
     return ret
   def kb(self):
     return {}
@@ -299,7 +460,10 @@ class InstanceTable(Table):
   earth, blue
   mars, red
   """
+  @_per_version
   def kb(self):
+    if _is_text(self._header_contents) and all(_is_text(r) for r in self._rows_contents):
+      return self._text_kb()
     ret = {}
     header_components = split_all(self._header_contents, ',')
     headers = [''.join(info(h).text() for h in col).strip() for col in header_components]
@@ -319,8 +483,36 @@ class InstanceTable(Table):
           ret[row_name][headers[i]] = []
         ret[row_name][headers[i]] += [info(col).value()]
     return ret
+  def _text_kb(self):
+    # type: () -> KBDict
+    """kb(), for a table that's only text (no tags): the same, faster.
+
+    The cells are split in one pass, and the values of each column are
+    parsed together (see parse.units_perhaps).
+    """
+    headers = [h.strip() for h in ''.join(str(x) for x in self._header_contents).split(',')]
+    rows = [[c.strip() for c in ''.join(str(x) for x in row_contents).split(',')]
+            for row_contents in self._rows_contents]
+    # ignore the rows that have no name.
+    rows = [row for row in rows if row[0]]
+    columns = {}  # type: Dict[int, List[str]]
+    for row in rows:
+      for i in range(1, len(row)):
+        columns.setdefault(i, []).append(row[i])
+    values = dict((i, iter(parse.units_perhaps(texts))) for i, texts in columns.items())
+    ret = {}  # type: KBDict
+    for row in rows:
+      attributes = ret[row[0]] = {'isa': [self._page]}
+      for i in range(1, len(row)):
+        attributes.setdefault(headers[i], []).append(next(values[i]))
+    return ret
     
 
+def _is_text(contents):
+  # type: (List[Any]) -> bool
+  return all(isinstance(x, basestring) for x in contents)
+
+
 class Image(InfoToken):
     """img tag: `img(foo.jpg) or `img(width=50%,foo.jpg)"""
     __metaclass__ = ABCMeta
@@ -366,69 +558,103 @@ class TagsAreWebOK(InfoToken):
       self._page_contents = page
       self._kb={}
       self._ctx = context
-      self._filled = False
-    def _fill(self):
+      # the context's version when we last filled, None if we never did
+      self._filled = None
+      # the same, for the last time we made the html too
+      self._html_filled = None
+    def _fill(self, html=True):
+      # Without html, for text, value and kb: while loading, the html isn't
+      # needed (and would have to be made again once the KB is complete).
+      # Other threads may be reading this token: everything is made in
+      # locals, set, and only then stamped with the version it's for.
+      version = self._ctx.version
       page = self._page_contents
       pagename = self._page
       context = self._ctx
+      htm = None
       if not isinstance(page, Tagged):
-        self._tag=''
-        self._text=str(page)
-        self._html=str(page)
-        self._value=page
+        tag=''
+        txt=str(page)
+        htm=str(page)
+        value=page
+        thekb = self._kb
       else:
-        self._tag = page.tag
+        tag = page.tag
         kids = [info(x, self._page, context) for x in page.contents]
-        self._text = ''.join([k.text() for k in kids])
+        txt = ''.join([k.text() for k in kids])
         if len(kids)==1:
           # special case, keep the value
-          self._value = kids[0].value()
+          value = kids[0].value()
         else:
-          self._value = [k.value() for k in kids]
-        self._html = u''
-        for k in kids:
-          self._html += k.html()
-        self._kb=kb.merge([x.kb() for x in kids if x.kb()])
+          value = [k.value() for k in kids]
+        if html:
+          htm = u''
+          for k in kids:
+            htm += k.html()
+        thekb=kb.merge([x.kb() for x in kids if x.kb()])
         # page '' means "current page"
         # our tag is the attribute, and we store the value there.
-        if not '' in self._kb:
-          self._kb[''] = defaultdict(list)
-        self._kb[''][self._tag].append(self._value)
-        if self._tag:
-          self._text = self._tag + ': ' + self._text
-          if self._tag == 'img':
+        if not '' in thekb:
+          thekb[''] = defaultdict(list)
+        thekb[''][tag].append(value)
+        if tag:
+          txt = tag + ': ' + txt
+        if tag and html:
+          if tag == 'img':
             # image, special case.
             # static content is held in "static/"
             # (as opposed to "data" which holds data we don't serve)
-            #self._html = Markup(u'<%s width="100%%" src="/static/{0}">' % (self._tag)).format(soft_unicode(self._html))
-            self._html = Markup(u'<%s width="50px" src="/static/{0}">' % (self._tag)).format(soft_unicode(self._html))
+            #htm = Markup(u'<%s width="100%%" src="/static/{0}">' % (tag)).format(soft_unicode(htm))
+            htm = Markup(u'<%s width="50px" src="/static/{0}">' % (tag)).format(soft_unicode(htm))
           else:
             # normal case
-            self._html = Markup(u'<%s>{0}</%s>' % (self._tag, self._tag)).format(soft_unicode(self._html))
+            htm = Markup(u'<%s>{0}</%s>' % (tag, tag)).format(soft_unicode(htm))
+      self._tag = tag
+      self._text = txt
+      self._value = value
+      self._kb = thekb
+      if html:
+        self._html = htm
+      self._filled = version
+      if html:
+        self._html_filled = version
     def text(self):
-      if not self._filled:
-        self._fill()
-        self._filled = True
+      if self._filled is None:
+        self._fill(html=False)
       return self._text
     def html(self):
-      # the html changes if the context changes, and we don't know when that happens
-      # so we just recompute every time.
-      self._fill()
+      # the html changes if the context changes, so we fill again when it has.
+      if self._html_filled != self._ctx.version:
+        self._fill()
       return self._html
+    def html_parts(self):
+      page = self._page_contents
+      if not isinstance(page, Tagged) or page.tag:
+        yield self.html()
+        return
+      # A whole page: the parts of its kids, so its tables come in pieces too
+      # (without keeping the html, unlike html()).
+      kids = [info(x, self._page, self._ctx) for x in page.contents]
+      htmls = [None if isinstance(k, Table) else k.html() for k in kids]
+      if None not in htmls and not any(isinstance(h, Markup) for h in htmls):
+        # no markup anywhere, html() leaves the text as it is
+        yield u''.join(htmls)
+        return
+      for k, h in zip(kids, htmls):
+        if h is None:
+          for part in k.html_parts():
+            yield part
+        else:
+          yield escape(h)
     def kb(self):
-      if not self._filled:
-        self._fill()
-        self._filled = True
+      if self._filled is None:
+        self._fill(html=False)
       return self._kb
     def value(self):
-      if not self._filled:
-        self._fill()
-        self._filled = True
+      if self._filled is None:
+        self._fill(html=False)
       return self._value
     def __str__(self):
-      if not self._filled:
-        self._fill()
-        self._filled = True
       return self.text()
 
 
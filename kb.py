@@ -1,5 +1,5 @@
 # "Knowledge Base"
-from typing import List, Iterable, Dict, Set, Union, Any
+from typing import List, Iterable, Dict, Set, FrozenSet, Tuple, Union, Any, Callable, Optional
 from collections import defaultdict
 
 # Check the type annotations like this:
@@ -39,11 +39,33 @@ class KB(dict):
   ['brown']
   >>> k.get_attribute('bobby tables', 'eye_color')
   ['brown']
+
+  Things computed from the KB can be kept with cached(); they are
+  dropped whenever the KB changes, which bumps its version.
+  Adding or removing pages counts as a change; if you modify a page's
+  attributes directly, call changed() afterwards.
+
+  >>> k.version
+  0
+  >>> k['Alice'] = {'eye_color': ['green']}
+  >>> k.version
+  1
+
+  find() looks up the pages that have a value, without a scan.
+  Values that are page names match whatever names the same page.
+
+  >>> sorted(k.find('eye_color', 'brown'))
+  ['Bob']
   """
 
   def __init__(self, dict_of_dict):
     # type: (KBDict) -> None
     self.aka = {}  # type: Dict[str, str]
+    self.version = 0
+    self._cached = {}  # type: Dict[Any, Any]
+    # (attribute, normalized value) -> the pages that have it; built by
+    # find, kept up to date by note_value and when pages are added.
+    self._pages_by_value = None  # type: Optional[Dict[Tuple[str, Any], Set[str]]]
     self.update(dict_of_dict)
     self._fill_aka()
 
@@ -51,6 +73,67 @@ class KB(dict):
     # type: (str) -> Dict[str, List[Any]]
     return dict.__getitem__(self,self.normalize_page(key))
 
+  def __setitem__(self, key, value):
+    # type: (str, Dict[str, List[Any]]) -> None
+    index = self._pages_by_value
+    # a new page that isn't an alias doesn't change the other values' pages
+    new = index is not None and not dict.has_key(self, key) and self.normalize_page(key) == key
+    dict.__setitem__(self, key, value)
+    self.changed()
+    if new and index is not None:
+      self._pages_by_value = index
+      for attribute, values in value.items():
+        index_values(index, self.normalize_page, key, attribute, values)
+
+  def __delitem__(self, key):
+    # type: (str) -> None
+    dict.__delitem__(self, key)
+    self.changed()
+
+  def __reduce__(self):
+    # Pickle the pages and what we know about them, as is: unpickling
+    # through __setitem__ would happen before our attributes exist.
+    return (_restore_kb, (dict(self), self.aka, self.version, self._cached))
+
+  def changed(self):
+    # type: () -> None
+    """Bumps the version, dropping everything cached for the old one."""
+    self.version += 1
+    self._cached = {}
+    self._pages_by_value = None
+
+  def note_value(self, page, attribute, value):
+    # type: (str, str, Any) -> None
+    """Like changed(), after adding value to the page's attribute.
+
+    Only says what was added, so find() doesn't have to start over.
+    """
+    index = self._pages_by_value
+    self.changed()
+    if index is not None:
+      self._pages_by_value = index
+      index_values(index, self.normalize_page, page, attribute, [value])
+
+  def find(self, attribute, value):
+    # type: (str, Any) -> FrozenSet[str]
+    """The pages whose attribute has value (or another name of that page)."""
+    if self._pages_by_value is None:
+      self._pages_by_value = pages_by_value(self)
+    if isinstance(value, basestring):
+      value = self.normalize_page(value)
+    try:
+      pages = self._pages_by_value.get((attribute, value))
+    except TypeError:
+      return frozenset()  # not hashable, so not in the index either
+    return frozenset(pages) if pages else frozenset()
+
+  def cached(self, name, build):
+    # type: (Any, Callable[[KB], Any]) -> Any
+    """build(self), remembered under 'name' until the KB next changes."""
+    if name not in self._cached:
+      self._cached[name] = build(self)
+    return self._cached[name]
+
   def get(self, key, default=None):
     # type: (str, Any) -> Dict[str, List[Any]]
     return dict.get(self,self.normalize_page(key), default)
@@ -60,7 +143,7 @@ class KB(dict):
     return dict.has_key(self, self.normalize_page(page))
 
   def normalize_page(self, key):
-    # type: (str) -> str
+    # type: (Any) -> str
     """page name or alias -> page name"""
     if self.aka.has_key(key):
       return self.aka[key]
@@ -111,6 +194,159 @@ class KB(dict):
 KB_or_Dict = Union[KB, KBDict]
 
 
+# Values of these types hash the same when they're equal (so a set finds them).
+_PLAIN = (str, unicode, int, long, float, bool)
+
+
+class Values(list):
+  """The values of a page's attribute: a list, that's quick to search.
+
+  Once it holds more than a few values, it also keeps a set of them so that
+  'x in values' doesn't have to look at each one. That only works if the
+  values are plain strings and numbers; otherwise it's a normal list search.
+
+  >>> v = Values(['mars', 'venus'])
+  >>> v += ['earth']
+  >>> 'earth' in v, v
+  (True, ['mars', 'venus', 'earth'])
+  """
+  __slots__ = ('_index', '_unindexable')
+  # below this size, searching the list is as fast as the set.
+  SMALL = 8
+
+  def __init__(self, values=()):
+    # type: (Iterable[Any]) -> None
+    list.__init__(self, values)
+    self._reindex()
+
+  def __reduce__(self):
+    return (Values, (list(self),))
+
+  def _reindex(self):
+    # type: () -> None
+    # a set of the values, or None if they're not indexed (yet, or at all)
+    self._index = None  # type: Optional[Set[Any]]
+    # set when some values can't go in a set, so they never will be
+    self._unindexable = False
+    if len(self) > Values.SMALL:
+      if all(type(x) in _PLAIN for x in self):
+        self._index = set(self)
+      else:
+        self._unindexable = True
+
+  def _added(self, x):
+    # type: (Any) -> None
+    index = self._index
+    if index is not None:
+      if type(x) in _PLAIN:
+        index.add(x)
+      else:
+        self._index = None
+        self._unindexable = True
+    elif not self._unindexable and len(self) > Values.SMALL:
+      self._reindex()
+
+  def __contains__(self, x):
+    # type: (Any) -> bool
+    index = self._index
+    if index is not None and type(x) in _PLAIN:
+      return x in index
+    return list.__contains__(self, x)
+
+  def append(self, x):
+    # type: (Any) -> None
+    list.append(self, x)
+    self._added(x)
+
+  def insert(self, i, x):
+    # type: (int, Any) -> None
+    list.insert(self, i, x)
+    self._added(x)
+
+  def extend(self, xs):
+    # type: (Iterable[Any]) -> None
+    for x in xs:
+      self.append(x)
+
+  def __iadd__(self, xs):
+    # type: (Iterable[Any]) -> Values
+    self.extend(xs)
+    return self
+
+  # Removing values may remove the last copy of one: start over.
+
+  def remove(self, x):
+    # type: (Any) -> None
+    list.remove(self, x)
+    self._reindex()
+
+  def pop(self, *args):
+    # type: (*int) -> Any
+    ret = list.pop(self, *args)
+    self._reindex()
+    return ret
+
+  def __setitem__(self, i, x):
+    list.__setitem__(self, i, x)
+    self._reindex()
+
+  def __delitem__(self, i):
+    list.__delitem__(self, i)
+    self._reindex()
+
+  def __setslice__(self, i, j, xs):
+    list.__setslice__(self, i, j, xs)
+    self._reindex()
+
+  def __delslice__(self, i, j):
+    list.__delslice__(self, i, j)
+    self._reindex()
+
+  def __imul__(self, n):
+    # type: (int) -> Values
+    # (__setslice__ reindexes)
+    self[:] = list(self) * n
+    return self
+
+
+def _restore_kb(pages, aka, version, cached):
+  # type: (KBDict, Dict[str, str], int, Dict[Any, Any]) -> KB
+  """Unpickles a KB (see KB.__reduce__)."""
+  ret = KB.__new__(KB)
+  dict.update(ret, pages)
+  ret.aka = aka
+  ret.version = version
+  ret._cached = cached
+  ret._pages_by_value = None
+  return ret
+
+
+def pages_by_value(kb):
+  # type: (Any) -> Dict[Tuple[str, Any], Set[str]]
+  """(attribute, normalized value) -> the pages that have it, for find.
+
+  kb can be anything with a KB's items() and normalize_page.
+  """
+  index = defaultdict(set)  # type: Dict[Tuple[str, Any], Set[str]]
+  for page, attributes in kb.items():
+    for attribute, values in attributes.items():
+      index_values(index, kb.normalize_page, page, attribute, values)
+  return index
+
+
+def index_values(index, normalize_page, page, attribute, values):
+  # type: (Dict[Tuple[str, Any], Set[str]], Callable[[Any], str], str, str, Iterable[Any]) -> None
+  """Adds page to the index entries of its attribute's values."""
+  page = normalize_page(page)
+  for x in values:
+    if isinstance(x, basestring):
+      x = normalize_page(x)
+    try:
+      index[(attribute, x)].add(page)
+    except TypeError:
+      pass  # not hashable: find can't look for it
+
+
 def merge(kblist):
   # type: (List[KBDict]) -> KBDict
   """Merges the dicts together into a single one by appending all the keys.
@@ -124,14 +360,43 @@ def merge(kblist):
   """
   ret = {}  # type: KBDict
   for kb in kblist:
-    for k, v in kb.items():
-      if k not in ret:
-        ret[k] = defaultdict(list)
-      for attrib, values in v.items():
-        ret[k][attrib] += values
+    merge_into(ret, kb)
   return ret
 
 
+def merge_into(target, kb):
+  # type: (KBDict, KBDict) -> KBDict
+  """Appends kb's values to target, in place, and returns target.
+
+  Merging the pages one at a time this way costs time proportional to the
+  size of what's being added, not to the size of what's already in target.
+  If target is a KB, what's added is indexed for find().
+  merge_into({}, a) followed by merge_into(that, b) gives the same result
+  as merge([a, b]).
+
+  Example:
+  >>> acc = {}
+  >>> _ = merge_into(acc, {'mars': {'isa': ['planet']}})
+  >>> _ = merge_into(acc, {'mars': {'isa': ['red thing']}})
+  >>> acc['mars']['isa']
+  ['planet', 'red thing']
+  """
+  note = target.note_value if isinstance(target, KB) else None
+  for k, v in kb.items():
+    page = target.get(k)
+    if page is None:
+      page = target[k] = defaultdict(Values)
+    for attrib, values in v.items():
+      if attrib in page:
+        page[attrib] += values
+      else:
+        page[attrib] = Values(values)
+      if note:
+        for x in values:
+          note(k, attrib, x)
+  return target
+
+
 def unique(value):
   """Check that there is only one value in the list, and return it.
 
@@ -0,0 +1,179 @@
+"""Load test for web.py: latency and throughput of the index and the pages.
+
+Example:
+
+  python loadtest.py -c 16 -n 2000 notes.txt
+
+starts web.py on the files (on --port, with --server-args if any), asks
+for /get/ and the first --pages pages it lists, from -c threads at once,
+-n requests in all, and prints p50 and p99 latency and the requests per
+second, for the index and the pages. Use --url to test a server that's
+already running instead.
+
+The requests go to the same urls in the same order each time, so runs
+can be compared. A 503 means the server turned the request away (see
+--renders in web.py); those are counted apart, not in the latencies.
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib
+import urllib2
+from collections import namedtuple
+from typing import Any, List, Optional, Tuple
+
+# One request: the path, the HTTP status (0 if it failed to connect), and how long it took.
+Result = namedtuple('Result', ['path', 'status', 'seconds'])
+
+_HREF = re.compile(r'<a href="([^"]*)">')
+
+
+def percentile(values, q):
+  # type: (List[float], float) -> Optional[float]
+  """The q-th percentile (0 to 100) of values, by nearest rank; None if empty.
+
+  >>> percentile([4, 1, 3, 2], 50)
+  2
+  >>> percentile([4, 1, 3, 2], 99)
+  4
+  """
+  if not values:
+    return None
+  ordered = sorted(values)
+  rank = int(-(-q * len(ordered) // 100))  # ceiling
+  return ordered[max(rank, 1) - 1]
+
+
+def fetch(url):
+  # type: (str) -> Tuple[int, float]
+  """(HTTP status, seconds) of a GET of url, with the whole body read."""
+  start = time.time()
+  try:
+    response = urllib2.urlopen(url)
+    try:
+      response.read()
+      status = response.getcode()
+    finally:
+      response.close()
+  except urllib2.HTTPError as e:
+    e.read()
+    status = e.code
+  except (urllib2.URLError, IOError):
+    status = 0
+  return status, time.time() - start
+
+
+def page_paths(base, pages):
+  # type: (str, int) -> List[str]
+  """/get/ and the paths of the first pages it links to."""
+  response = urllib2.urlopen(base + '/get/')
+  try:
+    html = response.read()
+  finally:
+    response.close()
+  paths = ['/get/' + urllib.quote(href) for href in _HREF.findall(html)]
+  return ['/get/'] + paths[:pages]
+
+
+def run(base, paths, requests, concurrency):
+  # type: (str, List[str], int, int) -> Tuple[List[Result], float]
+  """Makes requests GETs of base + paths[i % len(paths)], concurrency at a time.
+
+  Returns the results in the order they were started, and the seconds it all took.
+  """
+  results = [None] * requests  # type: List[Any]
+  count = [0]
+  lock = threading.Lock()
+  def work():
+    while True:
+      with lock:
+        i = count[0]
+        count[0] += 1
+      if i >= requests:
+        return
+      path = paths[i % len(paths)]
+      status, seconds = fetch(base + path)
+      results[i] = Result(path, status, seconds)
+  threads = [threading.Thread(target=work) for _ in range(concurrency)]
+  start = time.time()
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  return results, time.time() - start
+
+
+def report(results, elapsed):
+  # type: (List[Result], float) -> List[str]
+  """Lines of p50, p99 and requests per second: for the index, the pages and all."""
+  lines = ['%-6s %8s %8s %8s %6s %6s %8s' % ('', 'requests', 'p50 ms', 'p99 ms', '503', 'errors', 'req/s')]
+  for name, keep in [('index', lambda r: r.path == '/get/'),
+                     ('pages', lambda r: r.path != '/get/'),
+                     ('all', lambda r: True)]:
+    group = [r for r in results if keep(r)]
+    if not group:
+      continue
+    ok = [r.seconds for r in group if r.status == 200]
+    busy = sum(1 for r in group if r.status == 503)
+    lines.append('%-6s %8d %s %s %6d %6d %8.1f' % (
+      name, len(group), _ms(ok, 50), _ms(ok, 99), busy, len(group) - len(ok) - busy, len(ok) / elapsed))
+  return lines
+
+
+def _ms(seconds, q):
+  # type: (List[float], float) -> str
+  """The q-th percentile of seconds, in ms for report; '-' if there are none."""
+  p = percentile(seconds, q)
+  return '%8.1f' % (1e3 * p) if p is not None else '%8s' % '-'
+
+
+def start_server(files, port, args=()):
+  # type: (List[str], int, Any) -> subprocess.Popen
+  """Starts web.py on files, and waits until it answers."""
+  server = subprocess.Popen([sys.executable, 'web.py', '--port', str(port)] + list(args) + list(files))
+  url = 'http://127.0.0.1:%d/get/' % port
+  while fetch(url)[0] != 200:
+    if server.poll() is not None:
+      raise RuntimeError('web.py exited with status %d' % server.returncode)
+    time.sleep(0.2)
+  return server
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Measure how web.py holds up under load.')
+  parser.add_argument('files', nargs='*', metavar='file', help='notes for web.py to serve')
+  parser.add_argument('--url', help='test the server at this url (like http://127.0.0.1:8080) instead')
+  parser.add_argument('--port', type=int, default=8081, help='port to start web.py on')
+  parser.add_argument('--server-args', default='', metavar='ARGS',
+                      help="more arguments for web.py, like '--threads 32 --renders 4'")
+  parser.add_argument('-c', '--concurrency', type=int, default=8, help='requests at a time')
+  parser.add_argument('-n', '--requests', type=int, default=1000, help='requests in all')
+  parser.add_argument('--pages', type=int, default=20, help='how many pages to ask for, besides /get/')
+  args = parser.parse_args()
+  if not args.url and not args.files:
+    parser.error('give the files to serve, or --url')
+  server = None
+  if not args.url:
+    server = start_server(args.files, args.port, args.server_args.split())
+  base = (args.url or 'http://127.0.0.1:%d' % args.port).rstrip('/')
+  try:
+    paths = page_paths(base, args.pages)
+    # once around, so the pages are rendered and cached as they would be
+    run(base, paths, len(paths), 1)
+    results, elapsed = run(base, paths, args.requests, args.concurrency)
+  finally:
+    if server:
+      server.terminate()
+      server.wait()
+  print('%d requests to %d urls, %d at a time, in %.2fs' % (
+    len(results), len(paths), args.concurrency, elapsed))
+  for line in report(results, elapsed):
+    print(line)
+
+
+if __name__ == '__main__':
+  main()
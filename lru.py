@@ -0,0 +1,94 @@
+"""A size-bounded memo that forgets the least recently used entries.
+
+Example:
+
+>>> memo = LRU(maxsize=2)
+>>> memo['a'] = 1
+>>> memo['b'] = 2
+>>> memo.get('a')
+1
+>>> memo['c'] = 3
+>>> memo.get('b') is None
+True
+>>> memo.info()
+CacheInfo(hits=1, misses=1, maxsize=2, currsize=2)
+"""
+
+import threading
+from collections import namedtuple
+from collections import OrderedDict
+from typing import Any, Hashable
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class LRU(object):
+  """Maps keys to values, keeping at most maxsize of them.
+
+  get() counts hits and misses, so you can tell whether maxsize is right.
+  It's safe to use from several threads (every get moves the key, so even
+  reads change it).
+  """
+
+  def __init__(self, maxsize=1024):
+    # type: (int) -> None
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._data = OrderedDict()  # type: OrderedDict
+    self._lock = threading.Lock()
+
+  def get(self, key, default=None):
+    # type: (Hashable, Any) -> Any
+    """The value for key (now the most recently used), or default."""
+    with self._lock:
+      try:
+        value = self._data.pop(key)
+      except KeyError:
+        self.misses += 1
+        return default
+      self._data[key] = value
+      self.hits += 1
+      return value
+
+  def __setitem__(self, key, value):
+    # type: (Hashable, Any) -> None
+    with self._lock:
+      if key in self._data:
+        del self._data[key]
+      self._data[key] = value
+      self._trim()
+
+  def __contains__(self, key):
+    # type: (Hashable) -> bool
+    return key in self._data
+
+  def __len__(self):
+    # type: () -> int
+    return len(self._data)
+
+  def resize(self, maxsize):
+    # type: (int) -> None
+    """Change maxsize, dropping the oldest entries if needed."""
+    with self._lock:
+      self.maxsize = maxsize
+      self._trim()
+
+  def clear(self):
+    # type: () -> None
+    """Forget all the entries and reset the counters."""
+    with self._lock:
+      self._data.clear()
+      self.hits = 0
+      self.misses = 0
+
+  def info(self):
+    # type: () -> CacheInfo
+    with self._lock:
+      return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+  def _trim(self):
+    # type: () -> None
+    """Call with _lock held."""
+    while len(self._data) > self.maxsize:
+      self._data.popitem(last=False)
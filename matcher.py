@@ -0,0 +1,107 @@
+"""Finds many words in a text at once (Aho-Corasick).
+
+Build the Matcher once for a set of words, then each search costs
+time proportional to the text length plus the number of matches,
+regardless of how many words there are.
+
+Example:
+
+>>> m = Matcher(['mars', 'red planet', 'planet'])
+>>> text = 'mars, the red planet'
+>>> [text[s:e] for s,e in m.longest(text)]
+['mars', 'red planet']
+"""
+
+from collections import deque
+from typing import List, Iterable, Dict, Tuple
+
+
+class Matcher(object):
+  """Aho-Corasick automaton over a fixed set of words."""
+
+  def __init__(self, words):
+    # type: (Iterable[str]) -> None
+    # state 0 is the root. For each state: outgoing edges, failure link,
+    # and the lengths of the words that end there (including via failure links).
+    self._goto = [{}]  # type: List[Dict[str, int]]
+    self._fail = [0]  # type: List[int]
+    self._out = [()]  # type: List[Tuple[int, ...]]
+    for w in words:
+      if w: self._add(w)
+    self._link()
+
+  def _add(self, word):
+    # type: (str) -> None
+    state = 0
+    for c in word:
+      nxt = self._goto[state].get(c)
+      if nxt is None:
+        nxt = len(self._goto)
+        self._goto.append({})
+        self._fail.append(0)
+        self._out.append(())
+        self._goto[state][c] = nxt
+      state = nxt
+    self._out[state] = (len(word),)
+
+  def _link(self):
+    # type: () -> None
+    """Compute the failure links, breadth-first."""
+    goto, fail, out = self._goto, self._fail, self._out
+    todo = deque(goto[0].values())
+    while todo:
+      state = todo.popleft()
+      for c, nxt in goto[state].items():
+        todo.append(nxt)
+        f = fail[state]
+        while f and c not in goto[f]:
+          f = fail[f]
+        f = goto[f].get(c, 0)
+        fail[nxt] = f if f != nxt else 0
+        out[nxt] = out[nxt] + out[fail[nxt]]
+
+  def find_all(self, text):
+    # type: (str) -> Iterable[Tuple[int, int]]
+    """All (start, end) occurrences of the words in text, overlaps included."""
+    goto, fail, out = self._goto, self._fail, self._out
+    state = 0
+    for i, c in enumerate(text):
+      while state and c not in goto[state]:
+        state = fail[state]
+      state = goto[state].get(c, 0)
+      for n in out[state]:
+        yield (i + 1 - n, i + 1)
+
+  def longest(self, text, whole_words=False):
+    # type: (str, bool) -> List[Tuple[int, int]]
+    """Non-overlapping (start, end) matches, sorted by position.
+
+    Longer matches win over the shorter ones they overlap with,
+    and between equally long ones the leftmost wins.
+    If whole_words is set, only matches that start and end at a word
+    boundary count.
+
+    >>> m = Matcher(['cat', 'at', 'dog'])
+    >>> m.longest('a cat, a catalog')
+    [(2, 5), (9, 12)]
+    >>> m.longest('a cat, a catalog', whole_words=True)
+    [(2, 5)]
+    """
+    found = self.find_all(text)
+    if whole_words:
+      found = [(s, e) for s, e in found
+               if (s == 0 or not _is_word_char(text[s-1]))
+               and (e == len(text) or not _is_word_char(text[e]))]
+    taken = bytearray(len(text))
+    ret = []
+    for s, e in sorted(found, key=lambda se: (se[0] - se[1], se[0])):
+      if taken.find(b'\x01', s, e) >= 0: continue
+      taken[s:e] = b'\x01' * (e - s)
+      ret.append((s, e))
+    ret.sort()
+    return ret
+
+
+def _is_word_char(c):
+  # type: (str) -> bool
+  return c.isalnum() or c == '_'
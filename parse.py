@@ -52,12 +52,47 @@ So for example:
 """
 from abc import abstractmethod
 from abc import ABCMeta
+from collections import namedtuple
+import lru
+import numbers
 import pint
-from typing import List, Iterable, Dict, Set, Union, Any
+from pint.util import string_preprocessor
+from typing import List, Iterable, Iterator, Dict, Set, Union, Any, Tuple, Optional
 import re
 
-units = pint.UnitRegistry('data/units_en.txt')
-units.define('earth_mass = 5.972E24 * kg')
+UNITS_FILE = 'data/units_en.txt'
+
+class _LazyUnitRegistry(pint.UnitRegistry):
+    """Our UnitRegistry, which only reads its definitions when first used.
+
+    Loading the definitions is slow, and many users of this module never
+    need units. It has to be a real UnitRegistry so Pint will accept it as
+    the application registry, which unpickled quantities are attached to.
+    """
+    def __init__(self):
+        pass
+    def _after_init(self):
+        # Pint calls this right after __init__, but we have nothing to set up yet.
+        pass
+    def __getattr__(self, item):
+        # Only called for attributes we don't have, that is, before loading.
+        _load_units(self)
+        return getattr(self, item)
+
+def _load_units(registry):
+    # type: (pint.UnitRegistry) -> None
+    registry.__class__ = pint.UnitRegistry
+    pint.UnitRegistry.__init__(registry, UNITS_FILE)
+    registry._after_init()
+    registry.define('earth_mass = 5.972E24 * kg')
+
+units = _LazyUnitRegistry()
+pint.set_application_registry(units)
+
+def load_units():
+    # type: () -> None
+    """Load the unit definitions now, for example before starting worker processes."""
+    units.Quantity
 
 ## User interface
 
@@ -65,18 +100,43 @@ units.define('earth_mass = 5.972E24 * kg')
 def string(s):
     # type: (str) -> Tagged
     """One long string (possibly with line returns) -> a Tagged tree."""
-    return _parse(LinesHolder([s]), mytag='', parens=False)
+    return _build(_events([s]))
 
 def strings(ss):
     # type: (Iterable[str]) -> Tagged
     """String enumerable (or open file) -> a Tagged tree."""
-    return _parse(LinesHolder(ss), mytag='', parens=False)
+    return _build(events(ss))
 
 def file(filename):
     """File name -> a Tagged tree."""
     with open(filename, 'rt') as f:
         return strings(f)
 
+# Kinds of Event.
+OPEN = 'open'
+TEXT = 'text'
+CLOSE = 'close'
+
+# What events() yields. 'value' is the tag name for OPEN and CLOSE,
+# and the text itself (unit_perhaps wasn't called on it) for TEXT.
+# 'line' counts from 1.
+Event = namedtuple('Event', ['kind', 'value', 'paren', 'line'])
+
+def events(ss):
+    # type: (Iterable[str]) -> Iterator[Event]
+    """String enumerable (or open file) -> the tags and text, as we read them.
+
+    This doesn't build the tree, so it only needs memory for the tags
+    that are currently open.
+
+    >>> for e in parse.events(['Hi `b(Bob)']): print(e)
+    Event(kind='text', value='Hi ', paren=None, line=1)
+    Event(kind='open', value='b', paren=True, line=1)
+    Event(kind='text', value='Bob', paren=None, line=1)
+    Event(kind='close', value='b', paren=True, line=1)
+    """
+    return _events(ss)
+
 class Tagged:
     """Represents a tag in the document."""
     def __init__(self, tag, contents, paren=True, line=None):
@@ -104,7 +164,106 @@ class Tagged:
 
 def unit_perhaps(txt):
     # type: (str) -> Any
-    """Return a Pint Quantity if we recognize a unit, or pass through unchanged."""
+    """Return a Pint Quantity if we recognize a unit, or pass through unchanged.
+
+    The answers are remembered in unit_memo, keyed by the text.
+    """
+    if not isinstance(txt, basestring):
+        return txt
+    found = unit_memo.get(txt, _NOT_SEEN)
+    if found is _NOT_SEEN:
+        found = _find_unit(txt)
+        unit_memo[txt] = found
+    if found is None:
+        return txt
+    return found
+
+def units_perhaps(texts):
+    # type: (Iterable[str]) -> List[Any]
+    """[unit_perhaps(x) for x in texts], for a column of a table.
+
+    A column's quantities are mostly a number and the same unit: for those
+    we look the unit up once, and only convert the number. Anything else
+    goes through unit_perhaps.
+    """
+    found = {}  # type: Dict[str, Any]
+    # the other texts we've seen, often the same ones ("red", "yes")
+    others = {}  # type: Dict[str, Any]
+    ret = []
+    for txt in texts:
+        if not isinstance(txt, basestring):
+            ret.append(txt)
+            continue
+        m = _NUMBER_AND_UNIT.match(txt)
+        unit = None
+        if m is not None:
+            number, name = m.groups()
+            unit = found.get(name, _NOT_SEEN)
+            if unit is _NOT_SEEN:
+                unit = found[name] = _unit_of(name)
+        if unit is None:
+            x = others.get(txt, _NOT_SEEN)
+            if x is _NOT_SEEN:
+                x = others[txt] = unit_perhaps(txt)
+            ret.append(x)
+            continue
+        # what Pint makes of "12 km": the number, in the unit
+        ret.append(units.Quantity(_number(number), unit))
+    return ret
+
+def unit_and_magnitude(x):
+    # type: (Any) -> Optional[Tuple[Any, float]]
+    """(unit, magnitude) of a number or quantity, unit None for plain numbers; else None.
+
+    Text isn't a number here, even '12': see unit_perhaps for that.
+    """
+    if isinstance(x, (basestring, bool)):
+        return None
+    if isinstance(x, numbers.Real):
+        return (None, float(x))
+    # Only a quantity has these (and checking the type would load the units).
+    if hasattr(x, 'magnitude') and hasattr(x, 'units'):
+        if isinstance(x.magnitude, numbers.Real) and not isinstance(x.magnitude, bool):
+            return (x.units, float(x.magnitude))
+    return None
+
+# A number (that Python's tokenizer reads whole: no leading 0s), spaces and a name.
+_NUMBER_AND_UNIT = re.compile(
+    r'((?:(?:0|[1-9][0-9]*)(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)\s+([A-Za-z_][A-Za-z0-9_]*)$')
+
+def _unit_of(name):
+    # type: (str) -> Any
+    """The Unit name, if "<number> name" is a quantity; else None."""
+    if name in ('pi', 'dimensionless') or _OPERATOR_WORDS.match(name) or not _is_unit_name(name):
+        return None
+    try:
+        unit = units.parse_expression(name)
+        # offset units (degC) can't be multiplied, so Pint fails on "12 degC"
+        2 * unit
+    except Exception:
+        return None
+    if unit.unitless:
+        return None
+    return unit.units
+
+def _number(txt):
+    # type: (str) -> Any
+    """A number, like Pint reads it."""
+    try:
+        return int(txt)
+    except ValueError:
+        return float(txt)
+
+# Recent unit_perhaps answers (None for "not a quantity").
+# unit_memo.info() tells how well it's doing, unit_memo.resize() tunes it.
+unit_memo = lru.LRU(maxsize=4096)
+_NOT_SEEN = object()
+
+def _find_unit(txt):
+    # type: (str) -> Any
+    """The Pint Quantity for txt, or None if it doesn't have a unit."""
+    if not _may_have_unit(txt):
+        return None
     try:
         asunit = units.parse_expression(txt)
         # their parse also computes expressions, like "1+2" (and stores 3).
@@ -112,104 +271,168 @@ def unit_perhaps(txt):
         # are not. Also, "" is parsed into a unitless 1 and we don't want that
         # either.
         if not asunit.unitless:
-            txt = asunit
+            return asunit
     except:
         pass
-    return txt
+    return None
+
+# Characters for which we leave it all to Pint: its tokenizer treats them
+# specially (strings, comments) or they may be units themselves.
+_LEAVE_TO_PINT = re.compile(r'[\'"#\\]|[^\x00-\x7f]')
+# Numbers and names, as Pint's tokenizer sees them once it has put a '*'
+# between numbers and the letters that follow. Only names are captured.
+_NUMBER_OR_NAME = re.compile(
+    r'(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?|([A-Za-z_][A-Za-z0-9_]*)')
+# Words that Pint's preprocessing turns into operators (none are units).
+_OPERATOR_WORDS = re.compile('per|sq|cubed|cubic')
+
+def _may_have_unit(txt):
+    # type: (str) -> bool
+    """Quick check: False means Pint won't find a unit in txt.
+
+    Every name in the text has to be a unit for Pint to succeed,
+    so prose is rejected as soon as we see a word that isn't one.
+    """
+    if _LEAVE_TO_PINT.search(txt):
+        return True
+    # Pint drops the commas before reading names.
+    txt = txt.replace(',', '')
+    if _OPERATOR_WORDS.search(txt):
+        # rare enough that we can afford to do exactly what Pint does.
+        txt = string_preprocessor(txt)
+    names = [n for n in _NUMBER_OR_NAME.findall(txt) if n]
+    return bool(names) and all(_is_unit_name(n) for n in names)
+
+# name -> whether Pint knows it; bounded, since the names come from the notes.
+_unit_names = lru.LRU(maxsize=4096)
+
+def _is_unit_name(name):
+    # type: (str) -> bool
+    known = _unit_names.get(name)
+    if known is None:
+        try:
+            units.get_name(name)
+            known = True
+        except:
+            # 'pi' and 'dimensionless' are special-cased by Pint.
+            known = name in ('pi', 'dimensionless')
+        _unit_names[name] = known
+    return known
 
 
 ## Internal implementation
 
-def _min_non_negative(a,b):
-    # type: (int, int) -> int
-    if a<0: return b
-    if b<0: return a
-    return min(a, b)
-
-def _parse(lh, mytag, parens):
-    # type: (LinesHolder, str, bool) -> Tagged
-    """Parse the text, one tag at a time, recursively."""
-    ret=[]  # type: List[Union[str, Tagged]]
-    parenDepth = 1
-    while lh.hasNext():
-        s = lh.getCurrent()
-        i = s.find('`')
-        if (parens and i!=0):
+_PARENS = re.compile('[()]')
+_TAG_END = re.compile('[( \n]')
+
+class _Open(object):
+    """A tag we're inside of, while parsing."""
+    __slots__ = ['tag', 'paren', 'depth']
+    def __init__(self, tag, paren):
+        # type: (str, bool) -> None
+        self.tag = tag
+        self.paren = paren
+        # for paren tags: how many '(' are open, counting the tag's own.
+        self.depth = 1
+
+def _events(lines):
+    # type: (Iterable[str]) -> Iterator[Event]
+    """Parse the text, one tag at a time.
+
+    We keep our position in the current line as an offset rather than
+    slicing off what we've read, and the tags we're inside of on an explicit
+    stack rather than recursing, so long lines and deep nesting are fine.
+    """
+    lines = iter(lines)
+    stack = [_Open('', False)]
+    s = next(lines, None)
+    lineno = 1
+    pos = 0
+    # where the next '`' is on this line (len(s) if none, -1 if not looked yet)
+    tick = -1
+    while s is not None:
+        if pos >= len(s) and pos > 0:
+            # done with this line
+            s = next(lines, None)
+            lineno += 1
+            pos, tick = 0, -1
+            continue
+        top = stack[-1]
+        if tick < pos:
+            tick = s.find('`', pos)
+            if tick < 0: tick = len(s)
+        i = tick if tick < len(s) else -1
+        if top.paren and i != pos:
             # check if we close first
-            tgt=i
-            if (tgt<0): tgt=len(s)
-            for x in range(tgt):
-                if (s[x]==')'):
-                    parenDepth-=1
-                    if (parenDepth==0):
-                        # found the end
-                        if x>0: ret.append(unit_perhaps(s[:x]))
-                        lh.setCurrent(s[x+1:])
-                        return Tagged(mytag, ret, paren=True)
-                if (s[x]=='('):
-                    parenDepth += 1
-        if (i<0):
-            ret.append(unit_perhaps(s))
-            lh.nextLine()
+            tgt = i
+            if tgt < 0: tgt = len(s)
+            closed = False
+            for m in _PARENS.finditer(s, pos, tgt):
+                if m.group() == '(':
+                    top.depth += 1
+                    continue
+                top.depth -= 1
+                if top.depth == 0:
+                    # found the end
+                    x = m.start()
+                    if x > pos: yield Event(TEXT, s[pos:x], None, lineno)
+                    pos = x + 1
+                    stack.pop()
+                    yield Event(CLOSE, top.tag, True, lineno)
+                    closed = True
+                    break
+            if closed: continue
+        if i < 0:
+            yield Event(TEXT, s[pos:], None, lineno)
+            s = next(lines, None)
+            lineno += 1
+            pos, tick = 0, -1
             continue
-        if (i>0):
-            txt=unit_perhaps(s[:i])
-            ret.append(txt)
-            lh.setCurrent(s[i:])
+        if i > pos:
+            yield Event(TEXT, s[pos:i], None, lineno)
+            pos = i
             continue
         # we're sitting just before a tag
-        op=s.find('(')
-        sp=_min_non_negative(s.find(' '), s.find('\n'))
-        parenthese = op>=0 and (sp<0 or op<sp)
-        tag=''
-        # if both are -1 that means the tag runs against the end of line
-        if op<0 and sp<0:
-            tag = s[1:]
-            parenthese=False
-        elif parenthese:
-            tag = s[1:op]
+        # The tag name ends at the first '(', space or end of line.
+        end = _TAG_END.search(s, pos)
+        if end is None:
+            # the tag runs against the end of line
+            tag = s[pos+1:]
+            parenthese = False
         else:
-            tag = s[1:sp]
-        if tag=='/':
-            # closing tag. Let's stop the parsing.
-            lh.setCurrent(s[3:])
-            break
-        lh.setCurrent(s[len(tag)+2:])
-        inner = _parse(lh, tag, parenthese)
-        ret.append(inner)
-    return Tagged(mytag,ret, paren=parens)
-
-
-class LinesHolder:
-    """mutable holder of lines"""
-    def __init__(self,lines):
-        """expects a list or generator of strings."""
-        self.current = None
-        # list -> generator
-        if isinstance(lines, list) or isinstance(lines, tuple):
-            lines=lines.__iter__()
-        self.lines = lines
-        self.nextLine()
-    def getCurrent(self):
-        # type: () -> str
-        """Returns the current line (or None if past the end)."""
-        if not self.hasNext():
-            return ''
-        return self.current
-    def nextLine(self):
-        # type: () -> None
-        """Move to the next line."""
-        try:
-            self.current = self.lines.next()
-        except StopIteration:
-            self.current = None
-    def setCurrent(self, line):
-        # type: (str) -> None
-        """Go to next line if given '', otherwise change the current line."""
-        if line == '':
-            self.nextLine()
+            tag = s[pos+1:end.start()]
+            parenthese = end.group() == '('
+        if tag == '/':
+            # closing tag.
+            pos += 3
+            stack.pop()
+            if not stack:
+                # closing the whole document: stop the parsing.
+                return
+            yield Event(CLOSE, top.tag, top.paren, lineno)
+            continue
+        pos += len(tag) + 2
+        stack.append(_Open(tag, parenthese))
+        yield Event(OPEN, tag, parenthese, lineno)
+    # ran out of text: close whatever's still open.
+    while len(stack) > 1:
+        top = stack.pop()
+        yield Event(CLOSE, top.tag, top.paren, lineno - 1)
+
+def _build(evts):
+    # type: (Iterable[Event]) -> Tagged
+    """Events -> the Tagged tree."""
+    contents = []  # type: List[Union[str, Tagged]]
+    # for the tags that are open: (the open event, its parent's contents)
+    stack = []  # type: List[Tuple[Event, List[Union[str, Tagged]]]]
+    for e in evts:
+        if e.kind == TEXT:
+            contents.append(unit_perhaps(e.value))
+        elif e.kind == OPEN:
+            stack.append((e, contents))
+            contents = []
         else:
-            self.current = line
-    def hasNext(self):
-        # type: () -> bool
-        return self.current != None
\ No newline at end of file
+            opened, parent = stack.pop()
+            parent.append(Tagged(opened.value, contents, paren=opened.paren, line=opened.line))
+            contents = parent
+    return Tagged('', contents, paren=False)
@@ -66,4 +66,4 @@ def fixup(kb):
   rules.append( Rule(chain(['parent', 'sister']), [isalsomy('aunt')]))
   rules.append( Rule(chain(['parent', 'brother']), [isalsomy('uncle')]))
 
-  apply_rules(kb, rules)
+  apply_rules(kb, rules, fixpoint=True)
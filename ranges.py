@@ -0,0 +1,172 @@
+"""Range queries on the numeric values of an attribute, whatever their units.
+
+Values like `diameter(4900 km)` are Pint quantities. To compare them, we
+convert each one to base units once, and keep the magnitudes sorted in an
+array, one per dimensionality (a diameter in km and one in miles end up
+in the same array, a mass doesn't). Plain numbers are dimensionless.
+Then a range is two binary searches.
+
+Example:
+
+>>> kb = KB({'Mercury': {'diameter': [parse.unit_perhaps('4900 km')]},
+...          'Earth': {'diameter': [parse.unit_perhaps('12800 km')]},
+...          'Mars': {'diameter': [parse.unit_perhaps('6800 km')]}})
+>>> index(kb, 'diameter').between('5000 km', '10000 miles')
+['Mars', 'Earth']
+>>> index(kb, 'diameter').top(1)
+['Earth']
+
+The index is built once per KB version (see KB.cached).
+"""
+
+from array import array
+import bisect
+import numbers
+import parse
+from kb import KB
+from typing import Any, Dict, List, Optional, Tuple
+
+def index(kb, attribute):
+  # type: (KB, str) -> RangeIndex
+  """The RangeIndex of kb's attribute, built once per KB version."""
+  return kb.cached(('ranges', attribute), lambda k: RangeIndex(k, attribute))
+
+# Dimensionality of the values that are plain numbers.
+DIMENSIONLESS = 'dimensionless'
+
+
+class _Column(object):
+  """The values of one dimensionality, sorted by their magnitude in base units."""
+  __slots__ = ('magnitudes', 'pages', 'values')
+
+  def __init__(self, entries):
+    # type: (List[Tuple[float, str, Any]]) -> None
+    entries.sort(key=lambda e: e[0])
+    self.magnitudes = array('d', [e[0] for e in entries])
+    self.pages = [e[1] for e in entries]
+    self.values = [e[2] for e in entries]
+
+
+class RangeIndex(object):
+  """The numeric values of one attribute of a KB, for range and top-k queries.
+
+  Bounds can be quantities, or strings like '10000 km', in any unit with
+  the right dimensionality; plain numbers look among the plain numbers.
+  A page comes up once for each of its values that matches.
+  """
+
+  def __init__(self, kb, attribute):
+    # type: (KB, str) -> None
+    self.attribute = attribute
+    entries = {}  # type: Dict[Any, List[Tuple[float, str, Any]]]
+    for page, attributes in kb.items():
+      for x in attributes.get(attribute, ()):
+        key = _key(x)
+        if key is not None:
+          entries.setdefault(key[0], []).append((key[1], kb.normalize_page(page), x))
+    self._columns = dict((d, _Column(e)) for d, e in entries.items())  # type: Dict[Any, _Column]
+
+  def dimensionalities(self):
+    # type: () -> List[Any]
+    """The dimensionalities of the values we have."""
+    return list(self._columns.keys())
+
+  def __len__(self):
+    # type: () -> int
+    return sum(len(c.pages) for c in self._columns.values())
+
+  def between(self, low=None, high=None, values=False):
+    # type: (Any, Any, bool) -> List[Any]
+    """The pages with a value in [low, high], from the smallest value up.
+
+    Either bound can be None (no limit), but not both. With values=True,
+    returns (page, value) pairs.
+    """
+    column, lo, hi = self._range(low, high)
+    return self._answer(column, lo, hi, values)
+
+  def top(self, k, unit=None, values=False, smallest=False):
+    # type: (int, Any, bool, bool) -> List[Any]
+    """The k pages with the largest values (or the smallest), best first.
+
+    unit (a quantity, or a string like 'km') picks which values to look at;
+    it may be left out if they all have the same dimensionality.
+    """
+    column = self._column(_dimensionality(unit) if unit is not None else self._only())
+    n = len(column.pages) if column else 0
+    if smallest:
+      return self._answer(column, 0, min(k, n), values)
+    return self._answer(column, max(n - k, 0), n, values)[::-1]
+
+  def _range(self, low, high):
+    # type: (Any, Any) -> Tuple[Optional[_Column], int, int]
+    low_key = _bound(low) if low is not None else None
+    high_key = _bound(high) if high is not None else None
+    if low_key and high_key and low_key[0] != high_key[0]:
+      raise ValueError('%r and %r have different dimensionalities' % (low, high))
+    key = low_key or high_key
+    if key is None:
+      raise ValueError('between needs at least one bound')
+    column = self._column(key[0])
+    if column is None:
+      return None, 0, 0
+    lo = bisect.bisect_left(column.magnitudes, low_key[1]) if low_key else 0
+    hi = bisect.bisect_right(column.magnitudes, high_key[1]) if high_key else len(column.pages)
+    return column, lo, hi
+
+  def _column(self, dimensionality):
+    # type: (Any) -> Optional[_Column]
+    return self._columns.get(dimensionality)
+
+  def _only(self):
+    # type: () -> Any
+    if len(self._columns) > 1:
+      raise ValueError('%s has values of several dimensionalities (%s), pick one with unit' %
+                       (self.attribute, ', '.join(str(d) for d in self._columns)))
+    return next(iter(self._columns), None)
+
+  def _answer(self, column, lo, hi, values):
+    # type: (Optional[_Column], int, int, bool) -> List[Any]
+    if column is None or lo >= hi:
+      return []
+    if values:
+      return list(zip(column.pages[lo:hi], column.values[lo:hi]))
+    return column.pages[lo:hi]
+
+
+def _bound(b):
+  # type: (Any) -> Tuple[Any, float]
+  """_key of a bound, which may also be a string: '10000 km', or '3'."""
+  q = parse.unit_perhaps(b)  # anything but a string comes back as it is
+  if q is b and isinstance(b, (str, unicode)):
+    try:
+      q = float(b)
+    except ValueError:
+      pass
+  key = _key(q)
+  if key is None:
+    raise ValueError('%r is not a number or a quantity' % (b,))
+  return key
+
+def _key(x):
+  # type: (Any) -> Optional[Tuple[Any, float]]
+  """(dimensionality, magnitude in base units) of a number or quantity, else None."""
+  found = parse.unit_and_magnitude(x)
+  if found is None:
+    return None
+  if found[0] is None:
+    return (DIMENSIONLESS, found[1])
+  try:
+    base = x.to_base_units()
+  except (TypeError, ValueError):
+    return None  # e.g. units Pint can't convert
+  return (_dimensionality(base), float(base.magnitude))
+
+def _dimensionality(x):
+  # type: (Any) -> Any
+  """The dimensionality of a quantity or a unit name, as a hashable key."""
+  if isinstance(x, basestring):
+    x = parse.units.parse_expression(x)
+  if isinstance(x, numbers.Real) or not x.dimensionality:
+    return DIMENSIONLESS
+  return x.dimensionality
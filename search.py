@@ -0,0 +1,282 @@
+"""Full-text search over the pages, ranked with BM25.
+
+Each page is indexed under the words of its text (InfoToken.text()) and
+of its title. Its attributes (which include the tags used on the page)
+are indexed as fields, so the query can ask for them:
+
+  planet            pages that mention planet
+  isa:planet        pages whose isa attribute has the word planet
+  has:diameter      pages that have a diameter attribute (or tag)
+
+A query is a list of these; pages that match more of them, and match
+them more often, come first.
+
+>>> index = Index()
+>>> _ = index.add('Mars', 'Mars is red. isa: planet', {'isa': ['planet']})
+>>> _ = index.add('Phobos', 'A moon of Mars.', {'isa': ['moon']})
+>>> [page for page, score in index.search('mars')]
+['Mars', 'Phobos']
+>>> [page for page, score in index.search('isa:moon')]
+['Phobos']
+"""
+
+import hashlib
+import heapq
+import math
+import re
+import threading
+from kb import KB
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+def words(text):
+  # type: (unicode) -> List[unicode]
+  """The words of text, as they are indexed.
+
+  >>> words(u'Earth: 12800 km, the_earth')
+  [u'earth', u'12800', u'km', u'the_earth']
+  """
+  return _WORD.findall(text.lower())
+
+
+class Index(object):
+  """An inverted index of pages, kept up to date with update().
+
+  Searches can run in several threads; changes (update, add, remove)
+  come from one thread at a time.
+  """
+
+  # BM25 parameters: how fast repeated words stop counting, and how
+  # much long pages are penalized.
+  k1 = 1.2
+  b = 0.75
+
+  def __init__(self):
+    # type: () -> None
+    # word (or field:word) -> page -> how many times it's there
+    self._postings = {}  # type: Dict[unicode, Dict[str, int]]
+    # page -> how many words it has
+    self._lengths = {}  # type: Dict[str, int]
+    # page -> the terms it's indexed under, to remove them
+    self._terms = {}  # type: Dict[str, Dict[unicode, int]]
+    # page -> digest of what it was indexed with, to skip it if unchanged
+    self._digests = {}  # type: Dict[str, str]
+    self._total_length = 0
+    # term -> [(score, page)], best first. Any change moves every term's
+    # scores (through the number of pages and their average length), so
+    # a change drops them all: update() makes the lists searches had
+    # asked for again, the others wait for their next search.
+    self._impacts = {}  # type: Dict[unicode, List[Tuple[float, str]]]
+    # held while the index changes or is searched
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    # type: () -> int
+    return len(self._lengths)
+
+  def __contains__(self, page):
+    # type: (str) -> bool
+    return page in self._lengths
+
+  def update(self, pages, kb):
+    # type: (Dict[str, Any], KB) -> int
+    """Indexes what interpret.files returned; only pages that changed are redone.
+
+    The pages' text and terms are worked out before searches are locked
+    out, and the ranked lists are made again after: searches only wait
+    while the changes go in.
+
+    Returns how many pages were (re)indexed.
+    """
+    titles = set(pages.keys())
+    titles.update(kb.keys())
+    gone = [p for p in self._lengths if p not in titles]
+    changed = []
+    for page in titles:
+      info = pages.get(page)
+      text = info.text() if info is not None else u''
+      entry = self._entry(page, text, kb.get(page) or {})
+      if entry is not None:
+        changed.append(entry)
+    if not gone and not changed:
+      return 0
+    with self._lock:
+      asked = list(self._impacts.keys())
+      for page in gone:
+        self._remove(page)
+      for entry in changed:
+        self._put(*entry)
+    self._rank(asked)
+    return len(changed)
+
+  def add(self, page, text, fields):
+    # type: (str, unicode, Mapping[str, Iterable[Any]]) -> bool
+    """(Re)indexes page, unless it hasn't changed. True if it was indexed."""
+    entry = self._entry(page, text, fields)
+    if entry is None:
+      return False
+    with self._lock:
+      self._put(*entry)
+    return True
+
+  def _entry(self, page, text, fields):
+    # type: (str, unicode, Mapping[str, Iterable[Any]]) -> Optional[Tuple[str, str, Dict[unicode, int], int]]
+    """(page, digest, terms, length) to index page with; None if it hasn't changed."""
+    strings = sorted((name, [_unicode(x) for x in values]) for name, values in fields.items())
+    digest = hashlib.sha1(repr((text, strings)).encode('utf-8')).digest()
+    if self._digests.get(page) == digest:
+      return None
+    terms = {}  # type: Dict[unicode, int]
+    body = words(page) + words(text)
+    for w in body:
+      terms[w] = terms.get(w, 0) + 1
+    for name, values in strings:
+      name = name.lower()
+      key = u'has:' + name
+      terms[key] = terms.get(key, 0) + 1
+      for x in values:
+        for w in words(x):
+          key = name + u':' + w
+          terms[key] = terms.get(key, 0) + 1
+    return page, digest, terms, len(body)
+
+  def _put(self, page, digest, terms, length):
+    # type: (str, str, Dict[unicode, int], int) -> None
+    """Indexes page under terms, in place of what it had. Call with _lock held."""
+    self._remove(page)
+    for term, count in terms.items():
+      self._postings.setdefault(term, {})[page] = count
+    self._terms[page] = terms
+    self._lengths[page] = length
+    self._total_length += length
+    self._digests[page] = digest
+    self._impacts = {}
+
+  def remove(self, page):
+    # type: (str) -> None
+    """Forgets page (if we had it)."""
+    with self._lock:
+      self._remove(page)
+
+  def _remove(self, page):
+    # type: (str) -> None
+    """remove(), with _lock held."""
+    terms = self._terms.pop(page, None)
+    if terms is None:
+      return
+    for term in terms:
+      postings = self._postings[term]
+      del postings[page]
+      if not postings:
+        del self._postings[term]
+    self._total_length -= self._lengths.pop(page)
+    del self._digests[page]
+    self._impacts = {}
+
+  def search(self, query, limit=20):
+    # type: (unicode, int) -> List[Tuple[str, float]]
+    """The best pages for query, as (page, score), best first.
+
+    We go down each term's pages, best first, and stop as soon as the
+    pages we haven't seen can't score better than the ones we have (Fagin's
+    threshold algorithm), so common words don't mean looking at every page.
+    """
+    with self._lock:
+      return self._search(query, limit)
+
+  def _search(self, query, limit):
+    # type: (unicode, int) -> List[Tuple[str, float]]
+    terms = [t for t in _terms(query) if t in self._postings]
+    if not terms or limit <= 0:
+      return []
+    impacts = [self._impacts_of(t) for t in terms]
+    scorers = [self._scorer(t) for t in terms]
+    best = []  # type: List[Tuple[float, str]]
+    seen = set()  # type: Set[str]
+    depth = 0
+    while True:
+      threshold = 0.0
+      left = False
+      for ranked in impacts:
+        if depth >= len(ranked):
+          continue
+        left = True
+        score, page = ranked[depth]
+        threshold += score
+        if page in seen:
+          continue
+        seen.add(page)
+        total = sum(f(page) for f in scorers)
+        if len(best) < limit:
+          heapq.heappush(best, (total, page))
+        elif (total, page) > best[0]:
+          heapq.heapreplace(best, (total, page))
+      if not left or (len(best) == limit and best[0][0] >= threshold):
+        break
+      depth += 1
+    return [(page, score) for score, page in sorted(best, reverse=True)]
+
+  def _scorer(self, term):
+    # type: (unicode) -> Callable[[str], float]
+    """page -> its BM25 score for term."""
+    postings = self._postings[term]
+    n = len(self._lengths)
+    idf = math.log(1.0 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+    k1, b, lengths = self.k1, self.b, self._lengths
+    # the part of the length penalty that's the same for all pages
+    fixed = k1 * (1 - b)
+    per_word = k1 * b / (float(self._total_length) / n or 1.0)
+    def score(page):
+      tf = postings.get(page)
+      if not tf:
+        return 0.0
+      return idf * tf * (k1 + 1) / (tf + fixed + per_word * lengths[page])
+    return score
+
+  def _impacts_of(self, term):
+    # type: (unicode) -> List[Tuple[float, str]]
+    """[(score, page)] for the pages that have term, best first."""
+    ret = self._impacts.get(term)
+    if ret is None:
+      ret = self._impacts[term] = self._ranked(term)
+    return ret
+
+  def _ranked(self, term):
+    # type: (unicode) -> List[Tuple[float, str]]
+    score = self._scorer(term)
+    return sorted(((score(p), p) for p in self._postings[term]), reverse=True)
+
+  def _rank(self, terms):
+    # type: (Iterable[unicode]) -> None
+    """Makes the ranked lists of terms again, after a change.
+
+    Only changes write the postings, and they come from our thread, so
+    the sorting is done without holding _lock.
+    """
+    ranked = dict((t, self._ranked(t)) for t in terms if t in self._postings)
+    with self._lock:
+      for term, ret in ranked.items():
+        self._impacts.setdefault(term, ret)
+
+
+def _terms(query):
+  # type: (unicode) -> List[unicode]
+  """The index terms a query looks for ('isa:planet' stays a single term)."""
+  ret = []
+  for part in query.split():
+    name, colon, value = part.partition(':')
+    if not colon:
+      ret.extend(words(part))
+    elif name.lower() == 'has':
+      # attribute names are indexed whole
+      ret.append(u'has:' + value.lower())
+    else:
+      ret.extend(name.lower() + u':' + w for w in words(value))
+  return ret
+
+def _unicode(x):
+  # type: (Any) -> unicode
+  if isinstance(x, str):
+    return x.decode('utf-8', 'replace')
+  return unicode(x)
@@ -0,0 +1,93 @@
+"""Saves what we computed from the notes files, to skip the work next time.
+
+The snapshot is a pickle of whatever the build function returned (for web.py,
+the pages and the fixed-up KB). It's only used if the input files and the code
+that interprets them are exactly the same as when it was written.
+
+Example:
+
+  pages, kb = snapshot.load_or_build('notes.snapshot', ['notes.txt'], build)
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+from typing import Any, Callable, List, Optional, Tuple
+
+# Bump this when the snapshot layout changes.
+FORMAT = 1
+
+# The code that decides what ends up in the snapshot: the parser, the
+# interpretation of tags, and the rules that add facts.
+RULE_FILES = ['split.py', 'parse.py', 'interpret.py', 'kb.py', 'transform.py', 'people.py']
+
+
+def key(fnames):
+  # type: (List[str]) -> Tuple
+  """What the snapshot for these files depends on.
+
+  For each file: its path, size, modification time and content hash.
+  Then the hash of the code in RULE_FILES.
+  """
+  inputs = []
+  for f in fnames:
+    st = os.stat(f)
+    inputs.append((os.path.abspath(f), st.st_size, st.st_mtime, _hash_file(f)))
+  return (FORMAT, tuple(inputs), code_hash(RULE_FILES))
+
+
+def code_hash(modules):
+  # type: (List[str]) -> str
+  """Hash of these source files (names relative to this directory)."""
+  here = os.path.dirname(os.path.abspath(__file__))
+  ret = hashlib.sha1()
+  for f in modules:
+    ret.update(_hash_file(os.path.join(here, f)))
+  return ret.hexdigest()
+
+
+def load(path, fnames):
+  # type: (str, List[str]) -> Optional[Any]
+  """The value saved in the snapshot, or None if it's missing or out of date."""
+  if not os.path.exists(path):
+    return None
+  expected = key(fnames)
+  try:
+    with open(path, 'rb') as f:
+      if pickle.load(f) != expected:
+        return None
+      return pickle.load(f)
+  except Exception as e:  # garbled, or written by code that has since changed
+    print('Ignoring unreadable snapshot %s: %s' % (path, e))
+    return None
+
+
+def save(path, fnames, value):
+  # type: (str, List[str], Any) -> None
+  """Writes the snapshot (atomically, so readers never see half of it)."""
+  tmp = path + '.tmp'
+  with open(tmp, 'wb') as f:
+    pickle.dump(key(fnames), f, pickle.HIGHEST_PROTOCOL)
+    pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+  os.rename(tmp, path)
+
+
+def load_or_build(path, fnames, build):
+  # type: (str, List[str], Callable[[], Any]) -> Any
+  """The snapshot's value if it's up to date, otherwise build() (which is then saved)."""
+  value = load(path, fnames)
+  if value is not None:
+    print('Loaded snapshot %s' % path)
+    return value
+  value = build()
+  save(path, fnames, value)
+  return value
+
+
+def _hash_file(fname):
+  # type: (str) -> str
+  h = hashlib.sha1()
+  with open(fname, 'rb') as f:
+    for block in iter(lambda: f.read(1 << 20), b''):
+      h.update(block)
+  return h.hexdigest()
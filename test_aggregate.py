@@ -0,0 +1,69 @@
+import aggregate
+import doctest
+import interpret
+import parse
+import unittest
+from kb import KB
+
+class TestAggregate(unittest.TestCase):
+  "Tests for aggregate.py."
+
+  def setUp(self):
+    pages, self.kb = interpret.file('testdata/planets.txt')
+
+  def test_planets(self):
+    # 5.972E24 kg, and 0.107 and 0.055 earth_mass
+    mass = aggregate.collect(self.kb, aggregate.instances(self.kb, 'planet'), 'mass', 'kg')
+    self.assertEqual(sorted(mass.pages), ['Earth', 'Mars', 'Mercury'])
+    self.assertEqual(mass.rejected, [])
+    kg = parse.units.kg
+    self.assertTrue(6.9E24 * kg < mass.sum() < 7E24 * kg)
+    self.assertAlmostEqual(mass.mean().magnitude, mass.sum().magnitude / 3)
+    self.assertEqual(mass.max(), 5.972E24 * kg)
+    self.assertAlmostEqual(mass.min().to('earth_mass').magnitude, 0.055)
+    self.assertAlmostEqual(mass.percentile(50).to('earth_mass').magnitude, 0.107)
+    self.assertEqual(len(mass.percentile([0, 100]).magnitude), 2)
+
+  def test_unit_of_the_first_value(self):
+    mass = aggregate.collect(self.kb, ['Mars', 'Earth'], 'mass')
+    self.assertEqual(mass.unit, parse.units.kg)
+
+  def test_rejected(self):
+    kb = KB({'a': {'size': [parse.unit_perhaps('3 m'), '2']},
+             'b': {'size': [parse.unit_perhaps('2 s'), 'big', 5, 'nan']},
+             'c': {'size': [parse.unit_perhaps('1 km')]}})
+    size = aggregate.collect(kb, ['a', 'b', 'c', 'd'], 'size', 'm')
+    self.assertEqual(size.sum(), 1003 * parse.units.m)
+    self.assertEqual(sorted((r.page, str(r.value)) for r in size.rejected),
+                     [('a', '2'), ('b', '2 second'), ('b', '5'), ('b', 'big'), ('b', 'nan')])
+    # plain numbers
+    numbers = aggregate.collect(kb, ['a', 'b'], 'size', 'dimensionless')
+    self.assertEqual(numbers.sum().magnitude, 7)
+    self.assertEqual(aggregate.collect(KB({'a': {'n': ['2', 4]}}), ['a'], 'n').mean(), 3)
+
+  def test_empty(self):
+    mass = aggregate.collect(self.kb, [], 'mass', 'kg')
+    self.assertEqual(len(mass), 0)
+    self.assertEqual(mass.sum(), 0 * parse.units.kg)
+    self.assertEqual(mass.mean(), None)
+    self.assertEqual(mass.percentile(90), None)
+
+  def test_by_category(self):
+    kb = KB({'star': {}, 'planet': {}, 'gas giant': {'isa': ['planet']},
+             'Sun': {'isa': ['star'], 'mass': [parse.unit_perhaps('2E30 kg')]},
+             'Jupiter': {'isa': ['gas giant'], 'mass': [parse.unit_perhaps('317.8 earth_mass')]},
+             'Earth': {'isa': ['planet'], 'mass': [parse.unit_perhaps('1 earth_mass')]}})
+    found = aggregate.by_category(kb, 'mass', ['star', 'planet', 'gas giant'], 'earth_mass')
+    self.assertEqual(sorted(found['planet'].pages), ['Earth', 'Jupiter'])
+    self.assertAlmostEqual(found['planet'].mean().magnitude, 159.4)
+    self.assertEqual(len(found['gas giant']), 1)
+    self.assertTrue(found['star'].sum().magnitude > 300000)
+
+
+class TestDocs(unittest.TestCase):
+  def test_docs(self):
+    doctest.testmod(aggregate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import columnar
+import doctest
+import graph
+import interpret
+import people
+import unittest
+from kb import KB
+
+class TestColumnar(unittest.TestCase):
+  "Tests for columnar.py."
+
+  def same(self, kb):
+    c = columnar.ColumnarKB(kb)
+    self.assertEqual(sorted(c.keys()), sorted(kb.keys()))
+    for page in kb.keys():
+      self.assertEqual(dict(c[page].items()), dict((a, list(v)) for a, v in kb[page].items()))
+    names = list(kb.keys()) + list(kb.aka.keys()) + ['nothing']
+    for name in names:
+      self.assertEqual(c.normalize_page(name), kb.normalize_page(name))
+      self.assertEqual(c.has_key(name), kb.has_key(name))
+      self.assertEqual(name in c, name in kb)
+      self.assertEqual(c.get_attribute(name, 'isa'), kb.get_attribute(name, 'isa'))
+    return c
+
+  def test_people(self):
+    pages, kb = interpret.file('testdata/people.txt')
+    people.fixup(kb)
+    c = self.same(kb)
+    for page in kb.keys():
+      self.assertEqual(graph.ancestors(c, 'isa', page), graph.ancestors(kb, 'isa', page))
+    self.assertEqual(c.to_kb(), kb)
+    for page in kb.keys():
+      for attribute, values in kb[page].items():
+        for x in values:
+          self.assertEqual(c.find(attribute, x), kb.find(attribute, x))
+
+  def test_values_that_are_not_strings(self):
+    pages, kb = interpret.file('testdata/planets.txt')
+    c = self.same(kb)
+    self.assertEqual(c.get_attribute('Earth', 'mass'), kb.get_attribute('Earth', 'mass'))
+
+  def test_mixed_column(self):
+    kb = KB({'a': {'x': ['s']}, 'b': {'x': [1, 't']}, 'c': {'y': []}})
+    c = self.same(kb)
+    self.assertEqual(c['a']['x'], ['s'])
+    self.assertEqual(c['b']['x'], [1, 't'])
+    self.assertEqual(c['c']['y'], [])
+    self.assertRaises(ValueError, list, c.edges('x'))
+
+  def test_aliases(self):
+    kb = KB({'Mars': {'aka': ['red planet']}})
+    c = self.same(kb)
+    self.assertEqual(c.normalize_page('red planet'), 'Mars')
+    self.assertEqual(c['mars'], {'aka': ['red planet']})
+    self.assertRaises(KeyError, lambda: c['venus'])
+    self.assertEqual(c.get('venus'), None)
+
+  def test_edges(self):
+    c = columnar.ColumnarKB({'a': {'isa': ['b', 'c']}, 'b': {'isa': ['c']}, 'c': {}})
+    edges = dict((c.names[p], [c.names[t] for t in targets]) for p, targets in c.edges('isa'))
+    self.assertEqual(edges, {'a': ['b', 'c'], 'b': ['c']})
+    self.assertEqual(list(c.edges('nothing')), [])
+    self.assertEqual(c.page_number('c'), c.names.index('c'))
+
+  def test_read_only(self):
+    c = columnar.ColumnarKB({'a': {}})
+    def set_page():
+      c['b'] = {}
+    def del_page():
+      del c['a']
+    self.assertRaises(TypeError, set_page)
+    self.assertRaises(TypeError, del_page)
+
+
+class TestDocs(unittest.TestCase):
+  def test_docs(self):
+    doctest.testmod(columnar)
+
+
+if __name__ == '__main__':
+    unittest.main()
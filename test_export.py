@@ -0,0 +1,85 @@
+import doctest
+import export
+import interpret
+import os
+import shutil
+import tempfile
+import unittest
+import web
+
+class TestExport(unittest.TestCase):
+  "Tests for export.py."
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.pages, self.kb = web.build(['testdata/people.txt'])
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def read(self, name):
+    with open(os.path.join(self.tmp, name)) as f:
+      return f.read()
+
+  def test_export(self):
+    stats = export.export(self.pages, self.kb, self.tmp)
+    self.assertEqual(stats, export.ExportStats(len(self.kb), len(self.kb), 0))
+    self.assertTrue('<a href="get/Jill.html">Jill</a>' in self.read('index.html'))
+    joe = self.read('get/Joe.html')
+    self.assertTrue('<h1>Joe</h1>' in joe)
+    self.assertTrue('<a href="Jill.html">Jill</a>' in joe)
+
+  def test_processes(self):
+    export.export(self.pages, self.kb, self.tmp, processes=2)
+    self.assertEqual(sorted(os.listdir(os.path.join(self.tmp, 'get'))),
+                     sorted(export.filename(p) for p in self.kb.keys()))
+
+  def test_only_changes_are_rendered(self):
+    export.export(self.pages, self.kb, self.tmp)
+    self.assertEqual(export.export(self.pages, self.kb, self.tmp).rendered, 0)
+    self.kb['Joe']['isa'].append('sailor')
+    self.assertEqual(export.export(self.pages, self.kb, self.tmp).rendered, 1)
+    self.assertTrue('sailor' in self.read('get/Joe.html'))
+    os.remove(os.path.join(self.tmp, 'get', 'Bob.html'))
+    self.assertEqual(export.export(self.pages, self.kb, self.tmp).rendered, 1)
+
+  def test_tables_of_other_pages_facts(self):
+    notes = os.path.join(self.tmp, 'notes.txt')
+    with open(notes, 'w') as f:
+      f.write('[mars]\n`color(red)\n\n[venus]\n`color(white)\n\n'
+              '[planets]\n`table planets\nname, `attribute(color)\nmars\nvenus\n`/\n')
+    pages, kb = web.build([notes])
+    out = os.path.join(self.tmp, 'out')
+    export.export(pages, kb, out)
+    kb['mars']['color'] = ['blue']
+    kb.changed()
+    # planets shows mars's color, so it's rendered again
+    self.assertEqual(export.export(pages, kb, out), export.ExportStats(3, 2, 0))
+    with open(os.path.join(out, 'get', 'planets.html')) as f:
+      html = f.read()
+    self.assertTrue('<td>blue</td>' in html)
+    self.assertFalse('<td>red</td>' in html)
+
+  def test_new_page_renders_everything(self):
+    # any page may now link to it
+    export.export(self.pages, self.kb, self.tmp)
+    self.kb['Tom'] = {'isa': ['man']}
+    self.assertEqual(export.export(self.pages, self.kb, self.tmp).rendered, len(self.kb))
+    self.assertTrue('man' in self.read('get/Tom.html'))
+    del self.kb['Tom']
+    self.assertEqual(export.export(self.pages, self.kb, self.tmp).removed, 1)
+    self.assertFalse(os.path.exists(os.path.join(self.tmp, 'get', 'Tom.html')))
+
+  def test_links_to_other_names(self):
+    html = export._relink(u'<a href="the earth">x</a> <a href="http://x">y</a>', {},
+                          interpret.file('testdata/planets.txt')[1], '')
+    self.assertEqual(html, u'<a href="Earth.html">x</a> <a href="http://x">y</a>')
+
+
+class TestDocs(unittest.TestCase):
+  def test_docs(self):
+    doctest.testmod(export)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 import graph
+import transform
 import doctest
 from kb import KB
 
@@ -46,6 +47,9 @@ class TestGraph(unittest.TestCase):
         got = graph.roots_among(kb, 'isa', set(['apple', 'fruit']))
         expected = set(['apple'])
         self.assertEqual(got, expected)
+        # closures are frozensets, and can be passed as they are
+        got = graph.roots_among(kb, 'isa', graph.ancestors(kb, 'isa', 'edible'))
+        self.assertEqual(got, set(['apple', 'chocolate']))
         # a -> i -> z -> a
         #   -> j -> m, n
         #   -> k -> o, p
@@ -96,6 +100,44 @@ class TestGraph(unittest.TestCase):
             got2 = set(graph.ancestors_orequal(kb, 'E', key))
             self.assertEqual(got2, expected2)
 
+    def test_index_follows_changes(self):
+        kb = KB({'apple': {'isa': ['fruit']}, 'fruit': {}})
+        self.assertEqual(graph.predecessors(kb, 'isa', 'fruit'), ['apple'])
+        transform.addvalue(kb, 'pear', 'isa', 'fruit')
+        self.assertEqual(sorted(graph.predecessors(kb, 'isa', 'fruit')), ['apple', 'pear'])
+        self.assertEqual(graph.ancestors(kb, 'isa', 'fruit'), set(['apple', 'pear']))
+
+    def test_references_to(self):
+        kb = KB({'apple': {'isa': ['fruit', 'fruit'], 'color': 'red'},
+                 'pear': {'isa': ['fruit'], 'size': [3]}})
+        got = graph.references_to(kb, 'fruit')
+        self.assertEqual(sorted(got['isa']), ['apple', 'apple', 'pear'])
+        self.assertEqual(graph.references_to(kb, 'red'), {'color': ['apple']})
+        # duplicate values only count once as predecessors
+        self.assertEqual(sorted(graph.predecessors(kb, 'isa', 'fruit')), ['apple', 'pear'])
+
+    def test_closure_memo_follows_changes(self):
+        kb = KB({'apple': {'isa': ['fruit']}, 'fruit': {'isa': ['food']}})
+        self.assertEqual(graph.ancestors(kb, 'isa', 'food'), set(['apple', 'fruit']))
+        self.assertTrue(graph.ancestors(kb, 'isa', 'food') is graph.ancestors(kb, 'isa', 'food'))
+        transform.addvalue(kb, 'pear', 'isa', 'fruit')
+        self.assertEqual(graph.ancestors(kb, 'isa', 'food'), set(['apple', 'fruit', 'pear']))
+        self.assertEqual(graph.descendants(kb, 'isa', 'pear'), set(['pear', 'fruit', 'food']))
+
+    def test_precompute_closure(self):
+        # a -> b -> c -> b, and d -> a
+        kb = KB({'a': {'e': ['b']}, 'b': {'e': ['c']}, 'c': {'e': ['b']}, 'd': {'e': ['a']}})
+        expected = dict((f, dict((n, getattr(graph, f)(kb, 'e', n)) for n in 'abcdx'))
+                        for f in ['ancestors', 'descendants', 'neighbors', 'roots'])
+        kb.changed()
+        graph.precompute_closure(kb, 'e')
+        for f, results in expected.items():
+            for n, want in results.items():
+                self.assertEqual(getattr(graph, f)(kb, 'e', n), want)
+        # the node itself is left out, even when it's in a cycle
+        self.assertEqual(graph.ancestors(kb, 'e', 'b'), set(['a', 'c', 'd']))
+        self.assertEqual(graph.descendants(kb, 'e', 'd'), set(['a', 'b', 'c', 'd']))
+
 
 class TestDocs(unittest.TestCase):
     def test_docs(self):
@@ -3,6 +3,7 @@ import interpret
 from parse import units
 import unittest
 import graph
+from kb import KB
 from kb import unique
 from parse import unit_perhaps
 
@@ -76,6 +77,82 @@ class TestPlanets(unittest.TestCase):
     parts = interpret.split_all(foo, ',')
     self.assertEquals(parts, [['', 'name'], ['parent'], ['parent']])
 
+  def test_linkify(self):
+    k = KB({'mars': {}, 'red planet': {}, 'planet': {}, 'a<b': {}})
+    self.assertEqual(interpret.linkify('mars', k), '<a href="mars">mars</a>')
+    self.assertEqual(interpret.linkify('nothing here', k), 'nothing here')
+    self.assertEqual(interpret.linkify('mars, the red planet', k),
+      '<a href="mars">mars</a>, the <a href="red planet">red planet</a>')
+    # text around the links is escaped
+    self.assertEqual(interpret.linkify('x<y and a<b', k),
+      'x&lt;y and <a href="a&lt;b">a&lt;b</a>')
+    self.assertEqual(interpret.linkify('planetary', k),
+      '<a href="planet">planet</a>ary')
+    self.assertEqual(interpret.linkify('planetary', k, whole_words=True), 'planetary')
+
+  def test_linkify_sees_new_pages(self):
+    k = KB({'mars': {}})
+    self.assertEqual(interpret.linkify('venus', k), 'venus')
+    k['venus'] = {}
+    self.assertEqual(interpret.linkify('to venus', k), 'to <a href="venus">venus</a>')
+
+  def test_html_follows_context(self):
+    import parse
+    context = interpret.Context(KB({'mars': {}}))
+    page = interpret.info(parse.string('`b(`i(mars and venus))'), page='p', context=context)
+    self.assertEqual(page.html(), '<b><i><a href="mars">mars</a> and venus</i></b>')
+    version = context.version
+    # the KB changes: the html has to be computed again
+    context.big_kb['venus'] = {}
+    self.assertNotEqual(context.version, version)
+    self.assertEqual(page.html(),
+      '<b><i><a href="mars">mars</a> and <a href="venus">venus</a></i></b>')
+    context.big_kb = KB({})
+    self.assertEqual(page.html(), '<b><i>mars and venus</i></b>')
+    context.debug = True
+    self.assertTrue('StringToken[' in page.html())
+    self.assertEqual(page.text(), 'b: i: mars and venus')
+
+  def test_fill_from_threads(self):
+    import parse
+    import sys
+    import threading
+    text = open('testdata/planets.txt').read()
+    expected = interpret.info(parse.string(text), page='p')
+    expected = (expected.text(), expected.kb(), expected.html())
+    errors = []
+    def ask(page, what):
+      try:
+        got = getattr(page, what)()
+        if got != expected[['text', 'kb', 'html'].index(what)]:
+          errors.append((what, got))
+      except Exception as e:
+        errors.append((what, e))
+    saved = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+    try:
+      for _ in range(10):
+        page = interpret.info(parse.string(text), page='p')
+        threads = [threading.Thread(target=ask, args=(page, what))
+                   for what in ['html', 'kb', 'text'] * 3]
+        for t in threads: t.start()
+        for t in threads: t.join()
+    finally:
+      sys.setcheckinterval(saved)
+    self.assertEqual(errors, [])
+
+  def test_parallel_load(self):
+    names = ['testdata/planets.txt', 'testdata/people.txt',
+             'testdata/instancetable.txt', 'testdata/table.txt']
+    p1, kb1 = interpret.files(names)
+    p2, kb2 = interpret.files(names, processes=2)
+    self.assertEqual(kb2, kb1)
+    self.assertEqual(kb2.aka, kb1.aka)
+    self.assertEqual(sorted(p2.keys()), sorted(p1.keys()))
+    for title in p1:
+      self.assertEqual(p2[title].text(), p1[title].text())
+      self.assertEqual(p2[title].html(), p1[title].html())
+
   def test_table(self):
     p,kb=interpret.file('testdata/table.txt')
     html = p['table demo'].html()
@@ -83,6 +160,18 @@ class TestPlanets(unittest.TestCase):
     self.assertTrue('<th>' in html)
     self.assertTrue('<table' in html)
 
+  def test_table_attributes(self):
+    import parse
+    context = interpret.Context(KB({'mars': {'color': ['red']}, 'venus': {}}))
+    page = interpret.info(parse.string('`table planets\nname, `attribute(color)\nmars\nvenus\npluto\n'),
+                          page='p', context=context)
+    html = page.html()
+    self.assertTrue('<tr><th>name</th><th> `attribute(color)</th></tr>' in html)
+    self.assertTrue('<td>red</td>' in html)
+    # a page with no attributes, or none at all
+    self.assertEqual(html.count('<td>?</td>'), 2)
+    self.assertEqual(u''.join(page.html_parts()), html)
+
   def test_image(self):
     p,kb=interpret.file('testdata/img.txt')
     html = p['basic image'].html()
@@ -109,6 +198,19 @@ class TestPlanets(unittest.TestCase):
     self.assertTrue(kb.get_unique_attribute('earth', 'color') == 'blue')
     # the info is merged with that section's
     self.assertTrue(kb.get_unique_attribute('earth', 'mostly') == 'water')
+
+  def test_instance_table_text_only(self):
+    import parse
+    text = '`instance-table stars\nname, mass, color\nsun, 2e30 kg, yellow\nsun, 1 kg\n, 3 kg\nvega, 2 kg, blue\n'
+    table = parse.string(text).contents[0]
+    got = interpret.info(table, page='star').kb()
+    # the same KB as for a table with tags, which isn't read the fast way
+    tagged = parse.string(text.replace('blue', '`b(blue)')).contents[0]
+    expected = interpret.info(tagged, page='star').kb()
+    expected['vega']['color'] = ['blue']
+    self.assertEqual(got, expected)
+    # the second sun replaces the first
+    self.assertEqual(got['sun'], {'isa': ['star'], 'mass': [1 * units.kg]})
     
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
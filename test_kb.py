@@ -1,5 +1,6 @@
 import doctest
 import kb
+import pickle
 import unittest
 
 class TestKB(unittest.TestCase):
@@ -67,8 +68,89 @@ class TestKB(unittest.TestCase):
     self.assertEqual(x.is_same_page('bob', 'foo'), True)
     self.assertEqual(x.is_same_page('bob', 'foO'), False)
     # 'FOO' could be redirected to either bob or foO, spec doesn't say
+
+  def test_merge_into(self):
+    parts=[{'a': {'x': [1]}, 'b': {'y': [2]}},
+           {'a': {'x': [3], 'z': [4]}},
+           {'c': {}, 'b': {'y': [5, 6]}}]
+    acc={}
+    for p in parts:
+      ret = kb.merge_into(acc, p)
+      self.assertTrue(ret is acc)
+    self.assertEqual(acc, kb.merge(parts))
+    # the inputs are left alone
+    self.assertEqual(parts[0]['a']['x'], [1])
     
 
+  def test_pickle(self):
+    d={'a': {'b': ['c'], 'aka': ['alpha']}}
+    x = kb.KB(d)
+    x['z'] = {}
+    y = pickle.loads(pickle.dumps(x, 2))
+    self.assertTrue(isinstance(y, kb.KB))
+    self.assertEqual(y, x)
+    self.assertEqual(y.aka, x.aka)
+    self.assertEqual(y.version, x.version)
+    self.assertEqual(y['alpha']['b'], ['c'])
+    y['w'] = {}
+    self.assertEqual(y.version, x.version + 1)
+
+  def test_values(self):
+    v = kb.Values()
+    for i in range(20):
+      v.append('v%d' % (i % 10))
+    self.assertEqual(len(v), 20)
+    self.assertTrue('v3' in v)
+    self.assertFalse('v10' in v)
+    # still found after removing one of two copies, gone after both
+    v.remove('v3')
+    self.assertTrue('v3' in v)
+    v.remove('v3')
+    self.assertFalse('v3' in v)
+    v[0] = 1.0
+    self.assertTrue(1 in v)
+    # the other copy of 'v0' is still there
+    self.assertTrue('v0' in v)
+    # values that can't go in a set are still found
+    v.append(['a', 'list'])
+    self.assertTrue(['a', 'list'] in v)
+    self.assertEqual(kb.unique(kb.Values(['x'])), 'x')
+    self.assertEqual(kb.unlist(kb.Values(['x'])), 'x')
+    self.assertEqual(v, list(v))
+
+  def test_merge_into_makes_values(self):
+    acc = kb.merge_into({}, {'mars': {'isa': ['planet']}})
+    self.assertTrue(isinstance(acc['mars']['isa'], kb.Values))
+    self.assertTrue(isinstance(acc['mars']['color'], kb.Values))
+
+  def test_find(self):
+    k = kb.KB({'Mars': {'isa': ['planet'], 'aka': ['red planet'], 'moons': [2]},
+               'Venus': {'isa': ['Planet'], 'moons': [0]},
+               'Phobos': {'orbits': ['red planet']}, 'planet': {}})
+    self.assertEqual(k.find('isa', 'planet'), frozenset(['Mars', 'Venus']))
+    self.assertEqual(k.find('orbits', 'Mars'), frozenset(['Phobos']))
+    self.assertEqual(k.find('moons', 2), frozenset(['Mars']))
+    self.assertEqual(k.find('isa', 'moon'), frozenset())
+    self.assertEqual(k.find('isa', ['not', 'hashable']), frozenset())
+
+  def test_find_follows_changes(self):
+    k = kb.KB({'Mars': {'isa': ['planet']}})
+    self.assertEqual(k.find('isa', 'planet'), frozenset(['Mars']))
+    k['Venus'] = {'isa': ['planet']}
+    self.assertEqual(k.find('isa', 'planet'), frozenset(['Mars', 'Venus']))
+    k['Earth'] = {}
+    k['Earth']['isa'] = ['planet']
+    k.note_value('Earth', 'isa', 'planet')
+    self.assertEqual(k.find('isa', 'planet'), frozenset(['Mars', 'Venus', 'Earth']))
+    kb.merge_into(k, {'Ceres': {'isa': ['planet']}, 'Mars': {'isa': ['red thing']}})
+    self.assertEqual(k.find('isa', 'planet'), frozenset(['Mars', 'Venus', 'Earth', 'Ceres']))
+    self.assertEqual(k.find('isa', 'red thing'), frozenset(['Mars']))
+    # modified directly: changed() makes find look again
+    k['Ceres']['isa'] = ['dwarf planet']
+    k.changed()
+    self.assertEqual(k.find('isa', 'planet'), frozenset(['Mars', 'Venus', 'Earth']))
+
+
 class TestDocs(unittest.TestCase):
     def test_docs(self):
         doctest.testmod(kb)
@@ -0,0 +1,47 @@
+import doctest
+import loadtest
+import threading
+import unittest
+import web
+
+class TestLoadTest(unittest.TestCase):
+  "Tests for loadtest.py, against web.py in this process."
+
+  def setUp(self):
+    web.load(['testdata/planets.txt'])
+    web.rendered.clear()
+    self.server = web.serve(web.make_app(), port=0, threads=4, start_loop=False)
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.start()
+    self.base = 'http://127.0.0.1:%d' % self.server.server_port
+
+  def tearDown(self):
+    # Paste's server checks this between requests: make one more to stop it
+    self.server.running = False
+    loadtest.fetch(self.base + '/stats')
+    self.server.server_close()
+    self.thread.join()
+
+  def test_run(self):
+    paths = loadtest.page_paths(self.base, 3)
+    self.assertEqual(len(paths), 4)
+    self.assertEqual(paths[0], '/get/')
+    results, elapsed = loadtest.run(self.base, paths, 20, 3)
+    self.assertEqual([r.path for r in results], paths * 5)
+    self.assertEqual(set(r.status for r in results), set([200]))
+    lines = loadtest.report(results, elapsed)
+    self.assertEqual([line.split()[0] for line in lines[1:]], ['index', 'pages', 'all'])
+    self.assertEqual(int(lines[-1].split()[1]), 20)
+
+  def test_stats(self):
+    self.assertEqual(loadtest.fetch(self.base + '/stats')[0], 200)
+    self.assertEqual(loadtest.fetch(self.base + '/nothing/here')[0], 404)
+
+
+class TestDocs(unittest.TestCase):
+  def test_docs(self):
+    doctest.testmod(loadtest)
+
+
+if __name__ == '__main__':
+    unittest.main()
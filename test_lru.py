@@ -0,0 +1,70 @@
+import doctest
+import lru
+import unittest
+
+class TestLRU(unittest.TestCase):
+  "Tests for lru.py."
+
+  def test_forgets_oldest(self):
+    memo = lru.LRU(maxsize=3)
+    for k in 'abcd':
+      memo[k] = k.upper()
+    self.assertFalse('a' in memo)
+    self.assertEqual(len(memo), 3)
+    # using 'b' makes 'c' the oldest
+    self.assertEqual(memo.get('b'), 'B')
+    memo['e'] = 'E'
+    self.assertTrue('b' in memo)
+    self.assertFalse('c' in memo)
+
+  def test_counters(self):
+    memo = lru.LRU(maxsize=3)
+    memo.get('x')
+    memo['x'] = 1
+    memo.get('x')
+    memo.get('x')
+    self.assertEqual(memo.info(), lru.CacheInfo(2, 1, 3, 1))
+    memo.clear()
+    self.assertEqual(memo.info(), lru.CacheInfo(0, 0, 3, 0))
+
+  def test_resize(self):
+    memo = lru.LRU(maxsize=3)
+    for k in 'abc':
+      memo[k] = k
+    memo.resize(1)
+    self.assertEqual(len(memo), 1)
+    self.assertTrue('c' in memo)
+
+  def test_threads(self):
+    import sys
+    import threading
+    memo = lru.LRU(maxsize=50)
+    errors = []
+    def work(n):
+      try:
+        for i in range(3000):
+          key = (i * n) % 80
+          if memo.get(key) is None:
+            memo[key] = i
+      except Exception as e:
+        errors.append(e)
+    saved = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+    try:
+      threads = [threading.Thread(target=work, args=(n,)) for n in range(1, 7)]
+      for t in threads: t.start()
+      for t in threads: t.join()
+    finally:
+      sys.setcheckinterval(saved)
+    self.assertEqual(errors, [])
+    self.assertEqual(len(memo), 50)
+    info = memo.info()
+    self.assertEqual(info.hits + info.misses, 6 * 3000)
+
+
+class TestDocs(unittest.TestCase):
+    def test_docs(self):
+        doctest.testmod(lru)
+
+if __name__ == '__main__':
+    unittest.main()
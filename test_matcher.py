@@ -0,0 +1,40 @@
+import doctest
+import matcher
+import unittest
+
+class TestMatcher(unittest.TestCase):
+  "Tests for matcher.py."
+
+  def test_find_all(self):
+    m = matcher.Matcher(['he', 'she', 'his', 'hers'])
+    got = sorted(m.find_all('ushers'))
+    self.assertEqual(got, [(1, 4), (2, 4), (2, 6)])
+
+  def test_longest_wins(self):
+    m = matcher.Matcher(['red', 'red planet', 'planet'])
+    text = 'the red planet and a red car'
+    got = [text[s:e] for s, e in m.longest(text)]
+    self.assertEqual(got, ['red planet', 'red'])
+
+  def test_leftmost_wins_ties(self):
+    m = matcher.Matcher(['abc', 'cde'])
+    self.assertEqual(m.longest('abcde'), [(0, 3)])
+
+  def test_no_words(self):
+    m = matcher.Matcher([])
+    self.assertEqual(m.longest('anything'), [])
+    m = matcher.Matcher([''])
+    self.assertEqual(m.longest('anything'), [])
+
+  def test_whole_words(self):
+    m = matcher.Matcher(['mars', 'ars'])
+    self.assertEqual(m.longest('marsupial mars', whole_words=True), [(10, 14)])
+    self.assertEqual(m.longest('(mars)', whole_words=True), [(1, 5)])
+
+
+class TestDocs(unittest.TestCase):
+    def test_docs(self):
+        doctest.testmod(matcher)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
 import doctest
 import parse
+import pickle
+import subprocess
+import sys
 from parse import Tagged
 import unittest
 
@@ -63,6 +66,118 @@ class TestParse(unittest.TestCase):
     x=parse.strings(ss)
     self.assertEqual(len(x.contents), 2)
 
+  def test_deep_nesting(self):
+    depth = 5 * sys.getrecursionlimit()
+    x = parse.string('`b(' * depth + 'deep' + ')' * depth + ' after')
+    self.assertEqual(x.contents[-1], ' after')
+    for _ in range(depth):
+      self.assertEqual(len(x.contents[0].contents), 1)
+      x = x.contents[0]
+    self.assertEqual(x.tag, 'b')
+    self.assertEqual(x.contents, ['deep'])
+
+  def test_parens_inside_paren_tag(self):
+    x = parse.string('`b(f(x) = (1)) rest')
+    self.assertEqual(x.contents[0].contents, ['f(x) = (1)'])
+    self.assertEqual(x.contents[1], ' rest')
+
+  def test_unclosed_tags(self):
+    x = parse.strings(['`b(never `i closed\n', 'still inside'])
+    self.assertEqual(str(x), '`b(never `i closed\nstill inside`/ )')
+
+  def test_close_at_top_level_stops(self):
+    x = parse.strings(['before `/ \n', 'ignored'])
+    self.assertEqual(x.contents, ['before '])
+
+  def test_empty_lines(self):
+    x = parse.strings(['', 'a', ''])
+    self.assertEqual(x.contents, ['', 'a', ''])
+
+  def test_events(self):
+    evts = list(parse.events(['hello `b\n', 'world`/ `i(x)\n']))
+    self.assertEqual([(e.kind, e.value, e.line) for e in evts], [
+      (parse.TEXT, 'hello ', 1),
+      (parse.OPEN, 'b', 1),
+      (parse.TEXT, 'world', 2),
+      (parse.CLOSE, 'b', 2),
+      (parse.OPEN, 'i', 2),
+      (parse.TEXT, 'x', 2),
+      (parse.CLOSE, 'i', 2),
+      (parse.TEXT, '\n', 2)])
+    self.assertEqual(evts[1].paren, False)
+    self.assertEqual(evts[4].paren, True)
+
+  def test_events_close_unclosed_tags(self):
+    evts = list(parse.events(['`a(`b(x', 'y']))
+    self.assertEqual([(e.kind, e.value, e.line) for e in evts[-2:]],
+      [(parse.CLOSE, 'b', 2), (parse.CLOSE, 'a', 2)])
+
+  def test_events_pick_tags(self):
+    lines = ['[Bob]\n', 'Some text `aka(Bobby) and `isa(person)\n', '`aka(Robert)\n']
+    akas = []
+    inside = None
+    for e in parse.events(lines):
+      if e.kind == parse.OPEN: inside = e.value
+      elif e.kind == parse.CLOSE: inside = None
+      elif inside == 'aka': akas.append((e.value, e.line))
+    self.assertEqual(akas, [('Bobby', 2), ('Robert', 3)])
+
+  def test_tagged_line(self):
+    x = parse.strings(['hello\n', 'the `b(world)\n'])
+    self.assertEqual(x.contents[2].line, 2)
+
+  def test_unit_perhaps(self):
+    self.assertEqual(parse.unit_perhaps('12 km'), 12 * parse.units.km)
+    self.assertEqual(parse.unit_perhaps('0.5 earth_mass'), 0.5 * parse.units.earth_mass)
+    for s in ['', 'blue', 'Planets are big balls of dirt.', '555-1234', '12']:
+      self.assertEqual(parse.unit_perhaps(s), s)
+    self.assertEqual(parse.unit_perhaps(12), 12)
+
+  def test_units_perhaps(self):
+    column = ['12 km', '3.5 km', '1e3 km', '007 km', '4 degC', '2 percent', 'blue', '12', '', 12, '3 miles per hour']
+    got = parse.units_perhaps(column)
+    for x, expected in zip(got, [parse.unit_perhaps(s) for s in column]):
+      self.assertEqual(repr(x), repr(expected))
+      self.assertEqual(type(getattr(x, 'magnitude', x)), type(getattr(expected, 'magnitude', expected)))
+
+  def test_unit_and_magnitude(self):
+    km = parse.unit_perhaps('12 km')
+    self.assertEqual(parse.unit_and_magnitude(km), (km.units, 12.0))
+    self.assertEqual(parse.unit_and_magnitude(3), (None, 3.0))
+    for x in ['12', True, None, [1]]:
+      self.assertEqual(parse.unit_and_magnitude(x), None)
+
+  def test_unit_memo(self):
+    parse.unit_memo.clear()
+    parse.unit_perhaps('hello there')
+    parse.unit_perhaps('hello there')
+    x = parse.unit_perhaps('3 kg')
+    y = parse.unit_perhaps('3 kg')
+    self.assertEqual(x, y)
+    info = parse.unit_memo.info()
+    self.assertEqual((info.hits, info.misses, info.currsize), (2, 2, 2))
+
+  def test_prose_is_not_a_unit(self):
+    self.assertFalse(parse._may_have_unit('Planets orbit a star'))
+    self.assertFalse(parse._may_have_unit('1+2'))
+    self.assertTrue(parse._may_have_unit('12 km'))
+    self.assertTrue(parse._may_have_unit('5.972E24 kg'))
+    self.assertTrue(parse._may_have_unit('3 miles per hour'))
+
+
+  def test_units_are_lazy(self):
+    # in a fresh interpreter, since other tests here use units.
+    out = subprocess.check_output([sys.executable, '-c',
+      'import parse; print(type(parse.units).__name__); parse.units.km; print(type(parse.units).__name__)'])
+    self.assertEqual(out.split(), ['_LazyUnitRegistry', 'UnitRegistry'])
+
+  def test_quantities_pickle(self):
+    q = parse.unit_perhaps('2 earth_mass')
+    back = pickle.loads(pickle.dumps(q, 2))
+    self.assertEqual(back, q)
+    self.assertTrue(back.to('kg') > parse.unit_perhaps('1E25 kg'))
+
+
 class TestDocs(unittest.TestCase):
     def test_docs(self):
         doctest.testmod(parse, globs={'parse':parse})
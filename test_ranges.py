@@ -0,0 +1,57 @@
+import doctest
+import interpret
+import parse
+import ranges
+import unittest
+from kb import KB
+
+class TestRanges(unittest.TestCase):
+  "Tests for ranges.py."
+
+  def setUp(self):
+    pages, self.kb = interpret.file('testdata/planets.txt')
+
+  def test_between(self):
+    diameter = ranges.index(self.kb, 'diameter')
+    self.assertEqual(diameter.between('5000 km', '7000 km'), ['Mars'])
+    # any unit with the same dimensionality
+    self.assertEqual(diameter.between(parse.unit_perhaps('4000 miles')), ['Mars', 'Earth'])
+    self.assertEqual(diameter.between(high='4900 km'), ['Mercury'])
+    self.assertEqual(diameter.between('1 kg'), [])
+    self.assertRaises(ValueError, diameter.between, '1 km', '1 kg')
+    self.assertRaises(ValueError, diameter.between, 'big')
+    self.assertRaises(ValueError, diameter.between)
+
+  def test_units_are_converted(self):
+    # 0.055 and 0.107 earth_mass, and 5.972E24 kg
+    mass = ranges.index(self.kb, 'mass')
+    self.assertEqual(mass.top(3), ['Earth', 'Mars', 'Mercury'])
+    self.assertEqual(mass.top(1, smallest=True, values=True),
+                     [('Mercury', parse.unit_perhaps('0.055 earth_mass'))])
+    self.assertEqual(mass.between('1e24 kg'), ['Earth'])
+
+  def test_dimensionalities(self):
+    kb = KB({'a': {'size': [parse.unit_perhaps('3 m'), 2]},
+             'b': {'size': [parse.unit_perhaps('2 s'), 'big', 5]},
+             'c': {'size': [parse.unit_perhaps('1 km')]}})
+    size = ranges.index(kb, 'size')
+    self.assertEqual(len(size.dimensionalities()), 3)
+    self.assertRaises(ValueError, size.top, 1)
+    self.assertEqual(size.top(1, 'inch'), ['c'])
+    self.assertEqual(size.top(5, 'hour'), ['b'])
+    self.assertEqual(size.between(1, 3), ['a'])
+    self.assertEqual(size.between('1'), ['a', 'b'])
+
+  def test_follows_changes(self):
+    diameter = ranges.index(self.kb, 'diameter')
+    self.kb['Jupiter'] = {'diameter': [parse.unit_perhaps('140000 km')]}
+    self.assertEqual(ranges.index(self.kb, 'diameter').top(1), ['Jupiter'])
+
+
+class TestDocs(unittest.TestCase):
+  def test_docs(self):
+    doctest.testmod(ranges)
+
+
+if __name__ == '__main__':
+    unittest.main()
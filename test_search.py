@@ -0,0 +1,67 @@
+import doctest
+import interpret
+import search
+import unittest
+from kb import KB
+
+class TestIndex(unittest.TestCase):
+  "Tests for search.py."
+
+  def test_planets(self):
+    pages, kb = interpret.file('testdata/planets.txt')
+    index = search.Index()
+    self.assertEqual(index.update(pages, kb), len(kb))
+    found = [page for page, score in index.search('red planet')]
+    self.assertEqual(found[0], 'Mars')
+    self.assertEqual(sorted(p for p, s in index.search('isa:planet')), ['Earth', 'Mars', 'Mercury'])
+    self.assertEqual(sorted(p for p, s in index.search('has:aka')), ['Earth', 'Mars'])
+    self.assertEqual(index.search('diameter:12800'), index.search('DIAMETER:12800 km')[:1])
+    self.assertEqual(index.search('nothing'), [])
+
+  def test_ranking(self):
+    index = search.Index()
+    index.add('a', 'moon moon moon', {})
+    index.add('b', 'moon and a lot of other words about other things', {})
+    index.add('c', 'no match here', {})
+    self.assertEqual([p for p, s in index.search('moon')], ['a', 'b'])
+    # rare words count more
+    index.add('d', 'moon crater', {})
+    self.assertEqual(index.search('moon crater')[0][0], 'd')
+    self.assertEqual(len(index.search('moon', limit=2)), 2)
+
+  def test_update_only_redoes_changes(self):
+    kb = KB({'a': {'isa': ['planet']}, 'b': {'isa': ['moon']}})
+    index = search.Index()
+    self.assertEqual(index.update({}, kb), 2)
+    self.assertEqual(index.update({}, kb), 0)
+    kb = KB({'a': {'isa': ['planet']}, 'c': {'isa': ['moon']}})
+    self.assertEqual(index.update({}, kb), 1)
+    self.assertEqual([p for p, s in index.search('isa:moon')], ['c'])
+    self.assertFalse('b' in index)
+    self.assertEqual(len(index), 2)
+
+  def test_update_ranks_what_was_searched(self):
+    index = search.Index()
+    index.update({}, KB({'a': {'isa': ['moon']}, 'b': {'isa': ['planet']}}))
+    index.search('isa:moon')
+    index.update({}, KB({'a': {'isa': ['moon']}, 'c': {'isa': ['moon']}}))
+    # ready for the next search, with the new pages
+    self.assertEqual(sorted(p for s, p in index._impacts[u'isa:moon']), ['a', 'c'])
+    self.assertFalse(u'isa:planet' in index._impacts)
+
+  def test_remove(self):
+    index = search.Index()
+    index.add('a', 'moon', {'isa': ['moon']})
+    index.remove('a')
+    index.remove('a')
+    self.assertEqual(index.search('moon isa:moon has:isa'), [])
+    self.assertEqual(index._postings, {})
+
+
+class TestDocs(unittest.TestCase):
+  def test_docs(self):
+    doctest.testmod(search)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import doctest
+import os
+import shutil
+import snapshot
+import tempfile
+import unittest
+
+class TestSnapshot(unittest.TestCase):
+  "Tests for snapshot.py."
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.notes = os.path.join(self.tmp, 'notes.txt')
+    self.snap = os.path.join(self.tmp, 'notes.snapshot')
+    with open(self.notes, 'w') as f:
+      f.write('[mars]\n`isa(planet)\n')
+    self.builds = 0
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def build(self):
+    self.builds += 1
+    with open(self.notes) as f:
+      return f.read()
+
+  def test_reuses_snapshot(self):
+    first = snapshot.load_or_build(self.snap, [self.notes], self.build)
+    second = snapshot.load_or_build(self.snap, [self.notes], self.build)
+    self.assertEqual(first, second)
+    self.assertEqual(self.builds, 1)
+
+  def test_rebuilds_when_file_changes(self):
+    snapshot.load_or_build(self.snap, [self.notes], self.build)
+    with open(self.notes, 'w') as f:
+      f.write('[venus]\n`isa(planet)\n')
+    got = snapshot.load_or_build(self.snap, [self.notes], self.build)
+    self.assertEqual(self.builds, 2)
+    self.assertTrue('venus' in got)
+
+  def test_ignores_garbage(self):
+    with open(self.snap, 'w') as f:
+      f.write('not a pickle')
+    self.assertEqual(snapshot.load(self.snap, [self.notes]), None)
+
+
+class TestDocs(unittest.TestCase):
+  def test_docs(self):
+    doctest.testmod(snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
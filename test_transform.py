@@ -0,0 +1,91 @@
+import doctest
+import unittest
+import transform
+from kb import KB
+from transform import Rule, the, chain, imtheir, isalsomy, isa, ofa
+
+class TestTransform(unittest.TestCase):
+  "Tests for transform.py."
+
+  def ancestry(self):
+    # each one's parent is the next, and ancestors are parents of parents...
+    kb = KB(dict(('p%d' % i, {'parent': ['p%d' % (i + 1)]}) for i in range(6)))
+    kb['p6'] = {}
+    rules = [Rule(the('parent'), [isalsomy('ancestor')]),
+             Rule(chain(['ancestor', 'parent']), [isalsomy('ancestor')])]
+    return kb, rules
+
+  def test_single_pass_is_incomplete(self):
+    kb, rules = self.ancestry()
+    self.assertEqual(transform.apply_rules(kb, rules), None)
+    self.assertTrue(len(kb['p0']['ancestor']) < 6)
+
+  def test_fixpoint(self):
+    kb, rules = self.ancestry()
+    stats = transform.apply_rules(kb, rules, fixpoint=True)
+    self.assertEqual(sorted(kb['p0']['ancestor']), ['p%d' % i for i in range(1, 7)])
+    self.assertEqual(sorted(kb['p4']['ancestor']), ['p5', 'p6'])
+    # 6 parents, and 1+2+3+4+5 ancestors further up
+    self.assertEqual(stats.derived, [6, 15])
+    # running it again finds nothing new, after one round
+    stats = transform.apply_rules(kb, rules, fixpoint=True)
+    self.assertEqual(stats.derived, [0, 0])
+    self.assertEqual(stats.rounds, 1)
+
+  def test_fixpoint_new_pages(self):
+    # the first rule creates 'bob', and the second then applies to him
+    kb = KB({'alice': {'son': ['bob']}})
+    rules = [Rule(the('son'), [isa('man'), imtheir('parent')]),
+             Rule(the('parent', ofa('man')), [isalsomy('parent_of_this_man')])]
+    transform.apply_rules(kb, rules, fixpoint=True)
+    self.assertEqual(kb['bob']['isa'], ['man'])
+    self.assertEqual(kb['bob']['parent_of_this_man'], ['alice'])
+
+  def test_fixpoint_bumps_version(self):
+    kb, rules = self.ancestry()
+    version = kb.version
+    transform.apply_rules(kb, rules, fixpoint=True)
+    self.assertTrue(kb.version > version)
+
+  def test_triggers(self):
+    self.assertEqual(the('sister').triggers, ['sister'])
+    self.assertEqual(the('parent', ofa('man')).triggers, ['parent', 'isa'])
+    self.assertEqual(chain(['parent', 'sister']).triggers, ['parent'])
+    self.assertEqual(transform.hasa('car').triggers, ['car'])
+
+  def test_rules_only_run_on_pages_with_triggers(self):
+    seen = []
+    def rule(kb, k):
+      seen.append(k)
+      return kb[k].get('sister', [])
+    kb = KB({'ann': {'sister': ['beth']}, 'beth': {}, 'rock': {'isa': ['thing']}})
+    rules = [Rule(transform.triggers(rule, ['sister']), [isa('woman')]),
+             Rule(lambda kb, k: [], [])]
+    transform.apply_rules(kb, rules)
+    self.assertEqual(seen, ['ann'])
+    self.assertEqual(kb['beth']['isa'], ['woman'])
+
+  def test_rule_fires_on_attribute_added_to_same_page(self):
+    # the first rule gives ann a 'sister', so the second one fires on her too
+    kb = KB({'ann': {'isa': ['woman']}, 'beth': {}})
+    rules = [Rule(transform.hasa('isa'), [isalsomy('sister')]),
+             Rule(the('sister'), [isa('sister')])]
+    transform.apply_rules(kb, rules)
+    self.assertEqual(kb['ann']['isa'], ['woman', 'sister'])
+
+  def test_addvalue_keeps_find_up_to_date(self):
+    kb = KB({'ann': {'sister': ['beth']}})
+    self.assertEqual(kb.find('sister', 'beth'), frozenset(['ann']))
+    transform.addvalue(kb, 'beth', 'sister', 'ann')
+    transform.addvalue(kb, 'cleo', 'sister', 'ann')
+    self.assertEqual(kb.find('sister', 'ann'), frozenset(['beth', 'cleo']))
+    self.assertEqual(kb.find('sister', 'beth'), frozenset(['ann']))
+
+
+class TestDocs(unittest.TestCase):
+  def test_docs(self):
+    doctest.testmod(transform)
+
+
+if __name__ == '__main__':
+    unittest.main()
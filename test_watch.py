@@ -0,0 +1,101 @@
+import doctest
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import watch
+
+class TestNotes(unittest.TestCase):
+  "Tests for watch.py."
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.fname = os.path.join(self.tmp, 'notes.txt')
+    self.write('[mars]\n`isa(planet)\n\n[venus]\n`isa(planet)\n')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def write(self, text):
+    with open(self.fname, 'w') as f:
+      f.write(text)
+    # make sure the change is visible even if the clock is coarse
+    st = os.stat(self.fname)
+    os.utime(self.fname, (st.st_atime, st.st_mtime + 10 * len(text)))
+
+  def test_load(self):
+    notes = watch.Notes([self.fname])
+    pages, kb = notes.state
+    self.assertEqual(sorted(pages.keys()), ['mars', 'venus'])
+    self.assertEqual(kb['venus']['isa'], ['planet'])
+
+  def test_nothing_changed(self):
+    notes = watch.Notes([self.fname])
+    before = notes.state
+    self.assertEqual(notes.reload(), watch.ReloadStats(0, 0, 0))
+    self.assertTrue(notes.state is before)
+
+  def test_only_changed_sections_are_parsed(self):
+    notes = watch.Notes([self.fname])
+    old_pages, old_kb = notes.state
+    self.write('[mars]\n`isa(planet)\n\n[venus]\n`isa(hot planet)\n\n[pluto]\n`isa(dwarf)\n')
+    self.assertEqual(notes.reload(), watch.ReloadStats(1, 3, 2))
+    pages, kb = notes.state
+    self.assertEqual(kb['venus']['isa'], ['hot planet'])
+    self.assertEqual(kb['pluto']['isa'], ['dwarf'])
+    # the previous state is left alone
+    self.assertEqual(old_kb['venus']['isa'], ['planet'])
+    self.assertFalse('pluto' in old_pages)
+
+  def test_removed_section(self):
+    notes = watch.Notes([self.fname])
+    self.write('[mars]\n`isa(planet)\n')
+    notes.reload()
+    pages, kb = notes.state
+    self.assertEqual(list(pages.keys()), ['mars'])
+    self.assertFalse('venus' in kb)
+
+  def test_deleted_file(self):
+    other = os.path.join(self.tmp, 'other.txt')
+    with open(other, 'w') as f:
+      f.write('[pluto]\n`isa(dwarf)\n')
+    notes = watch.Notes([self.fname, other])
+    os.remove(other)
+    self.write('[mars]\n`isa(red planet)\n')
+    self.assertEqual(notes.reload(), watch.ReloadStats(2, 1, 1))
+    pages, kb = notes.state
+    self.assertEqual(list(pages.keys()), ['mars'])
+    self.assertEqual(kb['mars']['isa'], ['red planet'])
+    self.assertFalse('pluto' in kb)
+    self.assertEqual(notes.reload(), watch.ReloadStats(0, 0, 0))
+    # back again
+    with open(other, 'w') as f:
+      f.write('[pluto]\n`isa(dwarf)\n')
+    self.assertEqual(notes.reload(), watch.ReloadStats(1, 2, 1))
+
+  def test_watch_calls_on_reload(self):
+    notes = watch.Notes([self.fname])
+    reloaded = threading.Event()
+    notes.watch(0.01, on_reload=reloaded.set)
+    self.write('[mars]\n`isa(planet)\n')
+    self.assertTrue(reloaded.wait(5))
+    self.assertEqual(list(notes.state[0].keys()), ['mars'])
+
+  def test_fixup_runs_on_new_kb(self):
+    def fixup(kb):
+      for page in list(kb.keys()):
+        kb[page]['seen'].append(True)
+    notes = watch.Notes([self.fname], fixup=fixup)
+    self.write('[mars]\n`isa(planet)\n')
+    notes.reload()
+    self.assertEqual(notes.state[1]['mars']['seen'], [True])
+
+
+class TestDocs(unittest.TestCase):
+  def test_docs(self):
+    doctest.testmod(watch)
+
+
+if __name__ == '__main__':
+    unittest.main()
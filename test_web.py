@@ -0,0 +1,127 @@
+import doctest
+import threading
+import unittest
+import web
+import webapp2
+
+class TestGet(unittest.TestCase):
+  "Tests for the /get/ pages of web.py."
+
+  def setUp(self):
+    web.load(['testdata/planets.txt'])
+    web.rendered.clear()
+    self.app = webapp2.WSGIApplication([('/get/(.*)', web.Get)])
+
+  def get(self, path, **headers):
+    return webapp2.Request.blank(path, headers=headers).get_response(self.app)
+
+  def test_page(self):
+    r = self.get('/get/Mars')
+    self.assertEqual(r.status_int, 200)
+    self.assertTrue('<h1>Mars</h1>' in r.body)
+    self.assertTrue(r.headers['ETag'])
+    self.assertTrue(r.headers['Last-Modified'])
+    self.assertTrue('<a href="Earth">' in self.get('/get/').body)
+
+  def test_not_modified(self):
+    r = self.get('/get/Mars')
+    self.assertEqual(self.get('/get/Mars', **{'If-None-Match': r.headers['ETag']}).status_int, 304)
+    self.assertEqual(self.get('/get/Mars', **{'If-Modified-Since': r.headers['Last-Modified']}).status_int, 304)
+    self.assertEqual(self.get('/get/Mars', **{'If-None-Match': '"old"'}).body, r.body)
+    self.assertEqual(self.get('/get/Earth', **{'If-None-Match': r.headers['ETag']}).status_int, 200)
+    # the KB changed in place: what they have may be out of date
+    earth = self.get('/get/Earth')
+    web.kb['Earth']['moons'] = ['the moon']
+    web.kb.changed()
+    r = self.get('/get/Earth', **{'If-Modified-Since': earth.headers['Last-Modified']})
+    self.assertEqual(r.status_int, 200)
+    self.assertTrue('the moon' in r.body)
+
+  def test_cache(self):
+    self.get('/get/Mars')
+    self.get('/get/Mars')
+    self.assertEqual(web.rendered.info().hits, 1)
+    # the KB changed: render again, with a new ETag only if the page changed
+    etag = self.get('/get/Earth').headers['ETag']
+    web.kb['Earth']['moons'] = ['the moon']
+    web.kb.changed()
+    self.assertNotEqual(self.get('/get/Earth').headers['ETag'], etag)
+    self.assertEqual(web.rendered.info().misses, 3)
+
+  def test_stream(self):
+    html = self.get('/get/Mars').body
+    web.rendered.clear()
+    saved, web.stream_above = web.stream_above, 10
+    try:
+      r = self.get('/get/Mars')
+    finally:
+      web.stream_above = saved
+    # too big to keep: sent all the same, but not cached
+    self.assertEqual(r.status_int, 200)
+    self.assertEqual(r.body, html)
+    self.assertFalse('ETag' in r.headers)
+    self.assertEqual(len(web.rendered), 0)
+
+
+class TestBusy(unittest.TestCase):
+  "Tests for the limit on renders at a time in web.py."
+
+  def setUp(self):
+    web.load(['testdata/planets.txt'])
+    web.rendered.clear()
+    self.app = webapp2.WSGIApplication([('/get/(.*)', web.Get)])
+    self.saved = web.render_slots
+    web.render_slots = web.Slots(1)
+
+  def tearDown(self):
+    web.render_slots = self.saved
+
+  def get(self, path):
+    return webapp2.Request.blank(path).get_response(self.app)
+
+  def test_busy(self):
+    web.render_slots.take()
+    r = self.get('/get/Mars')
+    self.assertEqual(r.status_int, 503)
+    self.assertEqual(r.headers['Retry-After'], '1')
+    self.assertEqual(web.render_slots.turned_away, 1)
+    web.render_slots.give_back()
+    self.assertEqual(self.get('/get/Mars').status_int, 200)
+    # already rendered: no need to wait for a slot
+    web.render_slots.take()
+    self.assertEqual(self.get('/get/Mars').status_int, 200)
+    self.assertEqual(web.render_slots.turned_away, 1)
+
+  def test_stream_holds_its_slot(self):
+    saved, web.stream_above = web.stream_above, 10
+    try:
+      r = self.get('/get/Mars')
+      # still being sent (webob leaves it to us)
+      self.assertEqual(self.get('/get/Earth').status_int, 503)
+      self.assertTrue('<h1>Mars</h1>' in r.body)
+      r = self.get('/get/Earth')
+      self.assertEqual(r.status_int, 200)
+      self.assertTrue('<h1>Earth</h1>' in r.body)
+    finally:
+      web.stream_above = saved
+    self.assertEqual(web.render_slots.used, 0)
+
+  def test_wait(self):
+    slots = web.Slots(1, wait=5.0)
+    slots.take()
+    timer = threading.Timer(0.1, slots.give_back)
+    timer.start()
+    slots.take()
+    self.assertEqual((slots.used, slots.turned_away), (1, 0))
+    slots = web.Slots(1, wait=0.05)
+    slots.take()
+    self.assertRaises(web.Busy, slots.take)
+
+
+class TestDocs(unittest.TestCase):
+  def test_docs(self):
+    doctest.testmod(web)
+
+
+if __name__ == '__main__':
+    unittest.main()
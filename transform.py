@@ -9,17 +9,26 @@ It may be painful to include all implied information in the original
 data file, so instead we can use transforms to add them in later.
 """
 
+from collections import defaultdict
 from collections import namedtuple
+import functools
+import heapq
 from kb import KB
 from kb import KB_or_Dict
+from kb import Values
 from typing import List, Iterable, Dict, Set, Union, Any, Tuple, Callable, NamedTuple
 
 def addvalue(kb, page, attribute, newvalue):
   # type: (KB_or_Dict, str, str, Any) -> None
   if not kb.has_key(page): kb[page]={}
-  if not kb[page].has_key(attribute): kb[page][attribute]=[]
-  if not newvalue in kb[page][attribute]:
-    kb[page][attribute] += [newvalue]
+  values = kb[page]
+  if not values.has_key(attribute): values[attribute]=Values()
+  current = values[attribute]
+  if not newvalue in current:
+    current.append(newvalue)
+    # setting it back is how tracers (see apply_rules) see the change
+    values[attribute] = current
+    if isinstance(kb, KB): kb.note_value(page, attribute, newvalue)
 
 def addsymmetricalrelation(kb, page1, page2, attribute):
   # type: (KB_or_Dict, str, str, str) -> None
@@ -33,6 +42,16 @@ def getvalues(kb, page, attribute):
   return kb[page][attribute]
 
 
+## Selectors and rules may have a 'triggers' property: the attributes
+## the source page must have for them to pick anything. apply_rules
+## uses it to skip the pages that don't (see triggers below).
+
+def triggers(f, attributes):
+  # type: (Callable, List[str]) -> Callable
+  """Sets f.triggers to the attributes, and returns f."""
+  setattr(f, 'triggers', attributes)
+  return f
+
 ## Page selectors: given the kb and a source and target pages,
 ## return True or False.
 PageSelector = Callable[[KB_or_Dict, str, str], bool]
@@ -40,12 +59,12 @@ PageSelector = Callable[[KB_or_Dict, str, str], bool]
 def ofa(whatitmustbe):
   # type: (Any) -> PageSelector 
   """Page selector that picks sources that 'isa' the argument."""
-  return lambda kb, src, tgt: whatitmustbe in getvalues(kb, src, 'isa')
+  return triggers(lambda kb, src, tgt: whatitmustbe in getvalues(kb, src, 'isa'), ['isa'])
 
 def whoisa(whatitmustbe):
   # type: (Any) -> PageSelector
   """Page selector that picks targets that 'isa' the argument."""
-  return lambda kb, src, tgt: whatitmustbe in getvalues(kb, tgt, 'isa')
+  return triggers(lambda kb, src, tgt: whatitmustbe in getvalues(kb, tgt, 'isa'), [])
 
 ## Page rules: given the kb and a page (source).
 ## Return the list of matching pages (targets).
@@ -56,7 +75,8 @@ def the(attribute, pageselector=lambda kb, src, tgt: True):
   """a rule that returns the value of that attribute, if any.
 
   if pageselector is set then only return values for pages that match it."""
-  return lambda kb, k: [p for p in kb[k].get(attribute, []) if pageselector(kb, k, p)]
+  return triggers(lambda kb, k: [p for p in kb[k].get(attribute, []) if pageselector(kb, k, p)],
+                  [attribute] + getattr(pageselector, 'triggers', []))
 
 def chain_inner(kb, k, attributes):
   "from a page, return the set of pages obtained by following the attributes, in order."
@@ -71,12 +91,13 @@ def chain_inner(kb, k, attributes):
 def chain(attributes, pageselector=lambda kb, src, tgt: True):
   # type: (List[str], PageSelector) -> PageRule
   """a rule that returns the pages that we arrive to after following the chain."""
-  return lambda kb, k: [p for p in chain_inner(kb, k, attributes) if pageselector(kb, k, p)]
+  return triggers(lambda kb, k: [p for p in chain_inner(kb, k, attributes) if pageselector(kb, k, p)],
+                  attributes[:1] + getattr(pageselector, 'triggers', []))
 
 def hasa(attribute):
   # type: (str) -> PageRule
   """A rule that picks everyone who has that attribute."""
-  return lambda kb, k: [k] if getvalues(kb, k, attribute) else []
+  return triggers(lambda kb, k: [k] if getvalues(kb, k, attribute) else [], [attribute])
 
 ## Page actions: given the kb, a source page and the page being acted on.
 ## Returns nothing, but updates the kb.
@@ -100,14 +121,237 @@ def isalsomy(relation):
 
 Rule = namedtuple('Rule', ['pagerule', 'pageactions'])  # type: Tuple[PageRule, List[PageAction]]
 
-def apply_rules(kb, rules):
-  # type: (KB_or_Dict, List[Rule]) -> None
-  """Modify the kb by applying all the provided rules."""
+# What apply_rules(fixpoint=True) did: how many rounds it took,
+# how many times a rule was run on a page, and how many facts each rule added.
+RuleStats = namedtuple('RuleStats', ['rounds', 'evaluations', 'derived'])
+
+def apply_rules(kb, rules, fixpoint=False):
+  # type: (KB_or_Dict, List[Rule], bool) -> Union[RuleStats, None]
+  """Modify the kb by applying all the provided rules.
+
+  This makes a single pass over the pages, so facts added late in the pass
+  may not be used. With fixpoint=True we keep going until no rule adds
+  anything; after the first round, a rule only runs again on a page
+  if something it looked at on its previous run has changed since.
+  Then we return RuleStats.
+
+  Rules with triggers (like the ones made by the, chain and hasa) are only
+  tried on the pages that have those attributes.
+
+  >>> kb = {'a': {'parent': ['b']}, 'b': {'parent': ['c']}, 'c': {}}
+  >>> rules = [Rule(chain(['parent']), [imtheir('child')]),
+  ...          Rule(chain(['child', 'child']), [imtheir('grandparent')])]
+  >>> apply_rules(kb, rules, fixpoint=True)
+  RuleStats(rounds=2, evaluations=4, derived=[2, 1])
+  >>> kb['a']['grandparent']
+  ['c']
+  """
+  if fixpoint:
+    return _apply_rules_to_fixpoint(kb, rules)
+  index = _Triggers(rules)
   for src in kb.keys():
-    for rule in rules:
+    page = kb[src]
+    # the rules to try on this page, in order
+    todo = index.candidates(page)
+    if not todo: continue
+    attributes = set(page)
+    last = -1
+    while todo:
+      r = heapq.heappop(todo)
+      if r == last: continue
+      last = r
+      if index.more_needs[r] and not index.may_fire(r, page): continue
+      rule = rules[r]
       targets = rule.pagerule(kb, src)
       if not targets: continue
       for action in rule.pageactions:
         for tgt in targets:
           action(kb, src, str(tgt))
+      if len(page) != len(attributes):
+        # the page got new attributes: the rules after this one may now fire
+        for attribute in page:
+          if attribute in attributes: continue
+          attributes.add(attribute)
+          for n in index.by_attribute.get(attribute, ()):
+            if n > r: heapq.heappush(todo, n)
+  return None
+
+def _apply_rules_to_fixpoint(kb, rules):
+  # type: (KB_or_Dict, List[Rule]) -> RuleStats
+  # A job is running rule number job % len(rules) on page number job // len(rules).
+  # readers: (page, attribute) -> the jobs that looked at it.
+  # Attribute None means the page itself (whether it exists).
+  readers = defaultdict(set)  # type: Dict[Tuple[str, Any], Set[int]]
+  pages = list(kb.keys())
+  page_number = dict((p, i) for i, p in enumerate(pages))
+  derived = [0] * len(rules)
+  index = _Triggers(rules)
+  todo = set()  # type: Set[int]
+  for i, p in enumerate(pages):
+    todo.update(i * len(rules) + r for r in index.candidates(kb[p]))
+  rounds = 0
+  evaluations = 0
+  tracer = _Tracer(kb)
+  while todo:
+    rounds += 1
+    current = sorted(todo)
+    todo = set()
+    for job in current:
+      # whatever it would see by being rescheduled, it sees now
+      todo.discard(job)
+      i, r = divmod(job, len(rules))
+      src, rule = pages[i], rules[r]
+      if index.more_needs[r] and not index.may_fire(r, kb[src]):
+        # it will be scheduled again when the page gets what it's missing
+        continue
+      reads = tracer.reads = set()
+      tracer.writes = []
+      targets = rule.pagerule(tracer, src)
+      evaluations += 1
+      for read in reads:
+        readers[read].add(job)
+      if not targets: continue
+      # the actions' own lookups don't decide what the rule finds
+      tracer.reads = None
+      for action in rule.pageactions:
+        for tgt in targets:
+          action(tracer, src, str(tgt))
+      for page, attribute in tracer.writes:
+        if attribute is None:
+          if page not in page_number:
+            # a new page: the rules without triggers apply to it too
+            page_number[page] = len(pages)
+            pages.append(page)
+            todo.update(page_number[page] * len(rules) + n for n in index.always)
+        else:
+          derived[r] += 1
+          if page in page_number:
+            todo.update(page_number[page] * len(rules) + n for n in index.by_attribute.get(attribute, ()))
+        todo.update(readers.get((page, attribute), ()))
+  if sum(derived) and isinstance(kb, KB): kb.changed()
+  return RuleStats(rounds, evaluations, derived)
+
+
+class _Triggers(object):
+  """Which rules may pick something on a page, given the page's attributes."""
+  def __init__(self, rules):
+    # type: (List[Rule]) -> None
+    # rule number -> the attributes the page needs, or None if we can't tell.
+    self.needs = [getattr(rule.pagerule, 'triggers', None) or None for rule in rules]
+    # the rule numbers to try on every page
+    self.always = [r for r, needs in enumerate(self.needs) if needs is None]
+    # attribute -> the numbers of the rules that need it
+    self.by_attribute = defaultdict(list)  # type: Dict[str, List[int]]
+    # attribute -> the numbers of the rules that need it first. The first
+    # is the relation they follow, which is rarer than e.g. 'isa'.
+    self.by_first = defaultdict(list)  # type: Dict[str, List[int]]
+    for r, needs in enumerate(self.needs):
+      if not needs: continue
+      self.by_first[needs[0]].append(r)
+      for attribute in set(needs):
+        self.by_attribute[attribute].append(r)
+    # the candidates have one of the attributes they need, so only
+    # the rules that need more than one have to be checked again.
+    self.more_needs = [needs if needs and len(set(needs)) > 1 else None for needs in self.needs]
+
+  def candidates(self, page):
+    # type: (Dict[str, List[Any]]) -> List[int]
+    """The numbers of the rules worth trying on page, as a heap."""
+    ret = list(self.always)
+    for attribute in page:
+      ret.extend(self.by_first.get(attribute, ()))
+    heapq.heapify(ret)
+    return ret
+
+  def may_fire(self, r, page):
+    # type: (int, Dict[str, List[Any]]) -> bool
+    """For the rules from candidates(page): do they have all they need?"""
+    needs = self.more_needs[r]
+    return needs is None or all(attribute in page for attribute in needs)
+
+
+class _Tracer(object):
+  """Stands in for the KB while a rule runs, noting what it reads and writes.
+
+  reads and writes are (page, attribute) pairs, with the page name normalized.
+  Attribute None is for the page itself. Pages are never removed, so only
+  looking for a page that isn't there counts as reading it.
+  """
+  def __init__(self, kb):
+    # type: (KB_or_Dict) -> None
+    self.kb = kb
+    self.reads = set()  # type: Union[Set[Tuple[str, Any]], None]
+    self.writes = []  # type: List[Tuple[str, Any]]
+    # page name as asked -> its _TracedPage
+    self._traced = {}  # type: Dict[str, _TracedPage]
+    if isinstance(kb, KB):
+      self.normalize_page = kb.normalize_page  # type: Callable[[str], str]
+      # skip KB's own lookups, which would normalize the name again
+      self._page = functools.partial(dict.__getitem__, kb)  # type: Callable[[str], Any]
+      self._has_page = functools.partial(dict.has_key, kb)  # type: Callable[[str], bool]
+    else:
+      self.normalize_page = lambda page: page
+      self._page = kb.__getitem__
+      self._has_page = kb.has_key
+
+  def has_key(self, page):
+    # type: (str) -> bool
+    name = self.normalize_page(page)
+    if self._has_page(name): return True
+    if self.reads is not None: self.reads.add((name, None))
+    return False
+
+  __contains__ = has_key
+
+  def __getitem__(self, page):
+    # type: (str) -> _TracedPage
+    ret = self._traced.get(page)
+    if ret is None:
+      name = self.normalize_page(page)
+      ret = self._traced[page] = _TracedPage(self, name, self._page(name))
+    return ret
+
+  def get(self, page, default=None):
+    # type: (str, Any) -> Any
+    if not self.has_key(page): return default
+    return self[page]
+
+  def __setitem__(self, page, value):
+    # type: (str, Dict[str, List[Any]]) -> None
+    self.kb[page] = value
+    self.writes.append((self.normalize_page(page), None))
+
+
+class _TracedPage(object):
+  """One page of the KB, as seen through a _Tracer."""
+  def __init__(self, tracer, name, page):
+    # type: (_Tracer, str, Dict[str, List[Any]]) -> None
+    self._tracer = tracer
+    self._name = name
+    self._page = page
+
+  def has_key(self, attribute):
+    # type: (str) -> bool
+    reads = self._tracer.reads
+    if reads is not None: reads.add((self._name, attribute))
+    return attribute in self._page
+
+  __contains__ = has_key
+
+  def __getitem__(self, attribute):
+    # type: (str) -> List[Any]
+    reads = self._tracer.reads
+    if reads is not None: reads.add((self._name, attribute))
+    return self._page[attribute]
+
+  def get(self, attribute, default=None):
+    # type: (str, Any) -> Any
+    reads = self._tracer.reads
+    if reads is not None: reads.add((self._name, attribute))
+    return self._page.get(attribute, default)
 
+  def __setitem__(self, attribute, value):
+    # type: (str, List[Any]) -> None
+    self._page[attribute] = value
+    # an empty list adds no fact
+    if value: self._tracer.writes.append((self._name, attribute))
@@ -0,0 +1,145 @@
+"""Keeps the pages and KB up to date as the notes files change.
+
+Only the files that changed are read again, and only the [title] sections
+whose text changed are parsed again; the others keep their parsed tree
+and their facts from before.
+
+Example:
+
+  notes = watch.Notes(['planets.txt'], fixup=people.fixup)
+  pages, kb = notes.state
+  ...  # edit planets.txt
+  notes.reload()
+  pages, kb = notes.state
+
+Each reload builds a new (pages, kb) and then replaces notes.state in one
+assignment, so readers that took the state before keep a consistent pair.
+"""
+
+import codecs
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import interpret
+import kb
+import parse
+import split
+from kb import KB
+
+# What a [title] section contributes: its parsed text, and its facts.
+Section = namedtuple('Section', ['title', 'text', 'tree', 'facts'])
+
+ReloadStats = namedtuple('ReloadStats', ['files', 'sections', 'parsed'])
+
+
+class Notes(object):
+  """The pages and KB read from fnames, reloaded on demand.
+
+  state is the (pages, kb) pair, same as what interpret.files returns;
+  fixup, if set, is called on each new KB before it's published
+  (e.g. people.fixup).
+  """
+
+  def __init__(self, fnames, fixup=None):
+    # type: (List[str], Optional[Callable[[KB], None]]) -> None
+    self.fnames = list(fnames)
+    self.fixup = fixup
+    self.state = ({}, KB({}))  # type: Tuple[Dict[str, interpret.InfoToken], KB]
+    # file name -> its _stamp when we last read it
+    self._stamps = {}  # type: Dict[str, Optional[Tuple[float, int]]]
+    # file name -> its sections, in file order
+    self._sections = {}  # type: Dict[str, List[Section]]
+    self._lock = threading.Lock()
+    self.reload()
+
+  def changed_files(self):
+    # type: () -> List[str]
+    """The files that were modified since we last read them."""
+    return [f for f in self.fnames if self._stamps.get(f) != _stamp(f)]
+
+  def reload(self):
+    # type: () -> ReloadStats
+    """Reads the changed files and publishes the new state, if anything changed."""
+    with self._lock:
+      changed = self.changed_files()
+      if not changed:
+        return ReloadStats(0, 0, 0)
+      parsed = 0
+      for fname in changed:
+        print("Loading %s" % fname)
+        stamp = _stamp(fname)
+        old = dict(((s.title, s.text), s) for s in self._sections.get(fname, []))
+        sections = []
+        try:
+          with codecs.open(fname, encoding='utf-8') as f:
+            for (title, lines) in split.strings(f):  # type: ignore
+              text = u''.join(lines)
+              section = old.get((title, text))
+              if section is None:
+                tree = parse.strings(lines)
+                facts = interpret.section_kb(title, interpret.info(tree, page=title))
+                section = Section(title, text, tree, facts)
+                parsed += 1
+              sections.append(section)
+        except (IOError, OSError):
+          if _stamp(fname) is not None:
+            raise
+          # deleted or renamed: its pages go, the other files still count
+          print("%s is gone" % fname)
+          sections, stamp = [], None
+        self._sections[fname] = sections
+        self._stamps[fname] = stamp
+      self.state = self._build()
+      return ReloadStats(len(changed), len(self.state[0]), parsed)
+
+  def _build(self):
+    # type: () -> Tuple[Dict[str, interpret.InfoToken], KB]
+    """New pages and KB from the sections we have."""
+    pages = {}
+    big_kb = {}  # type: kb.KBDict
+    context = interpret.Context({})
+    for fname in self.fnames:
+      for s in self._sections.get(fname, []):
+        pages[s.title] = interpret.info(s.tree, page=s.title, context=context)
+        kb.merge_into(big_kb, s.facts)
+    final = KB(big_kb)
+    if self.fixup:
+      self.fixup(final)
+    context.big_kb = final
+    return (pages, final)
+
+  def watch(self, interval=1.0, on_reload=None):
+    # type: (float, Optional[Callable[[], None]]) -> threading.Thread
+    """Starts a background thread that reloads every interval seconds.
+
+    on_reload, if set, is called in that thread after each reload that
+    changed the state (e.g. to reindex it).
+    """
+    def loop():
+      while True:
+        time.sleep(interval)
+        try:
+          stats = self.reload()
+          if stats.files:
+            print('Reloaded %d file(s), parsed %d of %d sections' % stats)
+            if on_reload:
+              on_reload()
+        except (IOError, OSError) as e:
+          # e.g. the editor is in the middle of saving; try again next time.
+          print('Reload failed: %s' % e)
+    t = threading.Thread(target=loop, name='watch')
+    t.daemon = True
+    t.start()
+    return t
+
+
+def _stamp(fname):
+  # type: (str) -> Optional[Tuple[float, int]]
+  try:
+    st = os.stat(fname)
+  except OSError:
+    return None
+  return (st.st_mtime, st.st_size)
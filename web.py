@@ -6,11 +6,27 @@ Example:
 
 pyhon web.py samples/table.txt
 
+Use -j 8 to load the files with 8 processes, and --snapshot notes.snapshot
+to save what was loaded so the next start is faster (as long as the files
+haven't changed). Use --watch to pick up changes to the files while serving.
+
 Currently serving:
 
 / : index
 /get/ : list of pages
 /get/page_name : shows the specified page
+/search?q=words : the pages that best match the words (see search.py)
+/stats : how well the cache of rendered pages is doing
+
+Rendered pages are kept (see --render-cache) until the files are reloaded,
+and sent with an ETag and Last-Modified so browsers can ask if they changed.
+Pages too big to keep (see --stream-above) are sent as they're rendered.
+
+Requests are handled by a pool of --threads threads, but at most --renders
+pages are rendered at a time: a page that isn't in the cache waits up to
+--render-wait seconds for its turn, then gets a 503 with a Retry-After.
+So a few slow pages can't hold up the ones already rendered, and a burst
+is turned away instead of piling up. loadtest.py measures how that holds up.
 """
 import webapp2
 import interpret
@@ -21,14 +37,25 @@ from paste.cascade import Cascade
 from markupsafe import Markup
 import sys
 import os
+import argparse
+import hashlib
+import itertools
+import time
+from collections import namedtuple
 from kb import unlist
+import lru
 import people
+import search
+import snapshot
+import threading
+import watch
 
 
 
 class Hello(webapp2.RequestHandler):
     def get(self):
         self.response.write('<br/><a href="get/">List of pages</a>')
+        self.response.write('<form action="search"><input name="q"> <input type="submit" value="Search"></form>')
 
 
 class Static(webapp2.RequestHandler):
@@ -44,69 +71,345 @@ class Static(webapp2.RequestHandler):
 # Load the data
 pages=None
 kb=None
+# set instead of pages and kb when watching the files
+notes=None
+# full-text index of the pages, and the (pages, kb) it was last updated from
+search_index=search.Index()
+indexed=None
+# one update_search at a time
+search_lock=threading.Lock()
 
+# Rendered pages: (generation, kb version, page name) -> Rendered.
+# The generation numbers the (pages, kb) we serve (see serving).
+Rendered = namedtuple('Rendered', ['html', 'etag'])
+rendered=lru.LRU(maxsize=1000)
+render_lock=threading.Lock()
+# how many pages we rendered, and how long it took in all
+render_count=0
+render_seconds=0.0
+# what serving() returns, and the kb version it was for
+served=None
+# Pages whose html is longer than this (in characters) aren't kept in
+# rendered: they're sent as they're made, without an ETag.
+stream_above=1<<18
 
-def load(fnames):
-    global pages
-    global kb
-    pages,kb=interpret.files(fnames)
+
+def build(fnames, processes=1):
+    pages,kb=interpret.files(fnames, processes)
     # apply "people" rules
     people.fixup(kb)
+    return pages,kb
+
+
+def load(fnames, processes=1, snapshot_file=None):
+    global pages
+    global kb
+    if snapshot_file:
+        pages,kb=snapshot.load_or_build(snapshot_file, fnames, lambda: build(fnames, processes))
+    else:
+        pages,kb=build(fnames, processes)
+    update_search()
+
+
+def load_and_watch(fnames, interval=1.0):
+    global notes
+    notes = watch.Notes(fnames, fixup=people.fixup)
+    update_search()
+    # reindex in the watch thread, so searches never wait for it
+    notes.watch(interval, on_reload=update_search)
+
+
+def current():
+    """(pages, kb) to serve from. Take them together so a reload can't mix them."""
+    if notes:
+        return notes.state
+    return pages, kb
 
 
-def linkify(word):
+def update_search():
+    """Brings search_index up to date with current(); only changed pages are redone.
+
+    Called before serving, and from the watch thread after each reload.
+    """
+    global indexed
+    with search_lock:
+        state = current()
+        if indexed is None or indexed[0] is not state[0] or indexed[1] is not state[1]:
+            search_index.update(*state)
+            indexed = state
+
+
+def serving():
+    """(pages, kb, generation, since): current(), the number of that (pages, kb),
+    and the time we started serving it as it is now, kb version included (in
+    whole seconds, like HTTP dates)."""
+    global served
+    pages, kb = current()
+    with render_lock:
+        if served is None or served[0][0] is not pages or served[0][1] is not kb or served[1] != kb.version:
+            generation = served[0][2] + 1 if served else 0
+            since = int(time.time())
+            if served:
+                # a change within the same second must still look newer
+                since = max(since, served[0][3] + 1)
+            served = ((pages, kb, generation, since), kb.version)
+        return served[0]
+
+
+def linkify(word, pages, kb):
     if word in pages or word in kb:
         return Markup('<a href="{0}">{0}</a>\n').format(word)
     return word
 
+
+def render(page, pages, kb):
+    """The html for /get/page: the page, or the index if there's no such page."""
+    return u''.join(render_parts(page, pages, kb))
+
+
+def render_parts(page, pages, kb):
+    """render(), in pieces, made as they're asked for (see InfoToken.html_parts)."""
+    key = kb.normalize_page(page)
+    if key and key in pages or page in kb:
+        yield Markup('<h1>{0}</h1>\n').format(page)
+        boom = None
+        if key in pages: 
+            boom=pages[key]
+            # an attempt to make sure images don't bring in a scrollbar... doesn't work though.
+            yield '<div width="100%">\n'
+            for part in boom.html_parts():
+                yield part
+            yield '</div>\n'
+        ks = set(kb.get(page, {}).keys())
+        if boom: ks -= set(boom.kb().keys())
+        if ks:
+            yield '<ul>\n'
+            for k in ks:
+                yield Markup('<li>{0}: ').format(k)
+                #for kx in kb[page][k]:
+                #    yield linkify(str(kx), pages, kb) + ' '
+                yield ', '.join(linkify(str(kx), pages, kb) for kx in kb[page][k])
+                yield Markup('</li>\n')
+
+            yield '</ul>\n'
+    else:
+        # show an index
+        yield '<ul>\n'
+        for k in sorted(pages.keys(), key=lambda f: f.upper()):
+            yield Markup('<li><a href="{0}">{0}</a></li>\n').format(k)
+        yield '</ul>\n'
+
+
+def cached_render(page, pages, kb, generation):
+    """render(page, pages, kb) as a Rendered, from the cache if we can.
+
+    For a page longer than stream_above, the Rendered has no etag and its
+    html is a Closing of the pieces, the rest of which are made as it goes.
+    Raises Busy if it has to render and render_slots has no room.
+    """
+    key = (generation, kb.version, page)
+    with render_lock:
+        ret = rendered.get(key)
+    if ret is None:
+        render_slots.take()
+        start = time.time()
+        streaming = False
+        try:
+            parts = render_parts(page, pages, kb)
+            done, size = [], 0
+            for part in parts:
+                done.append(part)
+                size += len(part)
+                if size > stream_above:
+                    # the rest of the render (and its slot) goes with the response
+                    streaming = True
+                    return Rendered(Closing(itertools.chain(done, parts), lambda: _rendered(start)), None)
+            html = u''.join(done)
+        finally:
+            if not streaming:
+                _rendered(start)
+        ret = Rendered(html, hashlib.sha1(html.encode('utf-8')).hexdigest())
+        with render_lock:
+            rendered[key] = ret
+    return ret
+
+
+def _rendered(start):
+    """A render that started at start is over: count it, and free its slot."""
+    global render_count, render_seconds
+    with render_lock:
+        render_count += 1
+        render_seconds += time.time() - start
+    render_slots.give_back()
+
+
+class Busy(Exception):
+    """Raised when there's no room to do something in time."""
+
+
+class Slots(object):
+    """At most limit things at a time: take() waits up to wait seconds for
+    room, else raises Busy. Give each slot back with give_back()."""
+
+    def __init__(self, limit, wait=0.0):
+        self.limit = limit
+        self.wait = wait
+        self.used = 0
+        # how many times take() raised Busy
+        self.turned_away = 0
+        self._changed = threading.Condition()
+
+    def take(self):
+        deadline = time.time() + self.wait
+        with self._changed:
+            while self.used >= self.limit:
+                left = deadline - time.time()
+                if left <= 0:
+                    self.turned_away += 1
+                    raise Busy()
+                self._changed.wait(left)
+            self.used += 1
+
+    def give_back(self):
+        with self._changed:
+            self.used -= 1
+            self._changed.notify()
+
+
+class Closing(object):
+    """An iterable of parts that calls done once: when they've all been
+    gone through, or when it's closed (as WSGI servers do with responses)."""
+
+    def __init__(self, parts, done):
+        self.parts = parts
+        self._done = done
+
+    def __iter__(self):
+        for part in self.parts:
+            yield part
+        self.close()
+
+    def close(self):
+        done, self._done = self._done, None
+        try:
+            if hasattr(self.parts, 'close'):
+                self.parts.close()
+        finally:
+            if done:
+                done()
+
+
+# How many pages we render at a time (see --renders and --render-wait).
+render_slots = Slots(4, wait=5.0)
+
+
 class Get(webapp2.RequestHandler):
     def get(self, page=None):
-        key = kb.normalize_page(page)
-        if key and key in pages or page in kb:
-            self.response.write(Markup('<h1>{0}</h1>\n').format(page))
-            boom = None
-            if key in pages: 
-                boom=pages[key]
-                # an attempt to make sure images don't bring in a scrollbar... doesn't work though.
-                self.response.write('<div width="100%">\n')
-                self.response.write(boom.html())
-                self.response.write('</div>\n')
-            ks = set(kb.get(page, {}).keys())
-            if boom: ks -= set(boom.kb().keys())
-            if ks:
-                self.response.write('<ul>\n')
-                for k in ks:
-                    self.response.write(Markup('<li>{0}: ').format(k))
-                    #for kx in kb[page][k]:
-                    #    self.response.write(linkify(str(kx)) + ' ')
-                    self.response.write(', '.join(linkify(str(kx)) for kx in kb[page][k]))
-                    self.response.write(Markup('</li>\n'))
-
-                self.response.write('</ul>\n')
-        else:
-            # show an index
-            self.response.write('<ul>\n')
-            for k in sorted(pages.keys(), key=lambda f: f.upper()):
-                self.response.write(Markup('<li><a href="{0}">{0}</a></li>\n').format(k))
-            self.response.write('</ul>\n')
+        pages, kb, generation, since = serving()
+        request, response = self.request, self.response
+        response.last_modified = since
+        since_then = request.if_modified_since
+        if not request.if_none_match and since_then and since_then >= response.last_modified:
+            # nothing changed since they got it, no need to render
+            response.status = 304
+            return
+        try:
+            found = cached_render(page, pages, kb, generation)
+        except Busy:
+            response.status = 503
+            response.headers['Retry-After'] = '1'
+            response.write('Too busy, try again in a moment.\n')
+            return
+        if found.etag is None:
+            # too big to keep: send it as it's made
+            response.app_iter = Closing((part.encode('utf-8') for part in found.html), found.html.close)
+            return
+        response.etag = found.etag
+        if found.etag in request.if_none_match:
+            response.status = 304
+            return
+        response.write(found.html)
 
 
-def main():
-    if len(sys.argv)<2:
-        print 'Usage:'
-        print 'python web.py <file names>'
-        return
-    fname = sys.argv[1]
-    load(sys.argv[1:])
+class Stats(webapp2.RequestHandler):
+    def get(self):
+        self.response.headers['Content-type'] = 'text/plain'
+        with render_lock:
+            info = rendered.info()
+            count, seconds = render_count, render_seconds
+        asked = info.hits + info.misses
+        self.response.write('rendered pages cache: %s\n' % (info,))
+        self.response.write('hit ratio: %.1f%%\n' % (100.0 * info.hits / asked if asked else 0))
+        self.response.write('renders: %d, %.2f ms on average\n' % (count, 1e3 * seconds / count if count else 0))
+        self.response.write('turned away (503): %d, rendering %d at a time\n' % (render_slots.turned_away, render_slots.limit))
+
+
+class Search(webapp2.RequestHandler):
+    def get(self):
+        query = self.request.get('q')
+        found = search_index.search(query, limit=50)
+        self.response.write(Markup('<form><input name="q" value="{0}"> <input type="submit" value="Search"></form>\n').format(query))
+        self.response.write('<ul>\n')
+        for page, score in found:
+            self.response.write(Markup('<li><a href="get/{0}">{0}</a></li>\n').format(page))
+        self.response.write('</ul>\n')
+
+
+def make_app():
+    """The WSGI app for the pages, and the static/ files."""
     app = webapp2.WSGIApplication([
         ('/', Hello),
         ('/get/(.*)', Get),
+        ('/search', Search),
+        ('/stats', Stats),
         #('/static/web.css', Static)
     ], debug=True)
     static_media_server = StaticURLParser("static/")
-    app = Cascade([static_media_server, app])
-    httpserver.serve(app, host='127.0.0.1', port='8080')
+    return Cascade([static_media_server, app])
+
 
+def serve(app, host='127.0.0.1', port=8080, threads=16, backlog=64, start_loop=True):
+    """Serves app with a pool of threads; backlog is how many connections
+    may wait to be accepted. Without start_loop, returns the server."""
+    return httpserver.serve(app, host=host, port=port, start_loop=start_loop,
+                            use_threadpool=True, threadpool_workers=threads,
+                            # Paste's default, which can't be more than the threads
+                            threadpool_options={'spawn_if_under': min(5, threads)},
+                            request_queue_size=backlog)
+
+
+def main():
+    global stream_above, render_slots
+    parser = argparse.ArgumentParser(description='Serve the pages described in the files.')
+    parser.add_argument('files', nargs='+', metavar='file')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of processes to load the files with')
+    parser.add_argument('--snapshot', metavar='FILE',
+                        help='reuse (or save) the loaded pages in this file')
+    parser.add_argument('--watch', action='store_true',
+                        help='reload the files when they change (ignores -j and --snapshot)')
+    parser.add_argument('--render-cache', type=int, default=1000, metavar='PAGES',
+                        help='how many rendered pages to keep')
+    parser.add_argument('--stream-above', type=int, default=stream_above, metavar='CHARS',
+                        help="send pages longer than this as they're rendered, without keeping them")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--threads', type=int, default=16,
+                        help='number of threads handling requests')
+    parser.add_argument('--backlog', type=int, default=64, metavar='CONNECTIONS',
+                        help='how many connections may wait to be accepted')
+    parser.add_argument('--renders', type=int, default=render_slots.limit, metavar='PAGES',
+                        help='how many pages to render at a time')
+    parser.add_argument('--render-wait', type=float, default=render_slots.wait, metavar='SECONDS',
+                        help='how long a page waits for its turn to be rendered before a 503')
+    args = parser.parse_args()
+    stream_above = args.stream_above
+    render_slots = Slots(args.renders, args.render_wait)
+    rendered.resize(args.render_cache)
+    if args.watch:
+        load_and_watch(args.files)
+    else:
+        load(args.files, args.jobs, args.snapshot)
+    serve(make_app(), port=args.port, threads=args.threads, backlog=args.backlog)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file